@@ -0,0 +1,23 @@
+"""
+app.py
+FastAPI service for the ECM identification API.
+
+run with: uvicorn App.API.app:app --host 0.0.0.0 --port 8083
+"""
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from App.utils.metrics import metrics
+from App.API.ekf import router as ekf_router
+from App.API.tables import router as tables_router
+
+app = FastAPI(title="Battery ECM Identification API")
+app.include_router(ekf_router)
+app.include_router(tables_router)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus scrape endpoint with the stage timers and counters recorded by this process.
+    """
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
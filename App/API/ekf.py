@@ -0,0 +1,115 @@
+"""
+ekf.py
+endpoints running EKFStateEstimator sessions on sample batches.
+
+A session holds the filter state of a group of cells in this process. Clients create it once from the
+(battery_label, cycle) LUTs in MongoDB and then post batches of samples for all its cells. At most
+EKF_MAX_SESSIONS sessions are kept, the least recently used one is dropped to make room for a new one, and a
+session unused for EKF_SESSION_TTL seconds expires.
+"""
+import os
+import time
+import threading
+import uuid
+from typing import List, Optional, Union
+import numpy as np
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from App.Service.EKFStateEstimator import EKFStateEstimator
+from App.utils.cache import LRUCache
+
+router = APIRouter(prefix="/ekf", tags=["ekf"])
+
+# session id -> [estimator, lock, last used]. Each session is advanced by one request at a time.
+sessions = LRUCache(max_entries=int(os.environ.get("EKF_MAX_SESSIONS", "256")))
+SESSION_TTL = float(os.environ.get("EKF_SESSION_TTL", "3600"))
+
+
+class Cell(BaseModel):
+    battery_label: str
+    cycle: int
+
+
+class SessionRequest(BaseModel):
+    cells: List[Cell]
+    initial_soc: Union[float, List[float]] = 1.0
+    cell_capacity: Union[float, List[float]] = 4.85
+    measurement_noise: float = 1e-4
+
+
+class SampleBatch(BaseModel):
+    current: List[List[float]]  # (cells, samples), discharge positive
+    voltage: List[List[Optional[float]]]  # (cells, samples), null for a missing sample
+    dt: float = Field(1.0, gt=0, allow_inf_nan=False)  # seconds between samples
+    trajectory: bool = False
+
+
+def get_session(session_id):
+    session = sessions.get(session_id)
+    now = time.monotonic()
+    if session is not None and now - session[2] > SESSION_TTL:
+        sessions.pop(session_id)
+        session = None
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found or expired")
+    session[2] = now
+    return session[0], session[1]
+
+
+@router.post("/sessions")
+def create_session(request: SessionRequest):
+    """
+    Create an estimator for a group of cells from their LUTs in MongoDB.
+    """
+    try:
+        estimator = EKFStateEstimator.from_mongo(
+            [(cell.battery_label, cell.cycle) for cell in request.cells],
+            initial_soc=request.initial_soc,
+            cell_capacity=request.cell_capacity,
+            measurement_noise=request.measurement_noise,
+        )
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    session_id = uuid.uuid4().hex
+    sessions.put(session_id, [estimator, threading.Lock(), time.monotonic()])
+    return {"session_id": session_id, "cells": estimator.n_cells, **estimator.state()}
+
+
+@router.post("/sessions/{session_id}/samples")
+def ingest_samples(session_id: str, batch: SampleBatch):
+    """
+    Advance every cell of the session by a batch of samples.
+    """
+    estimator, lock = get_session(session_id)
+
+    try:
+        current = np.asarray(batch.current, dtype=float)
+        voltage = np.asarray(batch.voltage, dtype=float)  # None becomes NaN
+    except ValueError:
+        current = voltage = None  # ragged rows
+    if current is None or current.shape != voltage.shape or current.ndim != 2 or current.shape[0] != estimator.n_cells:
+        raise HTTPException(status_code=400,
+                            detail=f"current and voltage must both be ({estimator.n_cells}, samples) arrays")
+
+    with lock:
+        soc = estimator.run(current, voltage, dt=batch.dt)
+        response = estimator.state()
+
+    if batch.trajectory:
+        response["soc_trajectory"] = soc.tolist()
+    return response
+
+
+@router.get("/sessions/{session_id}")
+def get_state(session_id: str):
+    estimator, lock = get_session(session_id)
+    with lock:
+        return estimator.state()
+
+
+@router.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if sessions.pop(session_id) is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return {"deleted": session_id}
@@ -0,0 +1,161 @@
+"""
+tables.py
+cached read endpoints for LUTs, SoC-OCV tables and pulse data.
+
+Serialised payloads are kept in an in-process LRU cache together with the version they were built from:
+the content hash stored with each MongoDB LUT document, or the size and mtime of a CSV file. A request
+only checks the version (a projected find_one or a stat call) before serving the cached bytes, and LUT
+writes made by this process drop their entries straight away. Every response carries an ETag, so clients
+sending If-None-Match get a 304 without a body while the table is unchanged.
+
+format=json (default), arrow (Arrow IPC stream, needs pyarrow) or npy (NumPy structured array of the
+numeric columns, read with np.load(io.BytesIO(body))).
+"""
+import io
+import os
+import json
+from typing import Literal
+import pandas as pd
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from App.Service.Mongo import get_collection, on_write, content_version
+from App.utils.cache import LRUCache
+from App.utils.data_loader import soc_ocv_file, hppc_pulse_file
+from App.utils.metrics import metrics
+
+router = APIRouter(tags=["tables"])
+
+cache = LRUCache(max_entries=int(os.environ.get("TABLE_CACHE_ENTRIES", "512")))
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "npy": "application/octet-stream",
+}
+FORMAT_QUERY = Query("json", alias="format", pattern="^(json|arrow|npy)$")
+
+# collections insert_csv_to_mongodb() writes LUTs to, the only ones the API reads
+LutCollection = Literal["ECM_LUT", "ECM_LUT_Joint"]
+
+
+@on_write
+def invalidate_lut(collection_name, battery_label, cycle):
+    cache.invalidate(lambda key: key[:4] == ("lut", collection_name, battery_label, cycle))
+
+
+def serialise(df, fmt, metadata):
+    """
+    :param df: Table to send
+    :param fmt: json, arrow or npy
+    :param metadata: Fields sent next to the rows in JSON and as schema metadata in Arrow
+    :return: Payload bytes
+    """
+    if fmt == "json":
+        # to_json writes NaN as null, json.dumps would not
+        return json.dumps({**metadata, "data": json.loads(df.to_json(orient="records"))}).encode()
+
+    if fmt == "arrow":
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise HTTPException(status_code=406, detail="Arrow responses need pyarrow installed on the server")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({key: str(value) for key, value in metadata.items()})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    buffer = io.BytesIO()
+    np.save(buffer, df.select_dtypes(include="number").to_records(index=False), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def etag_matches(if_none_match, etag):
+    """
+    If-None-Match evaluation of RFC 9110 section 13.1.2: "*" matches any current representation, and entity
+    tags are compared weakly, ignoring a W/ prefix on either side.
+    """
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+
+
+def cached_response(request, key, version, fmt, build):
+    """
+    Serve a payload from the cache, building it when the cached one is missing or older than version.
+
+    :param build: Function returning (DataFrame, metadata) for the current version
+    """
+    entry = cache.get(key)
+    if entry is None or entry[0] != version:
+        metrics.increment("table_cache_misses", kind=key[0])
+        df, metadata = build()
+        entry = (version, f'"{version}-{fmt}"', serialise(df, fmt, metadata))
+        cache.put(key, entry)
+    else:
+        metrics.increment("table_cache_hits", kind=key[0])
+
+    _, etag, content = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+def file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"{os.path.basename(path)} not found")
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+@router.get("/luts/{battery_label}/{cycle}")
+def get_lut(request: Request, battery_label: str, cycle: int, collection: LutCollection = "ECM_LUT", fmt: str = FORMAT_QUERY):
+    """
+    ECM LUT of a battery label and cycle, as stored by insert_csv_to_mongodb().
+    """
+    query = {"battery_label": battery_label, "cycle": cycle}
+    header = get_collection(collection).find_one(query, {"version": 1})
+    if header is None:
+        raise HTTPException(status_code=404, detail=f"No LUT found for battery {battery_label}, cycle {cycle}")
+
+    document = None
+    version = header.get("version")
+    if version is None:
+        # written before LUT versions were stored, hash the data instead
+        document = get_collection(collection).find_one(query)
+        version = content_version(document["data"])
+
+    def build():
+        lut = document or get_collection(collection).find_one(query)
+        return pd.DataFrame(lut["data"]), {"battery_label": battery_label, "cycle": cycle, "version": version}
+
+    return cached_response(request, ("lut", collection, battery_label, cycle, fmt), version, fmt, build)
+
+
+@router.get("/soc-ocv/{battery_label}")
+def get_soc_ocv(request: Request, battery_label: str, fmt: str = FORMAT_QUERY):
+    """
+    SoC-OCV table written by the capacity test.
+    """
+    path = soc_ocv_file(battery_label)
+
+    def build():
+        return pd.read_csv(path), {"battery_label": battery_label}
+
+    return cached_response(request, ("soc_ocv", battery_label, fmt), file_version(path), fmt, build)
+
+
+@router.get("/pulses/{battery_label}/{cycle}/{pulse_number}")
+def get_pulse(request: Request, battery_label: str, cycle: int, pulse_number: int, fmt: str = FORMAT_QUERY):
+    """
+    HPPC pulse data written by HPPCTest.save_to_csv().
+    """
+    path = hppc_pulse_file(battery_label, cycle, pulse_number)
+
+    def build():
+        metadata = {"battery_label": battery_label, "cycle": cycle, "pulse_number": pulse_number}
+        return pd.read_csv(path, index_col=None, na_values=["NA"]), metadata
+
+    return cached_response(request, ("pulse", battery_label, cycle, pulse_number, fmt), file_version(path), fmt, build)
@@ -2,8 +2,9 @@ import csv
 import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from App.utils.data_loader import load_LGM50_data
+from App.utils.data_loader import load_LGM50_data, soc_ocv_file
+from App.utils.plotting import render, decimate
+from App.utils.metrics import metrics
 
 class CapacityTest:
     def __init__(self, battery_label):
@@ -64,7 +65,8 @@ class CapacityTest:
             SOC_flat_scaled = SOC_flat / 100  # Normalize SOC to the range [0, 1]
 
             # Fit polynomial to the scaled SOC and OCV
-            coeffs = np.polyfit(SOC_flat_scaled, OCV_flat, degree)  # Use the degree from class
+            with metrics.timer("fit_soc_ocv_polynomial", battery_label=self.battery_label, degree=degree):
+                coeffs = np.polyfit(SOC_flat_scaled, OCV_flat, degree)  # Use the degree from class
             poly_fit = np.poly1d(coeffs)
 
             # Generate the fitted and smoothed  SOC values for plotting the fit curve
@@ -78,52 +80,39 @@ class CapacityTest:
 
             return self.results_data
 
-    def plot_capacity_test(self):
-        plt.figure(figsize=(10, 6))
-        for i in range(len(self.SOC)):
-            plt.plot(self.SOC[i], self.OCV[i], label=f"Cycle {i+1}")
+    def plot_capacity_test(self, max_points=2000):
+        """
+        Plots OCV vs SOC for every cycle of the capacity test.
+
+        :param max_points: Maximum number of points drawn per cycle
+        """
+        SOC, OCV = [], []
+        for soc_cycle, ocv_cycle in zip(self.SOC, self.OCV):
+            soc_cycle, ocv_cycle = decimate(soc_cycle, ocv_cycle, max_points)
+            SOC.append(soc_cycle)
+            OCV.append(ocv_cycle)
 
-        plt.xlabel("State of Charge (SOC, %)")
-        plt.ylabel("Open Circuit Voltage (OCV, V)")
-        plt.title(f"OCV vs SOC for All Cycles - Battery {self.battery_label}")
-        plt.legend()
-        plt.grid(True)
-        plt.show()
+        return render(draw_capacity_test, f"{self.battery_label}/{self.battery_label}_capacity_test",
+                      SOC=SOC, OCV=OCV, battery_label=self.battery_label)
 
-    def plot_ocv_soc_fitting(self):
+    def plot_ocv_soc_fitting(self, max_points=2000):
         """
         Plots the polynomial fitting results for SOC vs OCV for the capacity test
+
+        :param max_points: Maximum number of measured points drawn
         """
         if self.results_data is None:
             raise ValueError("No fitting has been run. Call fit_soc_ocv_polynomial()")
 
-        SOC_Fitted = self.results_data["SOC_Fitted"]
-        OCV_Fitted = self.results_data["OCV_Fitted"]
-
-        plt.figure(figsize=(10, 6))
-
+        SOC_measured, OCV_measured = None, None
         if self.cap is not None:  # Capacity test - Plot SOC vs OCV
-            # Concatenate the original data
-            SOC_flat = np.concatenate(self.SOC)
-            OCV_flat = np.concatenate(self.OCV)
-
-            # Scale SOC to the 0-1 range
-            SOC_flat_scaled = SOC_flat / 100  # Normalize SOC to the range [0, 1]
-
-            # Plot the original data as a scatter plot
-            plt.scatter(SOC_flat_scaled, OCV_flat, label="Measured Data", color='blue', alpha=0.6)
+            # Concatenate the original data and scale SOC to the 0-1 range
+            SOC_measured, OCV_measured = decimate(np.concatenate(self.SOC) / 100, np.concatenate(self.OCV), max_points)
 
-            # Plot the fitted polynomial curve
-        plt.plot(SOC_Fitted, OCV_Fitted, label=f"Fitted Polynomial (Degree {self.degree})", color='red', linewidth=2)
-
-        plt.xlabel("State of Charge (SOC, %) ")
-        plt.ylabel("Open Circuit Voltage (OCV, V) ")
-        plt.title(f"OCV vs SOC - Battery {self.battery_label}")
-
-        # Final plot adjustments
-        plt.legend()
-        plt.grid(True)
-        plt.show()
+        return render(draw_ocv_soc_fitting, f"{self.battery_label}/{self.battery_label}_ocv_soc_fitting",
+                      SOC_Fitted=self.results_data["SOC_Fitted"], OCV_Fitted=self.results_data["OCV_Fitted"],
+                      SOC_measured=SOC_measured, OCV_measured=OCV_measured,
+                      degree=self.degree, battery_label=self.battery_label)
 
     def save_to_csv(self, output_path=None):
         """
@@ -144,19 +133,53 @@ class CapacityTest:
             'OCV': OCV_Fitted,
         })
 
-         # Default directory if no output path provided
-        if output_path is None:
-            output_path = os.path.join("Data", "Output", "LGM50", "Capacity_Test", self.battery_label)
+        # Default location if no output path provided
+        full_path = soc_ocv_file(self.battery_label)
+        if output_path is not None:
+            full_path = os.path.join(output_path, os.path.basename(full_path))
 
-        # Ensure output_path is a directory
-        if not os.path.isdir(output_path):
-            os.makedirs(output_path, exist_ok=True)
-
-        file_name = f"{self.battery_label}_soc_ocv.csv"
-        full_path = os.path.join(output_path, file_name)
+        # Ensure the directory exists
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
 
         # Save DataFrame to CSV
         df.to_csv(full_path, index=False)
         print(f"Pulse data saved to: {full_path}")
 
         return full_path
+
+
+def draw_capacity_test(SOC, OCV, battery_label):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 6))
+    for i in range(len(SOC)):
+        plt.plot(SOC[i], OCV[i], label=f"Cycle {i+1}")
+
+    plt.xlabel("State of Charge (SOC, %)")
+    plt.ylabel("Open Circuit Voltage (OCV, V)")
+    plt.title(f"OCV vs SOC for All Cycles - Battery {battery_label}")
+    plt.legend()
+    plt.grid(True)
+    return fig
+
+
+def draw_ocv_soc_fitting(SOC_Fitted, OCV_Fitted, SOC_measured, OCV_measured, degree, battery_label):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 6))
+
+    # Plot the original data as a scatter plot
+    if SOC_measured is not None:
+        plt.scatter(SOC_measured, OCV_measured, label="Measured Data", color='blue', alpha=0.6)
+
+    # Plot the fitted polynomial curve
+    plt.plot(SOC_Fitted, OCV_Fitted, label=f"Fitted Polynomial (Degree {degree})", color='red', linewidth=2)
+
+    plt.xlabel("State of Charge (SOC, %) ")
+    plt.ylabel("Open Circuit Voltage (OCV, V) ")
+    plt.title(f"OCV vs SOC - Battery {battery_label}")
+
+    # Final plot adjustments
+    plt.legend()
+    plt.grid(True)
+    return fig
@@ -0,0 +1,205 @@
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+from App.Service.Mongo import insert_csv_to_mongodb
+from App.Service.ECMTheveninParameterizer import pulse_lut_entry
+from App.utils.data_loader import load_soc_ocv_data, load_hppc_pulse_data, hppc_pulse_numbers
+from App.utils.thevenin import simulate_thevenin
+from App.utils.resampling import resample_pulse
+from App.utils.metrics import metrics
+
+# Same starting point as the priors used by ECMTheveninParameterizer.setup_problem() in Main.py
+INITIAL_GUESS = {"r0": 0.005, "r1": 0.005, "c1": 1000.0, "r2": 0.005, "c2": 10000.0}
+
+
+class ECMJointParameterizer:
+    def __init__(self, battery_label, cycle_number, number_of_rc_pairs=2, degree=2, cell_capacity=4.85):
+        """
+        Initialize the ECMJointParameterizer class.
+
+        Fits every pulse of a cycle as one least-squares problem instead of one PSO run per pulse. Each
+        parameter is a smooth function of the initial SoC of the pulse,
+
+            log(p(SoC)) = sum_j theta_j * P_j(2 * SoC - 1)
+
+        with Legendre polynomials P_j up to `degree` and coefficients shared by all pulses, so the fitted
+        LUT is smooth in SoC by construction. The pulses are simulated together by the batched NumPy
+        Thevenin model in App.utils.thevenin.
+
+        :param battery_label: The battery label (e.g., 'G1')
+        :param cycle_number: The HPPC cycle to fit
+        :param number_of_rc_pairs: 1 or 2 RC pairs
+        :param degree: Polynomial degree of each parameter in SoC
+        :param cell_capacity: Cell capacity in A.h used for coulomb counting
+        """
+        self.battery_label = battery_label
+        self.cycle_number = cycle_number
+        self.number_of_rc_pairs = number_of_rc_pairs
+        self.degree = degree
+        self.cell_capacity = cell_capacity
+        self.parameter_names = ["r0", "r1", "c1"] + (["r2", "c2"] if number_of_rc_pairs == 2 else [])
+
+        self.soc_ocv_data = load_soc_ocv_data(self.battery_label).sort_values(by="SOC")
+        self.soc_values = self.soc_ocv_data["SOC"].to_numpy()
+        self.ocv_values = self.soc_ocv_data["OCV"].to_numpy()
+
+        self.pulse_numbers = None
+        self.theta = None
+        self.solution = None
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+        self.logger = logging.getLogger(__name__)
+
+    def load_pulses(self, pulse_numbers=None, resample=False, **resample_options):
+        """
+        Load the pulse CSVs of the cycle into (pulses x samples) arrays, NaN padded to the longest pulse.
+
+        :param pulse_numbers: Pulses to include, defaults to every pulse saved for the cycle
+        :param resample: Thin the relaxation tails of each pulse (App.utils.resampling) and weight the residuals
+        :param resample_options: step_threshold, dense_samples and points_per_decade for resample_pulse()
+        """
+        if pulse_numbers is None:
+            pulse_numbers = hppc_pulse_numbers(self.battery_label, self.cycle_number)
+        if not pulse_numbers:
+            raise ValueError(f"No pulse data found for {self.battery_label} cycle {self.cycle_number}.")
+
+        frames = [load_hppc_pulse_data(self.battery_label, self.cycle_number, pulse) for pulse in pulse_numbers]
+        self.pulse_entries = [pulse_lut_entry(df) for df in frames]
+        if resample:
+            frames = [resample_pulse(df, **resample_options) for df in frames]
+        samples = max(len(df) for df in frames)
+
+        self.time = np.full((len(frames), samples), np.nan)
+        self.current = np.zeros((len(frames), samples))
+        self.voltage = np.full((len(frames), samples), np.nan)
+        self.weights = np.zeros((len(frames), samples))
+        for i, df in enumerate(frames):
+            self.time[i, :len(df)] = df["Time"].to_numpy() - df["Time"].iloc[0]
+            self.current[i, :len(df)] = df["Current"].to_numpy()
+            self.voltage[i, :len(df)] = df["Voltage"].to_numpy()
+            self.weights[i, :len(df)] = df["Weight"].to_numpy() if resample else 1.0
+        self.mask = ~np.isnan(self.voltage)
+
+        self.pulse_numbers = list(pulse_numbers)
+        self.soc0 = np.array([df["SoC"].iloc[0] for df in frames])
+        self.logger.info(f"Loaded {len(frames)} pulses for cycle {self.cycle_number}, SoC {self.soc0.min():.2f}-{self.soc0.max():.2f}.")
+
+    def parameters_at(self, soc, theta=None):
+        """
+        Evaluate the fitted parameter functions.
+
+        :param soc: SoC values (0-1)
+        :param theta: Coefficients, defaults to the fitted ones
+        :return: Dictionary of parameter name -> array of values at soc
+        """
+        theta = self.theta if theta is None else theta
+        basis = np.polynomial.legendre.legvander(2 * np.asarray(soc, dtype=float) - 1, self.degree)
+        values = np.exp(basis @ np.reshape(theta, (len(self.parameter_names), self.degree + 1)).T)
+        return {name: values[..., i] for i, name in enumerate(self.parameter_names)}
+
+    def simulate(self, theta=None):
+        """
+        Simulate every loaded pulse with the parameters at its initial SoC.
+        """
+        p = self.parameters_at(self.soc0, theta)
+        resistances = [p["r1"]] + ([p["r2"]] if self.number_of_rc_pairs == 2 else [])
+        capacitances = [p["c1"]] + ([p["c2"]] if self.number_of_rc_pairs == 2 else [])
+        return simulate_thevenin(self.time, self.current, self.soc0, p["r0"], resistances, capacitances,
+                                 self.soc_values, self.ocv_values, self.cell_capacity)
+
+    def residuals(self, theta):
+        # least squares minimises the plain sum of squares, so the sample weights enter as their square roots
+        return ((self.simulate(theta) - self.voltage) * np.sqrt(self.weights))[self.mask]
+
+    def fit(self, max_nfev=200):
+        """
+        Solve the joint problem with a trust-region least-squares solver.
+
+        :param max_nfev: Maximum number of residual evaluations
+        :return: Sum of squared errors over all pulses
+        """
+        from scipy.optimize import least_squares
+
+        if self.pulse_numbers is None:
+            self.load_pulses()
+
+        # start from constant functions at the usual initial guess
+        theta0 = np.zeros((len(self.parameter_names), self.degree + 1))
+        theta0[:, 0] = np.log([INITIAL_GUESS[name] for name in self.parameter_names])
+
+        self.logger.info(f"Fitting {len(self.pulse_numbers)} pulses jointly ({theta0.size} coefficients)...")
+        with metrics.timer("joint_fit", battery_label=self.battery_label, cycle_number=self.cycle_number) as timing:
+            self.solution = least_squares(self.residuals, theta0.ravel(), method="trf", x_scale="jac", max_nfev=max_nfev)
+            timing["cost_evaluations"] = self.solution.nfev
+            timing["final_cost"] = 2 * self.solution.cost
+
+        self.theta = self.solution.x.reshape(theta0.shape)
+        self.logger.info(f"Joint fit finished: {self.solution.message} SSE {2 * self.solution.cost:.6g} after {self.solution.nfev} evaluations.")
+        return 2 * self.solution.cost
+
+    def lut(self):
+        """
+        LUT rows in the same layout as ECMTheveninParameterizer.export_results(), one per pulse.
+        """
+        if self.theta is None:
+            raise ValueError("No fitting has been run. Call fit()")
+
+        values = self.parameters_at(self.soc0)
+        rows = []
+        for i, pulse_number in enumerate(self.pulse_numbers):
+            entry = self.pulse_entries[i]
+            row = {
+                "battery_label": self.battery_label,
+                "cycle": self.cycle_number,
+                "pulse_number": pulse_number,
+                "current": entry["current"],
+                "voltage": entry["voltage"],
+                "temperature": entry["temperature"],
+                "r0": values["r0"][i],
+                "r1": values["r1"][i],
+                "c1": values["c1"][i],
+                "SoC": entry["SoC"],
+            }
+            if self.number_of_rc_pairs == 2:
+                row["r2"] = values["r2"][i]
+                row["c2"] = values["c2"][i]
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def export_results(self, output_dir=None, save_to_mongo=True):
+        """
+        Save the LUT and the fitted coefficients of the joint fit.
+
+        :param output_dir: Directory for the files, defaults to the cycle's Optimization_Results directory
+        :param save_to_mongo: Also upsert the LUT into the ECM_LUT_Joint MongoDB collection
+        :return: Path of the LUT CSV
+        """
+        if output_dir is None:
+            output_dir = os.path.join("Data", "Output", "LGM50", "Optimization_Results", self.battery_label, str(self.cycle_number))
+        os.makedirs(output_dir, exist_ok=True)
+
+        csv_filename = os.path.join(output_dir, f"{self.battery_label}_{self.cycle_number}_joint_ecm_lut_table.csv")
+        self.lut().to_csv(csv_filename, index=False)
+        self.logger.info(f"Joint LUT stored in {csv_filename}.")
+
+        coefficients_file = os.path.join(output_dir, f"{self.battery_label}_{self.cycle_number}_joint_ecm_coefficients.json")
+        with open(coefficients_file, "w") as f:
+            json.dump({
+                "battery_label": self.battery_label,
+                "cycle": self.cycle_number,
+                "basis": "legendre(2 * SoC - 1)",
+                "transform": "log",
+                "degree": self.degree,
+                "coefficients": {name: self.theta[i].tolist() for i, name in enumerate(self.parameter_names)},
+                "soc_range": [float(self.soc0.min()), float(self.soc0.max())],
+                "sse": 2 * self.solution.cost,
+                "pulse_numbers": self.pulse_numbers,
+            }, f, indent=2)
+        self.logger.info(f"Joint fit coefficients stored in {coefficients_file}.")
+
+        if save_to_mongo:
+            insert_csv_to_mongodb(csv_filename, collection_name="ECM_LUT_Joint")
+
+        return csv_filename
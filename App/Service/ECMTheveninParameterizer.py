@@ -1,27 +1,104 @@
 import os
 import pandas as pd
-import pybamm
-import pybop
 import logging
 import numpy as np
 from App.Service.Mongo import insert_csv_to_mongodb
-from App.utils.data_loader import load_soc_ocv_data 
-from scipy.signal import savgol_filter
+from App.utils.data_loader import load_soc_ocv_data, load_hppc_pulse_data
+from App.utils.plotting import render, get_plot_mode
+from App.utils.metrics import metrics
+from App.utils.optimisation import TerminationController, FitResult, run_swarm, local_bounds, population_size
+from App.utils.resampling import resample_pulse
+from App.utils.bootstrap import ForwardModel, bootstrap_intervals
+from App.utils.results_store import results_path, save_cycle_results, load_cycle_results
+from App.utils.solver_calibration import build_solver, calibration_key, calibrated_solver, DEFAULT_MAX_RMSE
 
-pybamm.set_logging_level("INFO")
+# pybamm/pybop (and CasADi underneath) take seconds to import, so they are imported inside the methods that
+# need them. Importing this module stays cheap for workers and CLI tools that never build a model.
+
+def pulse_lut_entry(df):
+    """
+    LUT columns describing a pulse, taken from its HPPC pulse data.
+    """
+    return {
+        "current": df.loc[df["Current"] != 0, "Current"].iloc[0],  # First nonzero current
+        "voltage": df.loc[df["Current"] == 0, "Voltage"].iloc[-1],  # Last rest voltage
+        "temperature": 298.15,  # Fixed temperature (you can change this)
+        "SoC": df["SoC"].iloc[0]
+    }
+
+def apply_base_parameters(parameter_set, number_of_rc_pairs, inital_soc=1.0, upper_voltage_cutoff=4.2, lower_voltage_cutoff=2.5,
+                          cell_capacity=4.85, R0_Ohm=1e-3, R1_Ohm=2e-4, C1_F=1e4, R2_Ohm=0.0003, C2_F=40000):
+    """
+    Update a pybop parameter set with the base Thevenin parameters used by every fit.
+    """
+    import pybop
+
+    # Base parameters for all models
+    parameter_set.update({
+        "Initial SoC": inital_soc,
+        "Cell capacity [A.h]": cell_capacity,
+        "Nominal cell capacity [A.h]": cell_capacity,
+        "Element-1 initial overpotential [V]": 0,
+        "Upper voltage cut-off [V]": upper_voltage_cutoff,
+        "Lower voltage cut-off [V]": lower_voltage_cutoff,
+        "R0 [Ohm]": R0_Ohm,
+        "R1 [Ohm]": R1_Ohm,
+        "C1 [F]": C1_F,
+        # "Open-circuit voltage [V]": self.interpolate_ocv(self.initial_state_of_charge)
+        "Open-circuit voltage [V]": pybop.empirical.Thevenin().default_parameter_values["Open-circuit voltage [V]"]
+    })
+
+    # Add parameters for the 2 RC pairs for the thevenin model
+    if number_of_rc_pairs == 2:
+        parameter_set.update({
+            "R2 [Ohm]": R2_Ohm,
+            "C2 [F]": C2_F,
+            "Element-2 initial overpotential [V]": 0,
+        }, check_already_exists=False)
+    return parameter_set
+
+def load_parameter_set(results_file, pulse_number):
+    """
+    Rebuild the pybop parameter set of a fitted pulse from a cycle results file (App.utils.results_store).
+
+    :param results_file: Path of the {label}_{cycle}_ecm_results.npz file
+    :param pulse_number: Pulse whose fitted parameters to use
+    :return: pybop.ParameterSet with the base parameters of the fit, the fitted values and the pulse's initial SoC
+    """
+    import pybop
+
+    results, config = load_cycle_results(results_file)
+    row = results.loc[results["pulse_number"] == pulse_number]
+    if row.empty:
+        raise ValueError(f"Pulse {pulse_number} not found in {results_file}")
+    row = row.iloc[0]
+
+    parameter_set = pybop.ParameterSet(parameter_set=config["parameter_set_name"])
+    apply_base_parameters(parameter_set, config["number_of_rc_pairs"], **config["initial_parameters"])
+    parameter_set.update({name: float(row[name]) for name in config["parameter_names"]}, check_already_exists=False)
+    parameter_set.update({"Initial SoC": float(row["initial_soc"])})
+    return parameter_set
 
 class ECMTheveninParameterizer:
     def __init__(self, battery_label, cycle_number, parameter_set_name="ECM_Example"):
+        import pybamm
+        import pybop
+
+        pybamm.set_logging_level("INFO")
+
         self.battery_label = battery_label
         self.cycle_number = cycle_number
         self.number_of_rc_pairs = None  # Will be set later to setup_model()
         
+        self.parameter_set_name = parameter_set_name
         self.parameter_set = pybop.ParameterSet(parameter_set=parameter_set_name)
         self.model = None
         self.problem = None
         self.optim = None
         self.results = None
         self.pulse_number = None
+        self.weights = None
+        self.intervals = None
 
         # Load SOC-OCV data - instead of using the emperical thevenin model for OCV, we will use the 
         # soc-ocv relationship fitted data from the capacity test
@@ -33,6 +110,13 @@ class ECMTheveninParameterizer:
 
         self.results_lut = [None]
 
+        # configuration of the fits and one record per exported pulse, written by save_cycle_results()
+        self.solver_config = None
+        self.initial_parameters = None
+        self.problem_config = None
+        self.optimizer_config = None
+        self.fit_records = []
+
     def interpolate_ocv(self, soc):
         """
         Interpolate OCV value from the lookup table based on SOC.
@@ -52,45 +136,68 @@ class ECMTheveninParameterizer:
     def update_parameters(self, inital_soc=1.0, upper_voltage_cutoff=4.2, lower_voltage_cutoff=2.5, cell_capacity=4.85, 
                           R0_Ohm=1e-3, R1_Ohm=2e-4, C1_F=1e4, R2_Ohm=0.0003, C2_F=40000):
         self.logger.info("Updating parameter set with base parameters...")
-        # Base parameters for all models
-        self.parameter_set.update({
-            "Initial SoC": inital_soc,
-            "Cell capacity [A.h]": cell_capacity,
-            "Nominal cell capacity [A.h]": cell_capacity,
-            "Element-1 initial overpotential [V]": 0,
-            "Upper voltage cut-off [V]": upper_voltage_cutoff,
-            "Lower voltage cut-off [V]": lower_voltage_cutoff,
-            "R0 [Ohm]": R0_Ohm,
-            "R1 [Ohm]": R1_Ohm,
-            "C1 [F]": C1_F,
-            # "Open-circuit voltage [V]": self.interpolate_ocv(self.initial_state_of_charge)
-            "Open-circuit voltage [V]": pybop.empirical.Thevenin().default_parameter_values["Open-circuit voltage [V]"]
-        })
-        
-        # Add parameters for the 2 RC pairs for the thevenin model
+        self.initial_parameters = {
+            "inital_soc": inital_soc,
+            "upper_voltage_cutoff": upper_voltage_cutoff,
+            "lower_voltage_cutoff": lower_voltage_cutoff,
+            "cell_capacity": cell_capacity,
+            "R0_Ohm": R0_Ohm,
+            "R1_Ohm": R1_Ohm,
+            "C1_F": C1_F,
+            "R2_Ohm": R2_Ohm,
+            "C2_F": C2_F,
+        }
         if self.number_of_rc_pairs == 2:
             self.logger.info("Updating parameters for 2 RC pairs...")
-            self.parameter_set.update({
-                "R2 [Ohm]": R2_Ohm,
-                "C2 [F]": C2_F,
-                "Element-2 initial overpotential [V]": 0,
-            }, check_already_exists=False)
+        apply_base_parameters(self.parameter_set, self.number_of_rc_pairs, **self.initial_parameters)
 
-    def load_pulses(self, pulse_number):
+    def load_pulses(self, pulse_number, resample=False, **resample_options):
+        """
+        Load a pulse saved by HPPCTest into a pybop Dataset.
+
+        :param pulse_number: Index of the pulse
+        :param resample: Keep the samples around current steps and thin the relaxation tails logarithmically
+                         (App.utils.resampling). The cost is then weighted so it still approximates the sum over
+                         the full window
+        :param resample_options: step_threshold, dense_samples and points_per_decade for resample_pulse()
+        """
         self.logger.info(f"Loading data for pulse {pulse_number}...")
-        self.pulse_number = pulse_number
 
-        # Construct the file path dynamically
-        file_name = f"{self.battery_label}_cycle_{self.cycle_number}_pulse_{pulse_number}_hppc.csv"
-        file_path = os.path.join(
-            "Data", "Output", "LGM50", "HPPC_Test", self.battery_label, f"Cycle_{self.cycle_number}", file_name
-        )
-        
         # Load the data
-        df = pd.read_csv(file_path, index_col=None, na_values=["NA"])
-        df = df.drop_duplicates(subset=["Time"], keep="first")
+        df = load_hppc_pulse_data(self.battery_label, self.cycle_number, pulse_number)
+        self.load_pulse_data(df, pulse_number, resample, **resample_options)
+
+    def load_pulse_arrays(self, time, current, voltage, soc, pulse_number=None, resample=False, **resample_options):
+        """
+        Load a pulse held in memory, e.g. a window emitted by HPPCStreamDetector, without going through a CSV.
+
+        :param time: Time in seconds
+        :param current: Current in A, discharge positive
+        :param voltage: Voltage in V
+        :param soc: SoC (0-1)
+        :param pulse_number: Index of the pulse used in the exported results
+        :param resample: See load_pulses()
+        """
+        df = pd.DataFrame({"Time": time, "Voltage": voltage, "Current": current, "SoC": soc})
+        self.load_pulse_data(df.drop_duplicates(subset=["Time"], keep="first"), pulse_number, resample, **resample_options)
+
+    def load_pulse_data(self, df, pulse_number, resample=False, **resample_options):
+        import pybop
+
+        self.pulse_number = pulse_number
+        self.intervals = None
+
+        # pulse entry is the LUT .csv results with temperature, soc and rc values
+        self.pulse_entry = pulse_lut_entry(df)
         
-        # df["Voltage"] = savgol_filter(df["Voltage"], window_length=7, polyorder=2)
+        # df["Voltage"] = scipy.signal.savgol_filter(df["Voltage"], window_length=7, polyorder=2)
+
+        self.weights = None
+        if resample:
+            samples = len(df)
+            df = resample_pulse(df, **resample_options)
+            self.weights = df["Weight"].to_numpy()
+            self.logger.info(f"Resampled pulse from {samples} to {len(df)} points.")
 
         # Prepare the dataset
         self.dataset = pybop.Dataset({
@@ -101,52 +208,96 @@ class ECMTheveninParameterizer:
         self.initial_state_of_charge = df["SoC"].iloc[0]
         self.logger.info(f"Data loaded successfully. Initial SoC: {self.initial_state_of_charge}")
 
-        # pulse entry is the LUT .csv results with temperature, soc and rc values
-        self.pulse_entry = {
-            "current": df.loc[df["Current"] != 0, "Current"].iloc[0],  # First nonzero current
-            "voltage": df.loc[df["Current"] == 0, "Voltage"].iloc[-1],  # Last rest voltage
-            "temperature": 298.15,  # Fixed temperature (you can change this)
-            "SoC": self.initial_state_of_charge
-        }
+    def setup_solver(self, dt_max=5, mode="safe", solver="casadi", max_rmse=DEFAULT_MAX_RMSE, **options):
+        """
+        Choose the pybamm solver of the model built by setup_thevenin_model().
+
+        :param dt_max: Maximum CasADi integrator step
+        :param mode: CasADi solver mode, or "auto" for the fastest solver whose voltage RMSE stayed within
+                     max_rmse in the calibration cached for this model configuration (see CalibrateSolvers.py).
+                     The choice is made in setup_thevenin_model() once the number of RC pairs is known; without
+                     a cached calibration the fallback is CasADi "fast" mode with this dt_max
+        :param solver: casadi, idaklu or scipy
+        :param max_rmse: Voltage RMSE budget in V for mode="auto"
+        :param options: Further solver arguments, e.g. rtol and atol
+        """
+        if mode == "auto":
+            self.solver_config = {"mode": "auto", "dt_max": dt_max, "max_rmse": max_rmse}
+            self.solver = None
+            return
 
-    def setup_solver(self, dt_max=5, mode="safe"):
-        self.solver = pybamm.CasadiSolver(mode=mode, dt_max=dt_max)
+        self.solver_config = {"solver": solver, "mode": mode, "dt_max": dt_max, **options}
+        self.solver = build_solver(**self.solver_config)
+
+    def select_calibrated_solver(self, number_of_rc_pairs):
+        """
+        Build the solver picked for mode="auto" and record the choice in the solver configuration.
+        """
+        key = calibration_key(self.parameter_set_name, number_of_rc_pairs)
+        options, calibrated = calibrated_solver(self.parameter_set_name, number_of_rc_pairs, self.solver_config["max_rmse"],
+                                                self.solver_config["dt_max"])
+        if not calibrated:
+            self.logger.warning(f"No calibrated solver within {self.solver_config['max_rmse']} V for {key}, "
+                                f"using {options}. Run CalibrateSolvers.py to calibrate.")
+        else:
+            self.logger.info(f"Using calibrated solver {options} for {key}.")
+
+        self.solver_config = {**self.solver_config, "selected": options}
+        self.solver = build_solver(**options)
 
     def setup_thevenin_model(self, number_of_rc_pairs=2, dt_max=5):
+        import pybop
+
         self.number_of_rc_pairs = number_of_rc_pairs
 
         self.logger.info(f"Setting up model with {number_of_rc_pairs} RC pairs...")
+
+        if self.solver_config is not None and self.solver_config["mode"] == "auto":
+            self.select_calibrated_solver(number_of_rc_pairs)
         
         # Need to update the inital base parameters. If the rc_pairs are 2, .update_parameters() accounts for that.
         self.update_parameters()
         
-        # define the thevenin equivalent circuit model
-        if self.number_of_rc_pairs == 1:
-            self.model = pybop.empirical.Thevenin(
-                parameter_set=self.parameter_set,
-                options={"number of rc elements": 1},
-                solver=self.solver,
-            )
-        elif self.number_of_rc_pairs == 2:
-            self.model = pybop.empirical.Thevenin(
-                parameter_set=self.parameter_set,
-                options={"number of rc elements": 2},
-                solver=self.solver,
-            )
+        with metrics.timer("setup_thevenin_model", battery_label=self.battery_label, cycle_number=self.cycle_number, number_of_rc_pairs=number_of_rc_pairs):
+            # define the thevenin equivalent circuit model
+            if self.number_of_rc_pairs == 1:
+                self.model = pybop.empirical.Thevenin(
+                    parameter_set=self.parameter_set,
+                    options={"number of rc elements": 1},
+                    solver=self.solver,
+                )
+            elif self.number_of_rc_pairs == 2:
+                self.model = pybop.empirical.Thevenin(
+                    parameter_set=self.parameter_set,
+                    options={"number of rc elements": 2},
+                    solver=self.solver,
+                )
         
-        # Build the model
-        # "Inital SoC" is scaled from 0-1. By default the user must find and fit the polynomial soc-ocv relationship of their desired battery label ot use this function
-        # FOR EXAMPLE:
-        # capacity_test = CapacityTest(battery_label=battery_label)
-        # capacity_test.fit_soc_ocv_polynomial(degree=11)
-        # capacity_test.plot_ocv_soc_fitting()
-        # capacity_test.save_to_csv() 
-        self.model.build(initial_state={"Initial SoC": self.initial_state_of_charge})
+            # Build the model
+            # "Inital SoC" is scaled from 0-1. By default the user must find and fit the polynomial soc-ocv relationship of their desired battery label ot use this function
+            # FOR EXAMPLE:
+            # capacity_test = CapacityTest(battery_label=battery_label)
+            # capacity_test.fit_soc_ocv_polynomial(degree=11)
+            # capacity_test.plot_ocv_soc_fitting()
+            # capacity_test.save_to_csv() 
+            self.model.build(initial_state={"Initial SoC": self.initial_state_of_charge})
         self.logger.info("Model built successfully.")
 
     def setup_problem(self, r_guess=0.005, r0_bounds=[0, 0.5], r1_bounds=[0, 0.5], c1_bounds=[1, 2000], 
                         r2_bounds=[0, 0.5], c2_bounds=[0, 2000], c1_Gaussian=(500, 100), c2_Gaussian=(2000, 500)):
+        import pybop
+
         self.logger.info("Setting up optimization problem...")
+        self.problem_config = {
+            "r_guess": r_guess,
+            "r0_bounds": list(r0_bounds),
+            "r1_bounds": list(r1_bounds),
+            "c1_bounds": list(c1_bounds),
+            "r2_bounds": list(r2_bounds),
+            "c2_bounds": list(c2_bounds),
+            "c1_Gaussian": list(c1_Gaussian),
+            "c2_Gaussian": list(c2_Gaussian),
+        }
         # the bounds are hardcoded right now. I might want to pass them as r0_bounds, r1_bounds, c1_bounds... all expecting a range of [lower_bound, upper_bound]
         # if i do this i need to also let the .optimize
 
@@ -204,85 +355,355 @@ class ECMTheveninParameterizer:
             self.dataset,
         )
 
-    def optimize(self, max_unchanged_iterations=30, max_iterations=100, sigma0 = [1e-3, 1e-3, 1e-3, 50, 500],):
+    def optimize(self, max_unchanged_iterations=30, max_iterations=100, sigma0 = [1e-3, 1e-3, 1e-3, 50, 500], parallel=False, seed=None,
+                 termination=None, multistart=1, multistart_iterations=20):
+        """
+        Fit the model parameters to the loaded pulse with particle swarm optimisation.
+
+        :param max_unchanged_iterations: Stop after this many iterations without improvement
+        :param max_iterations: Maximum number of iterations
+        :param sigma0: Initial step size of each parameter
+        :param parallel: Evaluate the particles of each generation concurrently in worker processes. True uses one
+                         worker per CPU core, an integer sets the number of workers (capped at the swarm size)
+        :param seed: Seed for the initial guess and the swarm updates. The particles are evaluated independently and
+                     their costs are collected in order, so a seeded fit gives the same result for any worker count
+        :param termination: Optional TerminationController (App.utils.optimisation) adding relative improvement,
+                            swarm spread, evaluation and wall-clock stopping rules. The reason the run stopped is
+                            stored in self.results.stop_reason
+        :param multistart: Number of short independent global swarms before refining the best one locally
+        :param multistart_iterations: Iteration limit of each exploratory run
+        """
+        import pybop
+
         self.logger.info("Starting optimization...")
-        cost = pybop.SumSquaredError(self.problem)
+        if self.weights is None:
+            cost = pybop.SumSquaredError(self.problem)
+        else:
+            cost = pybop.SumSquaredError(self.problem, weighting=self.weights)
         
         # sigma0 notation by need to be passable to make a customisable problem? its hardcoded for now anyway.
         if self.number_of_rc_pairs == 1:
             sigma0 = [1e-3, 1e-3, 50] # For R0, R1, C1
         else:
             sigma0 = [1e-3, 1e-3, 1e-3, 50, 500] # For R0, R1, R2, C1, C2
-            
-        self.optim = pybop.PSO(
-            cost,
-            sigma0=sigma0,
-            max_unchanged_iterations=max_unchanged_iterations,
-            max_iterations=max_iterations,
-        )
-        self.results = self.optim.run()
+
+        # pybop samples the initial guess from the priors and pints draws the particle updates from numpy's global
+        # generator, so seeding it before the optimiser is built covers both
+        if seed is not None:
+            np.random.seed(seed)
+
+        self.optimizer_config = {
+            "method": "pso" if termination is None and multistart <= 1 else "controlled_pso",
+            "sigma0": list(sigma0),
+            "max_iterations": max_iterations,
+            "max_unchanged_iterations": max_unchanged_iterations,
+            "seed": seed,
+            "multistart": multistart,
+            "multistart_iterations": multistart_iterations,
+            "termination": None if termination is None else {
+                name: getattr(termination, name) for name in ["max_iterations", "max_evaluations", "max_unchanged_iterations",
+                                                               "relative_tolerance", "spread_tolerance", "time_budget", "min_iterations"]
+            },
+            "weighted": self.weights is not None,
+        }
+
+        if parallel:
+            self.logger.info(f"Evaluating the swarm in parallel ({'all cores' if parallel is True else f'{parallel} workers'}).")
+
+        with metrics.timer("optimize", battery_label=self.battery_label, cycle_number=self.cycle_number) as timing:
+            if termination is None and multistart <= 1:
+                # the worker processes are forked with the model already built, so each worker reuses it for every particle
+                self.optim = pybop.PSO(
+                    cost,
+                    sigma0=sigma0,
+                    max_unchanged_iterations=max_unchanged_iterations,
+                    max_iterations=max_iterations,
+                    parallel=parallel,
+                )
+                self.results = self.optim.run()
+            else:
+                if termination is None:
+                    termination = TerminationController(max_iterations=max_iterations, max_unchanged_iterations=max_unchanged_iterations)
+                self.optim = None
+                self.results = self.run_controlled_swarm(cost, sigma0, termination, multistart, multistart_iterations, parallel)
+                self.logger.info(f"Optimization stopped by '{self.results.stop_reason}' after "
+                                 f"{self.results.n_evaluations} model evaluations.")
+
+            timing["pulse_number"] = self.pulse_number
+            timing["iterations"] = getattr(self.results, "n_iterations", None)
+            timing["cost_evaluations"] = getattr(self.results, "n_evaluations", None)
+            timing["final_cost"] = getattr(self.results, "final_cost", None)
+            timing["stop_reason"] = getattr(self.results, "stop_reason", None)
+
+        if timing.get("cost_evaluations") is not None:
+            metrics.increment("cost_evaluations", timing["cost_evaluations"], battery_label=self.battery_label)
+        metrics.increment("fits", battery_label=self.battery_label)
         self.logger.info("Optimization completed successfully.")
 
-    def export_results(self, output_file=None):
-        self.logger.info("Exporting results...")
+    def run_controlled_swarm(self, cost, sigma0, termination, multistart, multistart_iterations, parallel, refine_width=3.0):
+        """
+        Run the swarm under a TerminationController, optionally as a multi-start: several short global swarms
+        (pints draws each swarm's particles uniformly over the bounds, so they explore independently), then a
+        refinement of the best one inside a box of refine_width * sigma0 around it.
+
+        The iteration, evaluation and time budgets of termination are shared: every explorer gets an equal share
+        of what is left, with one share kept for the refinement, which then gets the rest. The refinement is
+        skipped when the budget is used up.
 
-        # Default file path
-        if output_file is None:
-            default_dir = os.path.join("Data", "Output", "LGM50", "Optimization_Results", self.battery_label, str(self.cycle_number))
-            os.makedirs(default_dir, exist_ok=True)  # Ensure directory exists
-            output_file = os.path.join(default_dir, f"{self.battery_label}_cycle_{self.cycle_number}_pulse_{self.pulse_number}_ecm_parameters.json")
+        :return: FitResult with the iterations and evaluations of all runs
+        """
+        bounds = self.parameters.get_bounds()
+        lower, upper = np.asarray(bounds["lower"], dtype=float), np.asarray(bounds["upper"], dtype=float)
+        x0 = self.parameters.initial_value()
 
-        # Export the parameters
-        self.parameter_set.export_parameters(output_file, fit_params=self.parameters)
-        self.logger.info(f"Parameters saved to {output_file}")
+        if multistart <= 1:
+            return run_swarm(cost, x0, sigma0, bounds, termination, parallel)
 
-        # Extract optimized parameters
-        if self.number_of_rc_pairs == 1:
-            r0, r1, c1 = self.results.x
-            r2, c2 = None, None  # Not used for 1 RC pair
-        else:  # self.number_of_rc_pairs == 2
-            r0, r1, r2, c1, c2 = self.results.x
-
-        # Create a new pulse entry
-        pulse_entry = {
-            "battery_label": self.battery_label,
-            "cycle": self.cycle_number,
-            "pulse_number": self.pulse_number,
-            "current": self.pulse_entry["current"],
-            "voltage": self.pulse_entry["voltage"],
-            "temperature": self.pulse_entry["temperature"],
-            "r0": r0,
-            "r1": r1,
-            "c1": c1,
-            "SoC": self.pulse_entry["SoC"],
-        }
+        # starts the overall clock, every run below gets a share of what is left of the time budget
+        termination.start(upper - lower)
+        population = population_size(x0, sigma0, bounds)
+        max_evaluations = termination.max_evaluations
+        runs = []
+        for i in range(multistart):
+            shares = multistart - i + 1
+            used_iterations = sum(run.n_iterations for run in runs)
+            used_evaluations = sum(run.n_evaluations for run in runs)
+            remaining = termination.remaining_time()
+            explorer = termination.copy(
+                max_iterations=max(min(multistart_iterations, (termination.max_iterations - used_iterations) // shares), 1),
+                max_evaluations=None if max_evaluations is None else max((max_evaluations - used_evaluations) // shares, population),
+                time_budget=None if remaining is None else remaining / shares,
+            )
+            runs.append(run_swarm(cost, x0, sigma0, bounds, explorer, parallel))
+            self.logger.info(f"Start {i}: cost {runs[-1].final_cost:.6g} ({runs[-1].stop_reason})")
 
-        # Include second RC pair if applicable
-        if self.number_of_rc_pairs == 2:
-            pulse_entry["r2"] = r2
-            pulse_entry["c2"] = c2
+        best = min(runs, key=lambda run: run.final_cost)
+        used_iterations = sum(run.n_iterations for run in runs)
+        used_evaluations = sum(run.n_evaluations for run in runs)
+        remaining_iterations = termination.max_iterations - used_iterations
+        remaining_evaluations = None if max_evaluations is None else max_evaluations - used_evaluations
+        remaining = termination.remaining_time()
 
-        # Ensure results_lut is a DataFrame
-        if not isinstance(self.results_lut, pd.DataFrame):
-            self.results_lut = pd.DataFrame(columns=list(pulse_entry.keys()))
+        if remaining_iterations < 1 or (remaining_evaluations is not None and remaining_evaluations < population) \
+                or (remaining is not None and remaining <= 0):
+            self.logger.info("Budget used up by the multi-start, skipping the refinement.")
+            return FitResult(best.x, best.final_cost, used_iterations, used_evaluations, "budget_exhausted",
+                             sum(run.time for run in runs))
 
-        # Append the new pulse entry
-        self.results_lut = pd.concat([self.results_lut, pd.DataFrame([pulse_entry])], ignore_index=True)
+        refiner = termination.copy(max_iterations=remaining_iterations, max_evaluations=remaining_evaluations)
+        refined = run_swarm(cost, best.x, np.asarray(sigma0) / 2, local_bounds(best.x, sigma0, bounds, refine_width),
+                            refiner, parallel)
+        if refined.final_cost > best.final_cost:
+            refined.x, refined.final_cost = best.x, best.final_cost
 
-        # Define CSV file path (only one file for all pulses)
-        csv_filename = os.path.join(default_dir, f"{self.battery_label}_{self.cycle_number}_ecm_lut_table.csv")
+        return FitResult(
+            refined.x,
+            refined.final_cost,
+            refined.n_iterations + used_iterations,
+            refined.n_evaluations + used_evaluations,
+            refined.stop_reason,
+            refined.time + sum(run.time for run in runs),
+        )
+
+    def bootstrap(self, n_resamples=100, block_length=20, percentiles=(2.5, 97.5), workers=None, seed=None):
+        """
+        Residual-bootstrap percentile intervals for the fitted parameters (App.utils.bootstrap).
+
+        The refits use the NumPy Thevenin model, corrected to match the pybamm model at the point estimate, and
+        start from the point estimate. They run in parallel worker processes. The intervals are stored with the
+        pulse's LUT row by export_results().
+
+        :param n_resamples: Number of bootstrap refits
+        :param block_length: Length of the resampled residual blocks, in samples
+        :param percentiles: Percentiles to report
+        :param workers: Number of worker processes, defaults to one per CPU core
+        :param seed: Seed of the resampling
+        :return: Dictionary of parameter name -> list of values at the percentiles
+        """
+        if self.results is None:
+            raise ValueError("No fitting has been run. Call optimize() first.")
+
+        with metrics.timer("bootstrap", battery_label=self.battery_label, cycle_number=self.cycle_number) as timing:
+            timing["pulse_number"] = self.pulse_number
+            timing["resamples"] = n_resamples
+            time = self.dataset["Time [s]"]
+            current = self.dataset["Current function [A]"]
+            measured = self.dataset["Voltage [V]"]
+            fitted = np.asarray(self.problem.evaluate(self.results.x)["Voltage [V]"])
+
+            model = ForwardModel(time, current, self.initial_state_of_charge, self.number_of_rc_pairs,
+                                 self.soc_ocv_data["SOC"].to_numpy(), self.soc_ocv_data["OCV"].to_numpy(),
+                                 self.parameter_set["Cell capacity [A.h]"])
+            # pybamm uses a different OCV curve, the difference does not depend on the fitted parameters
+            model.offset = fitted - model(self.results.x)[0]
+
+            intervals, _ = bootstrap_intervals(model, measured, fitted, self.results.x, self.parameters.get_bounds(),
+                                               weights=self.weights, n_resamples=n_resamples, block_length=block_length,
+                                               percentiles=percentiles, workers=workers, seed=seed)
+
+        names = ["r0", "r1", "c1"] if self.number_of_rc_pairs == 1 else ["r0", "r1", "r2", "c1", "c2"]
+        self.intervals = {f"{name}_p{percentile:g}": intervals[i, j]
+                          for j, name in enumerate(names) for i, percentile in enumerate(percentiles)}
+        self.logger.info(f"Bootstrap intervals from {n_resamples} refits: {self.intervals}")
+        return self.intervals
+
+    def export_results(self, output_dir=None, save_to_mongo=True):
+        """
+        Record the fitted pulse for save_cycle_results() and append it to the cycle LUT.
+
+        :param output_dir: Directory of the LUT CSV, defaults to Data/Output/LGM50/Optimization_Results/{label}/{cycle}
+        :param save_to_mongo: Also upsert the LUT into MongoDB (disable for offline runs and benchmarks)
+        """
+        with metrics.timer("export_results", battery_label=self.battery_label, cycle_number=self.cycle_number):
+            self.logger.info("Exporting results...")
 
-        # save lut locally to csv
-        self.results_lut.to_csv(csv_filename, mode="w", index=False)
-        self.logger.info(f"Results successfully stored in {csv_filename}.")
+            # Default file path
+            if output_dir is None:
+                output_dir = os.path.dirname(results_path(self.battery_label, self.cycle_number))
+            os.makedirs(output_dir, exist_ok=True)  # Ensure directory exists
 
-        # Save to MongoDB
-        insert_csv_to_mongodb(csv_filename)
-        self.logger.info("LUT table also saved to MongoDB.")
+            # The fitted vector, statistics and intervals go to the cycle results file written once per cycle
+            self.fit_records = [record for record in self.fit_records if record["pulse_number"] != self.pulse_number]
+            self.fit_records.append({
+                "pulse_number": self.pulse_number,
+                "initial_soc": self.initial_state_of_charge,
+                "x": np.asarray(self.results.x, dtype=float),
+                "final_cost": getattr(self.results, "final_cost", None),
+                "n_iterations": getattr(self.results, "n_iterations", None),
+                "n_evaluations": getattr(self.results, "n_evaluations", None),
+                "time": getattr(self.results, "time", None),
+                "stop_reason": getattr(self.results, "stop_reason", None),
+                "intervals": self.intervals or {},
+            })
+
+            # Extract optimized parameters
+            if self.number_of_rc_pairs == 1:
+                r0, r1, c1 = self.results.x
+                r2, c2 = None, None  # Not used for 1 RC pair
+            else:  # self.number_of_rc_pairs == 2
+                r0, r1, r2, c1, c2 = self.results.x
+
+            # Create a new pulse entry
+            pulse_entry = {
+                "battery_label": self.battery_label,
+                "cycle": self.cycle_number,
+                "pulse_number": self.pulse_number,
+                "current": self.pulse_entry["current"],
+                "voltage": self.pulse_entry["voltage"],
+                "temperature": self.pulse_entry["temperature"],
+                "r0": r0,
+                "r1": r1,
+                "c1": c1,
+                "SoC": self.pulse_entry["SoC"],
+            }
+
+            # Include second RC pair if applicable
+            if self.number_of_rc_pairs == 2:
+                pulse_entry["r2"] = r2
+                pulse_entry["c2"] = c2
+
+            # Percentile columns from bootstrap(), e.g. r0_p2.5 and r0_p97.5
+            if self.intervals is not None:
+                pulse_entry.update(self.intervals)
+
+            # Ensure results_lut is a DataFrame
+            if not isinstance(self.results_lut, pd.DataFrame):
+                self.results_lut = pd.DataFrame(columns=list(pulse_entry.keys()))
+
+            # Append the new pulse entry, replacing the row of an earlier fit of the same pulse
+            self.results_lut = self.results_lut[self.results_lut["pulse_number"] != self.pulse_number]
+            self.results_lut = pd.concat([self.results_lut, pd.DataFrame([pulse_entry])], ignore_index=True)
+
+            # Define CSV file path (only one file for all pulses)
+            csv_filename = os.path.join(output_dir, f"{self.battery_label}_{self.cycle_number}_ecm_lut_table.csv")
+
+            # save lut locally to csv
+            self.results_lut.to_csv(csv_filename, mode="w", index=False)
+            self.logger.info(f"Results successfully stored in {csv_filename}.")
+
+            # Save to MongoDB
+            if save_to_mongo:
+                insert_csv_to_mongodb(csv_filename)
+                self.logger.info("LUT table also saved to MongoDB.")
+
+    def results_config(self):
+        """
+        :return: Configuration of the fits, stored with them in the cycle results file
+        """
+        return {
+            "parameter_set_name": self.parameter_set_name,
+            "parameter_names": list(self.parameters.keys()),
+            "number_of_rc_pairs": self.number_of_rc_pairs,
+            "solver": self.solver_config,
+            "initial_parameters": self.initial_parameters,
+            "problem": self.problem_config,
+            "optimizer": self.optimizer_config,
+        }
+
+    def save_cycle_results(self, output_file=None):
+        """
+        Write every pulse recorded by export_results() to one compressed results file for the cycle, together
+        with the configuration of the fits. Call once after the last pulse.
+
+        :param output_file: Optional path of the .npz file, defaults to results_path()
+        :return: Path of the results file
+        """
+        if not self.fit_records:
+            raise ValueError("No results have been exported. Call export_results() first.")
+
+        if output_file is None:
+            output_file = results_path(self.battery_label, self.cycle_number)
+
+        config = self.results_config()
+        save_cycle_results(output_file, self.battery_label, self.cycle_number, config["parameter_names"],
+                           self.fit_records, config)
+        self.logger.info(f"Results of {len(self.fit_records)} pulses saved to {output_file}")
+        return output_file
 
     def plot_parameter_convergence_results(self):
+        import pybop
+
+        if self.optim is None:
+            self.logger.info("Convergence plots are only available for fits run by pybop's own PSO loop.")
+            return
+        # pybop only draws these interactively
+        if get_plot_mode() != "interactive":
+            self.logger.info("Skipping convergence plots, they are only available in interactive plot mode.")
+            return
         pybop.plot.convergence(self.optim)
         pybop.plot.parameters(self.optim)
 
     def plot_voltage_model_reference(self):
-        pybop.plot.quick(self.problem, problem_inputs=self.results.x, title="Optimised Comparison")
+        import pybop
+
+        mode = get_plot_mode()
+        if mode == "interactive":
+            pybop.plot.quick(self.problem, problem_inputs=self.results.x, title="Optimised Comparison")
+            return None
+        if mode == "off":
+            return None
+
+        # Headless: simulate the fitted model here and hand the arrays to the rendering pool
+        simulated = self.problem.evaluate(self.results.x)["Voltage [V]"]
+        return render(
+            draw_voltage_model_reference,
+            f"{self.battery_label}/{self.cycle_number}/{self.battery_label}_cycle_{self.cycle_number}_pulse_{self.pulse_number}_ecm_fit",
+            time=np.asarray(self.dataset["Time [s]"]),
+            measured=np.asarray(self.dataset["Voltage [V]"]),
+            simulated=np.asarray(simulated),
+            title=f"Optimised Comparison - Battery {self.battery_label} - Cycle {self.cycle_number} - Pulse {self.pulse_number}",
+        )
+
+
+def draw_voltage_model_reference(time, measured, simulated, title):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot(time, measured, 'b-', label='Reference')
+    ax.plot(time, simulated, 'r--', label='Model')
+    ax.set_xlabel('Time [s]')
+    ax.set_ylabel('Voltage [V]')
+    ax.set_title(title)
+    ax.grid(True)
+    ax.legend()
+    return fig
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+from App.Service.Mongo import get_collection
+from App.utils.data_loader import load_soc_ocv_data
+
+PARAMETER_NAMES = ["r0", "r1", "c1", "r2", "c2"]
+
+
+class EKFStateEstimator:
+    def __init__(self, lut_tables, ocv_tables, initial_soc, cell_capacity=4.85, grid_points=201,
+                 process_noise=(1e-10, 1e-8, 1e-8), measurement_noise=1e-4, initial_covariance=(1e-2, 1e-4, 1e-4)):
+        """
+        Initialize the EKFStateEstimator class.
+
+        Extended Kalman filter for the SoC and the two RC overpotentials of many cells at once, using the 2RC LUTs
+        written by ECMTheveninParameterizer.export_results(). Every LUT and OCV table is resampled onto one common
+        SoC grid when the estimator is built, so each time step is a handful of batched array operations over all
+        cells, with no per-cell Python code.
+
+        State per cell: x = [SoC, V1, V2], with discharge positive current I and
+
+            SoC[k+1] = SoC[k] - I dt / (3600 Q)
+            Vi[k+1]  = exp(-dt / (Ri Ci)) Vi[k] + Ri (1 - exp(-dt / (Ri Ci))) I
+            V[k]     = OCV(SoC[k]) - R0 I - V1[k] - V2[k]
+
+        :param lut_tables: One LUT DataFrame per cell with SoC, r0, r1, c1, r2 and c2 columns
+        :param ocv_tables: One SoC-OCV DataFrame per cell with SOC and OCV columns
+        :param initial_soc: Initial SoC guess, scalar or one value per cell
+        :param cell_capacity: Cell capacity in A.h, scalar or one value per cell
+        :param grid_points: Number of points of the common SoC grid
+        :param process_noise: Process noise variance of SoC, V1 and V2 per step
+        :param measurement_noise: Voltage measurement noise variance
+        :param initial_covariance: Initial variance of SoC, V1 and V2
+        """
+        if len(lut_tables) != len(ocv_tables):
+            raise ValueError("lut_tables and ocv_tables must have one entry per cell.")
+        for c, lut in enumerate(lut_tables):
+            missing = [name for name in ["SoC"] + PARAMETER_NAMES if name not in lut.columns]
+            if missing or lut.empty:
+                raise ValueError(f"LUT of cell {c} needs non-empty SoC, r0, r1, c1, r2 and c2 columns (2RC fit), "
+                                 f"missing: {missing or 'rows'}")
+
+        self.n_cells = len(lut_tables)
+        self.soc_grid = np.linspace(0, 1, grid_points)
+        self.grid_step = self.soc_grid[1]
+
+        # (cells, grid) tables of each parameter, the OCV and its slope
+        self.tables = {name: np.empty((self.n_cells, grid_points)) for name in PARAMETER_NAMES}
+        self.ocv = np.empty((self.n_cells, grid_points))
+        for c, (lut, ocv_table) in enumerate(zip(lut_tables, ocv_tables)):
+            lut = lut.drop_duplicates(subset=["SoC"], keep="first").sort_values("SoC")
+            for name in PARAMETER_NAMES:
+                self.tables[name][c] = np.interp(self.soc_grid, lut["SoC"], lut[name])
+            ocv_table = ocv_table.sort_values("SOC")
+            self.ocv[c] = np.interp(self.soc_grid, ocv_table["SOC"], ocv_table["OCV"])
+        self.docv = np.gradient(self.ocv, self.soc_grid, axis=1)
+
+        self.cell_capacity = np.broadcast_to(np.asarray(cell_capacity, dtype=float), (self.n_cells,)).copy()
+        self.process_noise = np.diag(process_noise)
+        self.measurement_noise = measurement_noise
+
+        self.x = np.zeros((self.n_cells, 3))
+        self.x[:, 0] = initial_soc
+        self.P = np.tile(np.diag(initial_covariance), (self.n_cells, 1, 1))
+        self.samples = 0
+
+    @classmethod
+    def from_mongo(cls, cells, initial_soc, collection_name="ECM_LUT", **kwargs):
+        """
+        Build an estimator from the LUTs stored in MongoDB and the SoC-OCV tables of the capacity test.
+
+        :param cells: List of (battery_label, cycle) pairs, one per cell
+        :param initial_soc: Initial SoC guess, scalar or one value per cell
+        :param collection_name: MongoDB collection holding the LUTs
+        """
+        collection = get_collection(collection_name)
+        lut_tables, ocv_tables, ocv_cache = [], [], {}
+        for battery_label, cycle in cells:
+            document = collection.find_one({"battery_label": battery_label, "cycle": int(cycle)})
+            if not document:
+                raise ValueError(f"No LUT found for battery {battery_label}, cycle {cycle}")
+            lut_tables.append(pd.DataFrame(document["data"]))
+
+            if battery_label not in ocv_cache:
+                ocv_cache[battery_label] = load_soc_ocv_data(battery_label)
+            ocv_tables.append(ocv_cache[battery_label])
+
+        return cls(lut_tables, ocv_tables, initial_soc, **kwargs)
+
+    def lookup(self, table, soc):
+        """
+        Linear interpolation of a (cells, grid) table at one SoC per cell, clamped to the grid.
+        """
+        position = np.clip(soc, 0, 1) / self.grid_step
+        index = np.minimum(position.astype(int), len(self.soc_grid) - 2)
+        fraction = position - index
+        rows = np.arange(self.n_cells)
+        return table[rows, index] * (1 - fraction) + table[rows, index + 1] * fraction
+
+    def step(self, current, voltage, dt=1.0):
+        """
+        Advance every cell by one sample.
+
+        :param current: (cells,) current in A, discharge positive
+        :param voltage: (cells,) measured terminal voltage in V. Cells with a NaN voltage are only predicted
+        :param dt: Time since the previous sample in seconds, scalar or one value per cell
+        :return: (cells,) estimated SoC
+        """
+        current = np.broadcast_to(np.asarray(current, dtype=float), (self.n_cells,))
+        voltage = np.broadcast_to(np.asarray(voltage, dtype=float), (self.n_cells,))
+        soc = self.x[:, 0]
+
+        # predict
+        r1, c1 = self.lookup(self.tables["r1"], soc), self.lookup(self.tables["c1"], soc)
+        r2, c2 = self.lookup(self.tables["r2"], soc), self.lookup(self.tables["c2"], soc)
+        a1, a2 = np.exp(-dt / (r1 * c1)), np.exp(-dt / (r2 * c2))
+
+        self.x[:, 0] = soc - current * dt / (3600 * self.cell_capacity)
+        self.x[:, 1] = a1 * self.x[:, 1] + r1 * (1 - a1) * current
+        self.x[:, 2] = a2 * self.x[:, 2] + r2 * (1 - a2) * current
+
+        # the transition is diagonal, F P F^T is an elementwise scaling
+        f = np.column_stack([np.ones(self.n_cells), a1, a2])
+        self.P = self.P * f[:, :, None] * f[:, None, :] + self.process_noise
+
+        # update
+        soc = self.x[:, 0]
+        predicted = self.lookup(self.ocv, soc) - self.lookup(self.tables["r0"], soc) * current - self.x[:, 1] - self.x[:, 2]
+        H = np.column_stack([self.lookup(self.docv, soc), -np.ones(self.n_cells), -np.ones(self.n_cells)])
+
+        PH = np.einsum("cij,cj->ci", self.P, H)
+        S = np.einsum("ci,ci->c", H, PH) + self.measurement_noise
+        K = PH / S[:, None]
+
+        measured = ~np.isnan(voltage)
+        innovation = np.where(measured, voltage - predicted, 0.0)
+        K[~measured] = 0.0
+
+        self.x += K * innovation[:, None]
+        self.P = self.P - K[:, :, None] * PH[:, None, :]
+        self.samples += 1
+
+        return self.x[:, 0].copy()
+
+    def run(self, current, voltage, dt=1.0):
+        """
+        Process a batch of samples for every cell.
+
+        :param current: (cells, samples) current in A, discharge positive
+        :param voltage: (cells, samples) measured voltage in V
+        :param dt: Sample period in seconds
+        :return: (cells, samples) estimated SoC after each sample
+        """
+        current = np.asarray(current, dtype=float).reshape(self.n_cells, -1)
+        voltage = np.asarray(voltage, dtype=float).reshape(self.n_cells, -1)
+        soc = np.empty(current.shape)
+        for k in range(current.shape[1]):
+            soc[:, k] = self.step(current[:, k], voltage[:, k], dt)
+        return soc
+
+    def state(self):
+        """
+        :return: Dictionary with the SoC, overpotentials and SoC standard deviation of every cell
+        """
+        return {
+            "soc": self.x[:, 0].tolist(),
+            "v1": self.x[:, 1].tolist(),
+            "v2": self.x[:, 2].tolist(),
+            "soc_std": np.sqrt(np.maximum(self.P[:, 0, 0], 0)).tolist(),
+            "samples": self.samples,
+        }
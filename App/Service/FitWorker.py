@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from App.Service.JobQueue import DONE
+from App.Service.Pipeline import DEFAULT_ECM_CONFIG, ecm_lut_path, fit_loaded_pulse
+from App.utils.data_loader import hppc_pulse_file, hppc_pulse_numbers, soc_ocv_file
+from App.utils.metrics import metrics
+from App.utils.results_store import results_path, save_cycle_results
+from App.utils.solver_calibration import resolve_solver_config
+
+
+def config_hash(config):
+    """
+    Short digest of an ECM configuration, part of the job key and of the job's output directory.
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def input_digest(battery_label, cycle_number, pulse_number):
+    """
+    Short digest of the data a fit reads, the pulse CSV and the SoC-OCV table, so re-extracted pulses or a new
+    capacity fit give new jobs instead of reusing old results.
+    """
+    sha = hashlib.sha256()
+    for path in [hppc_pulse_file(battery_label, cycle_number, pulse_number), soc_ocv_file(battery_label)]:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+    return sha.hexdigest()[:12]
+
+
+def fit_job_key(battery_label, cycle_number, pulse_number, config, inputs):
+    return f"{battery_label}/{cycle_number}/{pulse_number}/{config_hash(config)}/{inputs}"
+
+
+def json_value(value):
+    """
+    Convert numpy values (also inside dictionaries and lists) to plain Python ones for the queue's JSON results.
+    """
+    if isinstance(value, dict):
+        return {key: json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [json_value(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def enqueue_fit_jobs(queue, battery_label, cycles, config=None, pulses=None):
+    """
+    Add one fit job per pulse. Jobs already in the queue with the same configuration and input data are not
+    added again.
+
+    A mode="auto" solver is resolved here, with the calibration of this machine, so every worker fits with the
+    same solver whatever calibration file it has.
+
+    :param queue: JobQueue to add the jobs to
+    :param battery_label: The battery label (e.g., 'G1')
+    :param cycles: Iterable of HPPC cycle numbers
+    :param config: ECM configuration, defaults to DEFAULT_ECM_CONFIG
+    :param pulses: Pulse numbers to fit, defaults to every pulse CSV of each cycle
+    :return: Number of jobs enqueued or already present
+    """
+    if config is None:
+        config = DEFAULT_ECM_CONFIG
+    config = resolve_solver_config(config)
+
+    count = 0
+    for cycle_number in cycles:
+        for pulse_number in (pulses if pulses is not None else hppc_pulse_numbers(battery_label, cycle_number)):
+            inputs = input_digest(battery_label, cycle_number, pulse_number)
+            payload = {"battery_label": battery_label, "cycle": cycle_number, "pulse_number": pulse_number,
+                       "config": config, "inputs": inputs}
+            queue.enqueue(payload, job_key=fit_job_key(battery_label, cycle_number, pulse_number, config, inputs))
+            count += 1
+    return count
+
+
+def run_fit_job(payload):
+    """
+    Fit one pulse and return its LUT row and results record.
+
+    The payload fixes the configuration, including the solver, and the digest of the input data, and the job
+    fails if the data on this machine does not match it. The fit is returned in the job result, so workers only
+    need the input data and collect_fit_results() only needs the queue, wherever the workers ran. Nothing is
+    written to the shared cycle files or MongoDB here, that is done once by collect_fit_results().
+
+    :param payload: Dictionary with battery_label, cycle, pulse_number, config and inputs
+    :return: JSON-serialisable job result with lut_row, record, config and final_cost
+    """
+    battery_label, cycle_number = payload["battery_label"], payload["cycle"]
+    pulse_number, config, inputs = payload["pulse_number"], payload["config"], payload["inputs"]
+
+    if config.get("solver", {}).get("mode") == "auto":
+        raise ValueError("Fit jobs need a resolved solver, enqueue them with enqueue_fit_jobs().")
+    if input_digest(battery_label, cycle_number, pulse_number) != inputs:
+        raise ValueError(f"Pulse data or SoC-OCV table of {battery_label} cycle {cycle_number} pulse {pulse_number} "
+                         f"changed since the job was enqueued, enqueue the cycle again.")
+
+    from App.Service.ECMTheveninParameterizer import ECMTheveninParameterizer
+
+    with metrics.timer("fit_job", battery_label=battery_label, cycle_number=cycle_number) as extra:
+        extra["pulse_number"] = pulse_number
+        ecm_parameterizer = ECMTheveninParameterizer(battery_label=battery_label, cycle_number=cycle_number)
+        ecm_parameterizer.load_pulses(pulse_number, **config.get("pulses", {}))
+        fit_loaded_pulse(ecm_parameterizer, config)
+        # export_results() always writes the one-row LUT CSV, keep it out of the data directory
+        with tempfile.TemporaryDirectory() as output_dir:
+            ecm_parameterizer.export_results(output_dir=output_dir, save_to_mongo=False)
+        final_cost = getattr(ecm_parameterizer.results, "final_cost", None)
+        extra["final_cost"] = final_cost
+
+    return {
+        "lut_row": json.loads(ecm_parameterizer.results_lut.to_json(orient="records"))[0],
+        "record": json_value(ecm_parameterizer.fit_records[-1]),
+        "config": json.loads(json.dumps(ecm_parameterizer.results_config(), default=float)),
+        "final_cost": None if final_cost is None else float(final_cost),
+    }
+
+
+def collect_fit_results(queue, battery_label, cycle_number, save_to_mongo=True, allow_partial=False):
+    """
+    Write the fits of a cycle's jobs, taken from the job results, to the cycle LUT CSV and results file, as a
+    single-machine run would have written them.
+
+    The latest enqueued job of every pulse of the cycle is used. Collecting is refused while any of them is
+    queued, leased or failed, so a partial LUT is never written to MongoDB by accident.
+
+    :param queue: JobQueue the jobs were enqueued to
+    :param save_to_mongo: Also upsert the merged LUT into MongoDB
+    :param allow_partial: Merge the finished jobs anyway, with a warning listing the others
+    :return: Tuple of the LUT CSV path and the results file path
+    """
+    latest = {}
+    for job_key, status, payload, result in queue.jobs(f"{battery_label}/{cycle_number}/"):
+        latest[payload["pulse_number"]] = (job_key, status, result)
+    if not latest:
+        raise ValueError(f"No fit jobs found for {battery_label} cycle {cycle_number}.")
+
+    unfinished = [f"{job_key} ({status})" for job_key, status, _ in latest.values() if status != DONE]
+    if unfinished:
+        message = f"{len(unfinished)} of {len(latest)} jobs of {battery_label} cycle {cycle_number} are not done: {', '.join(unfinished)}"
+        if not allow_partial:
+            raise ValueError(message)
+        logging.getLogger(__name__).warning(f"{message}. Collecting the finished ones only.")
+
+    results = [result for _, status, result in latest.values() if status == DONE]
+    if not results:
+        raise ValueError(f"No finished fit jobs found for {battery_label} cycle {cycle_number}.")
+    results.sort(key=lambda result: result["record"]["pulse_number"])
+
+    lut = pd.DataFrame([result["lut_row"] for result in results])
+    csv_filename = ecm_lut_path(battery_label, cycle_number)
+    os.makedirs(os.path.dirname(csv_filename), exist_ok=True)
+    lut.to_csv(csv_filename, index=False)
+
+    config = results[-1]["config"]
+    results_file = save_cycle_results(results_path(battery_label, cycle_number), battery_label, cycle_number,
+                                      config["parameter_names"], [result["record"] for result in results], config)
+
+    if save_to_mongo:
+        from App.Service.Mongo import insert_csv_to_mongodb
+        insert_csv_to_mongodb(csv_filename)
+    return csv_filename, results_file
+
+
+class FitWorker:
+    def __init__(self, queue, worker_id=None, lease_seconds=300, heartbeat_interval=60, poll_interval=5):
+        """
+        Initialize the FitWorker class.
+
+        Any number of workers, on one or several machines, can share a queue. Each leases a job, keeps the lease
+        alive from a background thread while the fit runs and reports the outcome. A worker that is killed stops
+        sending heartbeats, so its job is handed to another worker once the lease expires.
+
+        :param queue: JobQueue to take fit jobs from
+        :param worker_id: Name recorded with leased jobs, defaults to hostname:pid
+        :param lease_seconds: Lease length, renewed by every heartbeat
+        :param heartbeat_interval: Seconds between heartbeats, well below lease_seconds
+        :param poll_interval: Seconds to wait before polling again when the queue is empty
+        """
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+
+        # Set up logging
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+        self.logger = logging.getLogger(__name__)
+
+    def keep_alive(self, job, stop):
+        while not stop.wait(self.heartbeat_interval):
+            if not self.queue.heartbeat(job, self.lease_seconds):
+                self.logger.warning(f"Lease of {job} lost, another worker may run it too.")
+                return
+
+    def process(self, job):
+        """
+        Run one leased job and report its outcome to the queue.
+
+        :return: True if the job succeeded
+        """
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self.keep_alive, args=(job, stop), daemon=True)
+        heartbeat.start()
+        try:
+            result = run_fit_job(job.payload)
+        except Exception as e:
+            self.logger.exception(f"{job} failed")
+            self.queue.fail(job, f"{type(e).__name__}: {e}")
+            metrics.increment("fit_jobs", status="failed")
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        if not self.queue.complete(job, result):
+            # the fit is the same whichever worker ran it, the current holder reports it
+            self.logger.warning(f"{job} finished after its lease was lost, leaving the outcome to the current holder.")
+        metrics.increment("fit_jobs", status="done")
+        self.logger.info(f"{job} done, final cost {result['final_cost']}")
+        return True
+
+    def run(self, max_jobs=None, stop_when_empty=False):
+        """
+        Process jobs until max_jobs have run, or until the queue is empty when stop_when_empty is set.
+
+        :return: Number of jobs processed
+        """
+        processed = 0
+        while max_jobs is None or processed < max_jobs:
+            job = self.queue.lease(self.worker_id, self.lease_seconds)
+            if job is None:
+                if stop_when_empty:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            self.logger.info(f"{self.worker_id} leased {job}")
+            self.process(job)
+            processed += 1
+        return processed
@@ -0,0 +1,178 @@
+import os
+import numpy as np
+import pandas as pd
+from App.utils.data_loader import load_LGM50_data, soc_ocv_file, hppc_pulse_file
+from App.utils.metrics import metrics
+from App.utils.pulse_detection import find_main_pulses, pulse_window_size
+
+# Order of the channels along the last axis of the pulse array
+CHANNELS = ["time", "current", "voltage", "soc"]
+
+
+class HPPCBatchExtractor:
+    def __init__(self, battery_label, cycles=None, min_distance=1000):
+        """
+        Initialize the HPPCBatchExtractor class.
+
+        Loads the HPPC data of a battery label once and prepares every cycle the same way HPPCTest does for one
+        cycle (discharge positive current, NaNs removed, SoC from the OCV LUT, main pulse starts). The cycles
+        are stored back to back in one (samples x channels) array, each followed by a NaN gap one window long,
+        so every pulse window is a slice of that array and no window runs into the next cycle.
+
+        :param battery_label: The battery label to filter data by (e.g., 'G1', 'W3', etc.)
+        :param cycles: Cycle numbers to extract, defaults to every cycle in the file
+        :param min_distance: Minimum distance between pulses
+        """
+        self.battery_label = battery_label
+        self.min_distance = min_distance
+
+        with metrics.timer("hppc_batch_init", battery_label=battery_label):
+            vcell, current, _ = load_LGM50_data(test_data="HPPC_test", battery_label=battery_label)
+            self.cycles = list(range(len(vcell))) if cycles is None else list(cycles)
+
+            ocv_lut = pd.read_csv(soc_ocv_file(battery_label)).sort_values(by="OCV")
+            self.soc_values = ocv_lut["SOC"].values
+            self.ocv_values = ocv_lut["OCV"].values
+
+            self.cycle_data = []
+            self.pulse_starts = []
+            for cycle_number in self.cycles:
+                vcell_cycle = np.array(vcell[cycle_number], dtype=float).flatten()
+                current_cycle = np.array(current[cycle_number], dtype=float).flatten() * -1  # Ensure discharge is positive
+
+                valid_indices = ~np.isnan(vcell_cycle) & ~np.isnan(current_cycle)
+                vcell_cycle = vcell_cycle[valid_indices]
+                current_cycle = current_cycle[valid_indices]
+
+                self.cycle_data.append(np.column_stack([
+                    np.arange(len(vcell_cycle), dtype=float),
+                    current_cycle,
+                    vcell_cycle,
+                    np.interp(vcell_cycle, self.ocv_values, self.soc_values),
+                ]))
+                self.pulse_starts.append(find_main_pulses(current_cycle, min_distance=min_distance))
+
+        self.data = None
+        self.windows = None
+        self.metadata = None
+
+    def get_pulse_counts(self):
+        """
+        :return: Number of pulses detected in each cycle
+        """
+        return [len(starts) for starts in self.pulse_starts]
+
+    def extract(self, window_size=1000):
+        """
+        Extract every pulse of every cycle in one call.
+
+        :param window_size: Window size in samples, or "auto" to size each window from the rest after its pulse.
+                            With "auto" the array is as long as the longest window and shorter windows are NaN padded
+        :return: Tuple of the (cycles x pulses x samples x channels) array, channels ordered as CHANNELS, and a
+                 metadata DataFrame with one row per pulse. Cycles with fewer pulses are NaN padded
+        """
+        pulse_counts = self.get_pulse_counts()
+        max_pulses = max(pulse_counts, default=0)
+
+        if window_size == "auto":
+            sizes = [
+                [pulse_window_size(data[:, 1], start, end_limit=starts[i + 1] if i + 1 < len(starts) else None)
+                 for i, start in enumerate(starts)]
+                for data, starts in zip(self.cycle_data, self.pulse_starts)
+            ]
+            samples = max((max(cycle_sizes) for cycle_sizes in sizes if cycle_sizes), default=1)
+        else:
+            sizes = [[window_size] * count for count in pulse_counts]
+            samples = window_size
+
+        with metrics.timer("hppc_batch_extract", battery_label=self.battery_label) as extra:
+            extra["pulses"] = sum(pulse_counts)
+            # cycles back to back, each followed by a NaN gap so windows near the end of a cycle stay inside it
+            gap = np.full((samples, len(CHANNELS)), np.nan)
+            blocks, offsets, position = [], [], 0
+            for data in self.cycle_data:
+                blocks += [data, gap]
+                offsets.append(position)
+                position += len(data) + samples
+            self.data = np.concatenate(blocks) if blocks else np.full((samples, len(CHANNELS)), np.nan)
+
+            # absolute start of every window, missing pulses point at the first NaN gap
+            padding_start = len(self.cycle_data[0]) if self.cycle_data else 0
+            starts = np.full((len(self.cycles), max_pulses), padding_start, dtype=np.intp)
+            window_sizes = np.zeros((len(self.cycles), max_pulses), dtype=np.intp)
+            for c, cycle_starts in enumerate(self.pulse_starts):
+                starts[c, :len(cycle_starts)] = offsets[c] + cycle_starts
+                window_sizes[c, :len(cycle_starts)] = sizes[c]
+
+            # one gather from a strided view of all windows, (cycles, pulses, channels, samples) -> (..., samples, channels)
+            all_windows = np.lib.stride_tricks.sliding_window_view(self.data, samples, axis=0)
+            self.windows = all_windows[starts].transpose(0, 1, 3, 2)
+            self.windows[np.arange(samples) >= window_sizes[..., None]] = np.nan
+
+            self.metadata = self.describe(starts, offsets, window_sizes)
+
+        return self.windows, self.metadata
+
+    def describe(self, starts, offsets, window_sizes):
+        """
+        Pulse characteristics matching HPPCTest.run_analysis(), computed for all pulses at once.
+        """
+        cycle_index, pulse_index = np.nonzero(window_sizes)
+        windows = self.windows[cycle_index, pulse_index]
+        time, current, voltage, soc = (windows[..., i] for i in range(len(CHANNELS)))
+        # windows at the end of a cycle are cut short by the NaN gap
+        duration = np.sum(~np.isnan(time), axis=-1)
+
+        return pd.DataFrame({
+            "battery_label": self.battery_label,
+            "cycle": np.asarray(self.cycles)[cycle_index],
+            "pulse_number": pulse_index,
+            "start_index": starts[cycle_index, pulse_index] - np.asarray(offsets, dtype=np.intp)[cycle_index],
+            "pulse_duration": duration,
+            "voltage_drop": np.nanmax(voltage, axis=-1) - np.nanmin(voltage, axis=-1),
+            "peak_current": np.nanmax(np.abs(current), axis=-1),
+            "initial_soc": soc[:, 0],
+            "final_soc": soc[np.arange(len(soc)), duration - 1],
+        })
+
+    def pulse_view(self, cycle_number, pulse_number, window_size=1000):
+        """
+        Zero-copy view of one pulse window.
+
+        :return: (samples x channels) view into the cycle data, channels ordered as CHANNELS
+        """
+        c = self.cycles.index(cycle_number)
+        start = self.pulse_starts[c][pulse_number]
+        return self.cycle_data[c][start:start + window_size]
+
+    def save_to_csv(self, output_dir=None):
+        """
+        Save every extracted pulse in the layout of HPPCTest.save_to_csv().
+
+        :param output_dir: Base directory, the files go to {output_dir}/Cycle_{n}. Defaults to
+                           Data/Output/LGM50/HPPC_Test/{battery_label}
+        :return: List of saved file paths
+        """
+        if self.windows is None:
+            raise ValueError("No pulses have been extracted. Call extract() first.")
+
+        paths = []
+        for row in self.metadata.itertuples():
+            c = self.cycles.index(row.cycle)
+            window = self.windows[c, row.pulse_number, :row.pulse_duration]
+
+            full_path = hppc_pulse_file(self.battery_label, row.cycle, row.pulse_number)
+            if output_dir is not None:
+                full_path = os.path.join(output_dir, f"Cycle_{row.cycle}", os.path.basename(full_path))
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+            pd.DataFrame({
+                "Time": window[:, 0].astype(int),
+                "Voltage": window[:, 2],
+                "Current": window[:, 1],
+                "SoC": window[:, 3],
+            }).to_csv(full_path, index=False)
+            paths.append(full_path)
+
+        print(f"Saved {len(paths)} pulses for {self.battery_label}")
+        return paths
@@ -0,0 +1,142 @@
+import logging
+import numpy as np
+import pandas as pd
+from App.utils.data_loader import load_soc_ocv_data
+
+
+class HPPCStreamDetector:
+    def __init__(self, soc_values, ocv_values, window_size=1000, min_distance=1000, current_threshold=0.1, current_sign=-1):
+        """
+        Initialize the HPPCStreamDetector class.
+
+        Detects the main HPPC pulses in data that arrives in chunks, with the same rules as HPPCTest applied to a
+        whole cycle: NaN samples are dropped, a pulse starts at the sample before a current change larger than
+        current_threshold at least min_distance samples after the previous pulse start, and its window is
+        window_size samples long. Only the samples of windows that are still open are kept, so memory stays
+        bounded by the window and chunk size however long the test runs.
+
+        :param soc_values: SoC points of the OCV table (0-1)
+        :param ocv_values: OCV at soc_values
+        :param window_size: Window size for each pulse
+        :param min_distance: Minimum distance between pulses
+        :param current_threshold: Current change treated as a step
+        :param current_sign: Factor applied to the incoming current, -1 makes the cycler convention discharge positive
+        """
+        order = np.argsort(ocv_values)
+        self.soc_values = np.asarray(soc_values, dtype=float)[order]
+        self.ocv_values = np.asarray(ocv_values, dtype=float)[order]
+
+        self.window_size = window_size
+        self.min_distance = min_distance
+        self.current_threshold = current_threshold
+        self.current_sign = current_sign
+
+        # samples from buffer_start on, i.e. the earliest open window or the last sample seen
+        self.buffer_start = 0
+        self.buffer = np.empty((0, 3))  # current, voltage, soc
+        self.samples = 0
+        self.last_pulse = -min_distance
+        self.open_starts = []
+        self.pulse_count = 0
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_battery_label(cls, battery_label, **kwargs):
+        """
+        Detector using the SoC-OCV table from the capacity test of a battery label.
+        """
+        soc_ocv_data = load_soc_ocv_data(battery_label)
+        return cls(soc_ocv_data["SOC"].to_numpy(), soc_ocv_data["OCV"].to_numpy(), **kwargs)
+
+    def process(self, current, voltage):
+        """
+        Add a chunk of samples.
+
+        :param current: Current samples as recorded by the cycler
+        :param voltage: Voltage samples
+        :return: List of pulse windows completed by this chunk
+        """
+        current = np.asarray(current, dtype=float).ravel() * self.current_sign
+        voltage = np.asarray(voltage, dtype=float).ravel()
+        valid = ~np.isnan(current) & ~np.isnan(voltage)
+        current, voltage = current[valid], voltage[valid]
+        if len(current) == 0:
+            return []
+
+        chunk = np.column_stack([current, voltage, np.interp(voltage, self.ocv_values, self.soc_values)])
+        self.buffer = np.concatenate([self.buffer, chunk])
+        first_new = self.samples
+        self.samples += len(chunk)
+
+        # changes between the last buffered sample and the new ones, indexed by the sample before the change
+        first_checked = max(first_new - 1, self.buffer_start)
+        changes = np.flatnonzero(np.abs(np.diff(self.buffer[first_checked - self.buffer_start:, 0])) > self.current_threshold)
+        for idx in changes + first_checked:
+            if idx - self.last_pulse >= self.min_distance:
+                self.open_starts.append(idx)
+                self.last_pulse = idx
+
+        completed = [self.window(start, start + self.window_size) for start in self.open_starts
+                     if start + self.window_size <= self.samples]
+        self.open_starts = [start for start in self.open_starts if start + self.window_size > self.samples]
+        self.trim()
+        return completed
+
+    def finish(self):
+        """
+        Close the windows still open at the end of the data, cut short like HPPCTest.extract_pulse() does.
+
+        :return: List of the remaining pulse windows
+        """
+        completed = [self.window(start, self.samples) for start in self.open_starts]
+        self.open_starts = []
+        self.trim()
+        return completed
+
+    def stream(self, chunks):
+        """
+        Consume an iterable of (current, voltage) chunks, e.g. a generator reading a live cycler feed.
+
+        :return: Generator of pulse windows as their windows close, including the ones open at the end
+        """
+        for current, voltage in chunks:
+            yield from self.process(current, voltage)
+        yield from self.finish()
+
+    def window(self, start, end):
+        """
+        Pulse window in the layout of HPPCTest.selected_pulse_data.
+        """
+        data = self.buffer[start - self.buffer_start:end - self.buffer_start]
+        pulse = {
+            "start_idx": start,
+            "time": np.arange(start, end),
+            "current": data[:, 0].copy(),
+            "voltage": data[:, 1].copy(),
+            "soc": data[:, 2].copy(),
+            "window_size": self.window_size,
+            "pulse_number": self.pulse_count,
+        }
+        self.pulse_count += 1
+        self.logger.info(f"Pulse {pulse['pulse_number']} complete: samples {start}-{end}, initial SoC {pulse['soc'][0]:.2f}")
+        return pulse
+
+    def trim(self):
+        # keep the open windows, and the last sample so a change at the next chunk boundary is still seen
+        keep_from = min(self.open_starts + [max(self.samples - 1, 0)])
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+
+    @staticmethod
+    def to_dataframe(pulse):
+        """
+        :return: The pulse as a DataFrame in the layout of HPPCTest.save_to_csv()
+        """
+        return pd.DataFrame({
+            "Time": pulse["time"],
+            "Voltage": pulse["voltage"],
+            "Current": pulse["current"],
+            "SoC": pulse["soc"],
+        })
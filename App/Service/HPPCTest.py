@@ -1,9 +1,10 @@
 import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import scipy.io as sio
-from App.utils.data_loader import load_LGM50_data
+from App.utils.data_loader import load_LGM50_data, soc_ocv_file, hppc_pulse_file
+from App.utils.plotting import render, decimate
+from App.utils.metrics import metrics
+from App.utils.pulse_detection import find_main_pulses, pulse_window_size
 
 class HPPCTest:
     def __init__(self, battery_label, cycle_number):
@@ -13,40 +14,41 @@ class HPPCTest:
         :param battery_label: The battery label to filter data by (e.g., 'G1', 'W3', etc.)
         :param cycle_number: The cycle number to analyze (default is 0)
         """
-        self.battery_label = battery_label
-        self.test_type = "HPPC_test"
-        self.cycle_number = cycle_number
+        with metrics.timer("hppc_init", battery_label=battery_label, cycle_number=cycle_number):
+            self.battery_label = battery_label
+            self.test_type = "HPPC_test"
+            self.cycle_number = cycle_number
         
-        # Load the data based on the HPPC test
-        self.vcell, self.current, self.cap = load_LGM50_data(test_data=self.test_type, battery_label=self.battery_label)
+            # Load the data based on the HPPC test
+            self.vcell, self.current, self.cap = load_LGM50_data(test_data=self.test_type, battery_label=self.battery_label)
         
-        # Convert loaded data to the right format
-        # Taking the specified cycle and flattening the array
-        self.vcell_cycle = np.array(self.vcell[self.cycle_number]).flatten()
-        self.current_cycle = np.array(self.current[self.cycle_number]).flatten() * -1  # Ensure discharge is positive
+            # Convert loaded data to the right format
+            # Taking the specified cycle and flattening the array
+            self.vcell_cycle = np.array(self.vcell[self.cycle_number]).flatten()
+            self.current_cycle = np.array(self.current[self.cycle_number]).flatten() * -1  # Ensure discharge is positive
         
-        # Remove NaN values
-        valid_indices = ~np.isnan(self.vcell_cycle) & ~np.isnan(self.current_cycle)
-        self.vcell_cycle = self.vcell_cycle[valid_indices]
-        self.current_cycle = self.current_cycle[valid_indices]
-        self.time_vector = np.arange(len(self.vcell_cycle))
+            # Remove NaN values
+            valid_indices = ~np.isnan(self.vcell_cycle) & ~np.isnan(self.current_cycle)
+            self.vcell_cycle = self.vcell_cycle[valid_indices]
+            self.current_cycle = self.current_cycle[valid_indices]
+            self.time_vector = np.arange(len(self.vcell_cycle))
         
-        # Load OCV-to-SOC LUT from the capacity test
-        self.ocv_lut_file = f"Data/Output/LGM50/Capacity_Test/{battery_label}/{battery_label}_soc_ocv.csv"
-        self.ocv_lut = pd.read_csv(self.ocv_lut_file)
-        self.ocv_lut = self.ocv_lut.sort_values(by="OCV")
-        self.soc_values = self.ocv_lut["SOC"].values
-        self.ocv_values = self.ocv_lut["OCV"].values
+            # Load OCV-to-SOC LUT from the capacity test
+            self.ocv_lut_file = soc_ocv_file(battery_label)
+            self.ocv_lut = pd.read_csv(self.ocv_lut_file)
+            self.ocv_lut = self.ocv_lut.sort_values(by="OCV")
+            self.soc_values = self.ocv_lut["SOC"].values
+            self.ocv_values = self.ocv_lut["OCV"].values
         
-        # Calculate SOC for the cycle
-        self.soc_cycle = self.estimate_soc_from_ocv(self.vcell_cycle)
+            # Calculate SOC for the cycle
+            self.soc_cycle = self.estimate_soc_from_ocv(self.vcell_cycle)
         
-        # Find main pulse sequences
-        self.pulse_starts = self.find_main_pulses(self.current_cycle)
+            # Find main pulse sequences
+            self.pulse_starts = self.find_main_pulses(self.current_cycle)
         
-        # Analysis results storage
-        self.selected_pulse_data = None
-        self.pulse_characteristics = None
+            # Analysis results storage
+            self.selected_pulse_data = None
+            self.pulse_characteristics = None
     
     def estimate_soc_from_ocv(self, voltage):
         """
@@ -65,17 +67,7 @@ class HPPCTest:
         :param min_distance: Minimum distance between pulses
         :return: Array of pulse start indices
         """
-        current_threshold = 0.1  # Detect significant changes in current
-        all_changes = np.where(np.abs(np.diff(current)) > current_threshold)[0]
-        
-        main_pulses = []
-        last_pulse = -min_distance  # Initialize with negative distance
-        
-        for idx in all_changes:
-            if idx - last_pulse >= min_distance:
-                main_pulses.append(idx)
-                last_pulse = idx
-        return np.array(main_pulses)
+        return find_main_pulses(current, min_distance=min_distance)
     
     def get_pulse_count(self):
         """
@@ -85,6 +77,19 @@ class HPPCTest:
         """
         return len(self.pulse_starts)
     
+    def auto_window_size(self, pulse_number, min_rest=300, max_window=None):
+        """
+        Window size covering the pulse sequence and the rest that follows it, up to the next pulse.
+        
+        :param pulse_number: Index of the pulse
+        :param min_rest: Shortest rest segment, in samples, that ends the pulse sequence
+        :param max_window: Optional upper limit on the window size
+        :return: Window size in samples
+        """
+        next_start = self.pulse_starts[pulse_number + 1] if pulse_number + 1 < self.get_pulse_count() else None
+        return pulse_window_size(self.current_cycle, self.pulse_starts[pulse_number], end_limit=next_start,
+                                 min_rest=min_rest, max_window=max_window)
+    
     def extract_pulse(self, start_idx, window_size=1000):
         """
         Extract pulse data for a given start index.
@@ -106,7 +111,7 @@ class HPPCTest:
         Run the HPPC analysis for a specific pulse.
         
         :param pulse_number: Index of the pulse to analyze
-        :param window_size: Window size for analysis
+        :param window_size: Window size for analysis, or "auto" to size it from the detected rest after the pulse
         :return: Dictionary of pulse characteristics
         """
         pulse_count = self.get_pulse_count()
@@ -117,6 +122,8 @@ class HPPCTest:
             raise ValueError(f"Pulse number {pulse_number} exceeds available pulses ({pulse_count}).")
         
         selected_start = self.pulse_starts[pulse_number]
+        if window_size == "auto":
+            window_size = self.auto_window_size(pulse_number)
         time_pulse, current_pulse, voltage_pulse, soc_pulse = self.extract_pulse(
             selected_start, window_size
         )
@@ -152,63 +159,32 @@ class HPPCTest:
         
         return self.pulse_characteristics
 
-    def plot_hppc_analysis(self):
+    def plot_hppc_analysis(self, max_points=2000):
         """
         Plot the HPPC analysis results.
+
+        :param max_points: Maximum number of points drawn for each full cycle trace
+        :return: The figure in interactive mode, the future of the saved file in file mode, None when plotting is off
         """
         if self.selected_pulse_data is None:
             raise ValueError("No analysis has been run. Call run_analysis() first.")
-        
-        # Extract data for plotting
-        selected_start = self.selected_pulse_data['start_idx']
-        time_pulse = self.selected_pulse_data['time']
-        current_pulse = self.selected_pulse_data['current']
-        voltage_pulse = self.selected_pulse_data['voltage']
-        soc_pulse = self.selected_pulse_data['soc']
-        window_size = self.selected_pulse_data['window_size']
+
+        # The full cycle traces hold every sample of the cycle, decimate them before drawing
+        time_voltage, voltage_cycle = decimate(self.time_vector, self.vcell_cycle, max_points)
+        time_current, current_cycle = decimate(self.time_vector, self.current_cycle, max_points)
+        time_soc, soc_cycle = decimate(self.time_vector, self.soc_cycle, max_points)
+
         pulse_number = self.selected_pulse_data['pulse_number']
-        
-        # Create figure with 4 subplots
-        fig, (ax1, ax2, ax3, ax4) = plt.subplots(4, 1, figsize=(12, 12))
-        
-        # Plot full cycle voltage with selected pulse highlighted
-        ax1.plot(self.time_vector, self.vcell_cycle, 'b-', label='Voltage')
-        ax1.axvspan(selected_start, selected_start + window_size, color='red', alpha=0.2, label='Selected Pulse')
-        ax1.set_ylabel('Voltage (V)')
-        ax1.set_title(f'Full HPPC Cycle - Battery {self.battery_label} - Selected Pulse {pulse_number}')
-        ax1.grid(True)
-        ax1.legend()
-        
-        # Plot full cycle current with selected pulse highlighted
-        ax2.plot(self.time_vector, self.current_cycle, 'r-', label='Current')
-        ax2.axvspan(selected_start, selected_start + window_size, color='red', alpha=0.2, label='Selected Pulse')
-        ax2.set_ylabel('Current (A)')
-        ax2.grid(True)
-        ax2.legend()
-        
-        # Plot extracted pulse for voltage and current
-        ax3.plot(time_pulse, voltage_pulse, 'b-', label='Voltage')
-        ax3.plot(time_pulse, current_pulse, 'r-', label='Current')
-        ax3.set_xlabel('Time')
-        ax3.set_ylabel('Voltage (V) / Current (A)')
-        ax3.set_title(f'Extracted Pulse {pulse_number}')
-        ax3.grid(True)
-        ax3.legend()
-        
-        # Plot SOC over the full cycle (using OCV LUT)
-        ax4.plot(self.time_vector, self.soc_cycle, 'g-', label='State of Charge')
-        ax4.set_xlabel('Time (s)')
-        ax4.set_ylabel('SOC (%)')
-        ax4.set_title('State of Charge over Cycle Test (OCV LUT-based)')
-        ax4.axvline(x=selected_start, color='red', linestyle='--', label='Pulse Start')
-        ax4.grid(True)
-        ax4.legend()
-        
-        plt.tight_layout()
-        plt.show()
-        
-        return fig
-    
+        return render(
+            draw_hppc_analysis,
+            f"{self.battery_label}/Cycle_{self.cycle_number}/{self.battery_label}_cycle_{self.cycle_number}_pulse_{pulse_number}_hppc",
+            time_voltage=time_voltage, voltage_cycle=voltage_cycle,
+            time_current=time_current, current_cycle=current_cycle,
+            time_soc=time_soc, soc_cycle=soc_cycle,
+            selected_pulse_data=self.selected_pulse_data,
+            battery_label=self.battery_label,
+        )
+
     def save_to_csv(self, output_path=None):
         """
         Save the current pulse data to a CSV file.
@@ -234,19 +210,68 @@ class HPPCTest:
             'SoC': soc_pulse
         })
 
-        # Default directory if no output path provided
-        if output_path is None:
-            output_path = os.path.join("Data", "Output", "LGM50", "HPPC_Test", self.battery_label, f"Cycle_{self.cycle_number}",)
-        
-        # Ensure output_path is a directory
-        if not os.path.isdir(output_path):
-            os.makedirs(output_path, exist_ok=True)
+        # Default location if no output path provided
+        full_path = hppc_pulse_file(self.battery_label, self.cycle_number, pulse_number)
+        if output_path is not None:
+            full_path = os.path.join(output_path, os.path.basename(full_path))
 
-        file_name = f"{self.battery_label}_cycle_{self.cycle_number}_pulse_{pulse_number}_hppc.csv"
-        full_path = os.path.join(output_path, file_name)
+        # Ensure the directory exists
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
 
         # Save DataFrame to CSV
         pulse_df.to_csv(full_path, index=False)
         print(f"Pulse data saved to: {full_path}")
 
         return full_path
+
+
+def draw_hppc_analysis(time_voltage, voltage_cycle, time_current, current_cycle, time_soc, soc_cycle,
+                       selected_pulse_data, battery_label):
+    import matplotlib.pyplot as plt
+
+    # Extract data for plotting
+    selected_start = selected_pulse_data['start_idx']
+    time_pulse = selected_pulse_data['time']
+    current_pulse = selected_pulse_data['current']
+    voltage_pulse = selected_pulse_data['voltage']
+    window_size = selected_pulse_data['window_size']
+    pulse_number = selected_pulse_data['pulse_number']
+
+    # Create figure with 4 subplots
+    fig, (ax1, ax2, ax3, ax4) = plt.subplots(4, 1, figsize=(12, 12))
+
+    # Plot full cycle voltage with selected pulse highlighted
+    ax1.plot(time_voltage, voltage_cycle, 'b-', label='Voltage')
+    ax1.axvspan(selected_start, selected_start + window_size, color='red', alpha=0.2, label='Selected Pulse')
+    ax1.set_ylabel('Voltage (V)')
+    ax1.set_title(f'Full HPPC Cycle - Battery {battery_label} - Selected Pulse {pulse_number}')
+    ax1.grid(True)
+    ax1.legend()
+
+    # Plot full cycle current with selected pulse highlighted
+    ax2.plot(time_current, current_cycle, 'r-', label='Current')
+    ax2.axvspan(selected_start, selected_start + window_size, color='red', alpha=0.2, label='Selected Pulse')
+    ax2.set_ylabel('Current (A)')
+    ax2.grid(True)
+    ax2.legend()
+
+    # Plot extracted pulse for voltage and current
+    ax3.plot(time_pulse, voltage_pulse, 'b-', label='Voltage')
+    ax3.plot(time_pulse, current_pulse, 'r-', label='Current')
+    ax3.set_xlabel('Time')
+    ax3.set_ylabel('Voltage (V) / Current (A)')
+    ax3.set_title(f'Extracted Pulse {pulse_number}')
+    ax3.grid(True)
+    ax3.legend()
+
+    # Plot SOC over the full cycle (using OCV LUT)
+    ax4.plot(time_soc, soc_cycle, 'g-', label='State of Charge')
+    ax4.set_xlabel('Time (s)')
+    ax4.set_ylabel('SOC (%)')
+    ax4.set_title('State of Charge over Cycle Test (OCV LUT-based)')
+    ax4.axvline(x=selected_start, color='red', linestyle='--', label='Pulse Start')
+    ax4.grid(True)
+    ax4.legend()
+
+    plt.tight_layout()
+    return fig
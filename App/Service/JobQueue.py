@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+# job states
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, job_id, job_key, payload, attempts, lease_token, lease_expires):
+        """
+        A job handed out by JobQueue.lease(). The lease token must be passed back with every heartbeat and with
+        the final complete() or fail() call.
+        """
+        self.job_id = job_id
+        self.job_key = job_key
+        self.payload = payload
+        self.attempts = attempts
+        self.lease_token = lease_token
+        self.lease_expires = lease_expires
+
+    def __repr__(self):
+        return f"Job(job_id={self.job_id}, job_key='{self.job_key}', attempts={self.attempts})"
+
+
+class JobQueue(ABC):
+    """
+    Interface of the queue backends used by FitWorker and Worker.py.
+
+    A leased job is invisible to other workers until its lease expires. Workers extend the lease with heartbeats
+    while they run; a worker that dies simply stops sending them and the job becomes visible again after the
+    visibility timeout. complete() and fail() only succeed while the caller still holds the lease, so a slow
+    worker whose job was handed to another one cannot overwrite the newer outcome.
+    """
+
+    @abstractmethod
+    def enqueue(self, payload, job_key=None):
+        """
+        :return: Id of the job, enqueueing a job_key that already exists returns the existing job
+        """
+
+    @abstractmethod
+    def lease(self, worker_id, lease_seconds=None):
+        """
+        :return: Job, or None when nothing is available
+        """
+
+    @abstractmethod
+    def heartbeat(self, job, lease_seconds=None):
+        """
+        :return: False if the lease was lost
+        """
+
+    @abstractmethod
+    def complete(self, job, result=None):
+        """
+        :return: False if the lease was lost
+        """
+
+    @abstractmethod
+    def fail(self, job, error):
+        """
+        :return: False if the lease was lost
+        """
+
+    @abstractmethod
+    def requeue_failed(self):
+        """
+        :return: Number of requeued jobs
+        """
+
+    @abstractmethod
+    def counts(self):
+        """
+        :return: Number of jobs per status
+        """
+
+    @abstractmethod
+    def results(self, status=DONE):
+        """
+        :return: List of (job_key, payload, result or error) of the jobs with a status
+        """
+
+    @abstractmethod
+    def jobs(self, key_prefix=""):
+        """
+        :return: List of (job_key, status, payload, result or error) of the jobs whose key starts with key_prefix,
+                 oldest first
+        """
+
+
+class SQLiteJobQueue(JobQueue):
+    def __init__(self, path, visibility_timeout=300, max_attempts=3, wal=True):
+        """
+        Initialize the SQLiteJobQueue class.
+
+        Works for any number of worker processes on one machine, and across machines when the database sits on
+        a filesystem with working POSIX locks (set wal=False there, WAL needs shared memory between the
+        processes).
+
+        :param path: Path of the SQLite database, created if missing
+        :param visibility_timeout: Default lease length in seconds
+        :param max_attempts: Attempts, including expired leases, before a job is marked failed
+        :param wal: Use write-ahead logging so readers do not block writers
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.connection() as connection:
+            if wal:
+                connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_key TEXT UNIQUE,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_token TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires)")
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+        self.logger = logging.getLogger(__name__)
+
+    def connect(self):
+        # autocommit, transactions are opened explicitly with BEGIN IMMEDIATE where they are needed
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def connection(self):
+        connection = self.connect()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, payload, job_key=None):
+        """
+        Add a job. Jobs with a key are only added once, enqueueing the same key again is a no-op.
+
+        :param payload: JSON-serialisable job description
+        :param job_key: Optional unique key, e.g. label/cycle/pulse/config hash
+        :return: Id of the job with this key, new or existing
+        """
+        now = time.time()
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO jobs (job_key, payload, status, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (job_key, json.dumps(payload), QUEUED, now, now),
+            )
+            if cursor.rowcount == 0:
+                return connection.execute("SELECT id FROM jobs WHERE job_key = ?", (job_key,)).fetchone()[0]
+            return cursor.lastrowid
+
+    def lease(self, worker_id, lease_seconds=None):
+        """
+        Take the oldest visible job: queued, or leased with an expired lease.
+
+        :return: Job, or None when nothing is available
+        """
+        lease_seconds = lease_seconds or self.visibility_timeout
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+
+            # expired leases that used up their attempts are not handed out again
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(error, 'lease expired'), updated = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts),
+            )
+            row = connection.execute(
+                "SELECT id, job_key, payload, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT 1",
+                (QUEUED, LEASED, now),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+
+            job_id, job_key, payload, attempts = row
+            token = uuid.uuid4().hex
+            expires = now + lease_seconds
+            connection.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, worker = ?, lease_token = ?, lease_expires = ?, updated = ? WHERE id = ?",
+                (LEASED, attempts + 1, worker_id, token, expires, now, job_id),
+            )
+            connection.execute("COMMIT")
+            return Job(job_id, job_key, json.loads(payload), attempts + 1, token, expires)
+        except Exception:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def heartbeat(self, job, lease_seconds=None):
+        """
+        Extend the lease of a running job.
+
+        :return: False if the lease was lost, i.e. it expired and the job was handed to another worker
+        """
+        now = time.time()
+        expires = now + (lease_seconds or self.visibility_timeout)
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND lease_token = ? AND status = ?",
+                (expires, now, job.job_id, job.lease_token, LEASED),
+            )
+        if cursor.rowcount == 1:
+            job.lease_expires = expires
+            return True
+        return False
+
+    def complete(self, job, result=None):
+        """
+        Mark a job done and store its result.
+
+        :return: False if the lease was lost, the result is then not recorded
+        """
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_token = NULL, updated = ? "
+                "WHERE id = ? AND lease_token = ? AND status = ?",
+                (DONE, json.dumps(result), time.time(), job.job_id, job.lease_token, LEASED),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job, error):
+        """
+        Give a job back after an error. It is queued again until it has used max_attempts.
+
+        :return: False if the lease was lost
+        """
+        status = FAILED if job.attempts >= self.max_attempts else QUEUED
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_token = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND lease_token = ? AND status = ?",
+                (status, str(error), time.time(), job.job_id, job.lease_token, LEASED),
+            )
+        return cursor.rowcount == 1
+
+    def requeue_failed(self):
+        """
+        Give failed jobs a fresh set of attempts.
+
+        :return: Number of requeued jobs
+        """
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, updated = ? WHERE status = ?", (QUEUED, time.time(), FAILED)
+            )
+        return cursor.rowcount
+
+    def counts(self):
+        """
+        :return: Number of jobs per status
+        """
+        with self.connection() as connection:
+            rows = connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {QUEUED: 0, LEASED: 0, DONE: 0, FAILED: 0, **dict(rows)}
+
+    def results(self, status=DONE):
+        """
+        :return: List of (job_key, payload, result or error) of the jobs with a status
+        """
+        with self.connection() as connection:
+            rows = connection.execute(
+                "SELECT job_key, payload, result, error FROM jobs WHERE status = ? ORDER BY id", (status,)
+            ).fetchall()
+        return [(key, json.loads(payload), json.loads(result) if result else error) for key, payload, result, error in rows]
+
+    def jobs(self, key_prefix=""):
+        """
+        :return: List of (job_key, status, payload, result or error) of the jobs whose key starts with key_prefix,
+                 oldest first
+        """
+        with self.connection() as connection:
+            rows = connection.execute(
+                "SELECT job_key, status, payload, result, error FROM jobs WHERE substr(job_key, 1, ?) = ? ORDER BY id",
+                (len(key_prefix), key_prefix),
+            ).fetchall()
+        return [(key, status, json.loads(payload), json.loads(result) if result else error)
+                for key, status, payload, result, error in rows]
@@ -1,12 +1,40 @@
+import os
+import json
+import hashlib
 import pandas as pd
 import numpy as np
-from pymongo import MongoClient
+from App.utils.metrics import metrics
 
-client = MongoClient("mongodb://localhost:27017/")
-db = client["BatteryData"]
-collection = db["ECM_LUT"]
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
 
-def insert_csv_to_mongodb(csv_path):
+# The client is created on first use rather than at import so importing the services neither pays for
+# pymongo nor opens a connection in processes that never write to MongoDB.
+_client = None
+
+# callbacks run after every LUT write as callback(collection_name, battery_label, cycle), e.g. to drop cached reads
+_write_listeners = []
+
+def on_write(callback):
+    _write_listeners.append(callback)
+    return callback
+
+def content_version(data_rows):
+    """
+    Short content hash of LUT rows, stored with each document so readers can tell whether a LUT changed
+    without fetching it.
+    """
+    payload = json.dumps(data_rows, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def get_collection(name="ECM_LUT"):
+    global _client
+    if _client is None:
+        from pymongo import MongoClient
+
+        _client = MongoClient(MONGO_URI)
+    return _client["BatteryData"][name]
+
+def insert_csv_to_mongodb(csv_path, collection_name="ECM_LUT"):
     try:
         df = pd.read_csv(csv_path)
 
@@ -26,17 +54,22 @@ def insert_csv_to_mongodb(csv_path):
         document = {
             "battery_label": battery_label,
             "cycle": cycle,
+            "version": content_version(data_rows),
             "data": data_rows
         }
 
         # Replace or insert the document
-        collection.replace_one(
-            {"battery_label": battery_label, "cycle": cycle},
-            document,
-            upsert=True
-        )
+        with metrics.timer("mongo_write", collection=collection_name):
+            get_collection(collection_name).replace_one(
+                {"battery_label": battery_label, "cycle": cycle},
+                document,
+                upsert=True
+            )
+
+        for callback in _write_listeners:
+            callback(collection_name, battery_label, cycle)
 
-        print(f"Saved full ECM LUT for {battery_label} cycle {cycle} to MongoDB.")
+        print(f"Saved full ECM LUT for {battery_label} cycle {cycle} to MongoDB ({collection_name}).")
 
     except Exception as e:
-        print(f"Failed to insert CSV to MongoDB: {e}")
\ No newline at end of file
+        print(f"Failed to insert CSV to MongoDB: {e}")
@@ -0,0 +1,226 @@
+import logging
+import numpy as np
+import pandas as pd
+from App.utils.data_loader import load_soc_ocv_data
+
+
+class OnlineECMIdentifier:
+    def __init__(self, soc_values, ocv_values, initial_soc, number_of_rc_pairs=2, forgetting_factor=0.999, dt=1.0,
+                 cell_capacity=4.85, initial_covariance=1e3, soc_bin_width=0.05, current_threshold=0.1,
+                 overpotential_threshold=1e-3, battery_labels=None):
+        """
+        Initialize the OnlineECMIdentifier class.
+
+        Tracks Thevenin parameters from streaming voltage/current samples with recursive least squares and a
+        forgetting factor. Every cell is described by an ARX model of its overpotential U = OCV(SoC) - V,
+
+            1 RC: U[k] = a1 U[k-1] + b0 I[k] + b1 I[k-1]
+            2 RC: U[k] = a1 U[k-1] + a2 U[k-2] + b0 I[k] + b1 I[k-1] + b2 I[k-2]
+
+        which is the exact discretisation of the circuit for a current held over each sample. The SoC is
+        coulomb counted from initial_soc. All cells are updated together, each sample costs the same
+        regardless of how much data has been seen.
+
+        :param soc_values: SoC points of the OCV table (0-1)
+        :param ocv_values: OCV at soc_values
+        :param initial_soc: Initial SoC of every cell, scalar or one value per cell
+        :param number_of_rc_pairs: 1 or 2 RC pairs
+        :param forgetting_factor: RLS forgetting factor, lower values track faster but are noisier
+        :param dt: Sample period in seconds
+        :param cell_capacity: Cell capacity in A.h
+        :param initial_covariance: Initial diagonal of the RLS covariance
+        :param soc_bin_width: Width of the SoC bins parameter snapshots are keyed by
+        :param current_threshold: Current below which a cell counts as at rest
+        :param overpotential_threshold: Overpotential below which a resting cell counts as relaxed. Relaxed cells
+                                        carry no information and are not updated, which avoids covariance windup
+        :param battery_labels: Optional label of each cell used in the snapshots
+        """
+        order = np.argsort(soc_values)
+        self.soc_values = np.asarray(soc_values, dtype=float)[order]
+        self.ocv_values = np.asarray(ocv_values, dtype=float)[order]
+
+        self.soc = np.atleast_1d(np.asarray(initial_soc, dtype=float)).copy()
+        self.n_cells = len(self.soc)
+        self.battery_labels = list(battery_labels) if battery_labels is not None else list(range(self.n_cells))
+
+        self.number_of_rc_pairs = number_of_rc_pairs
+        self.forgetting_factor = forgetting_factor
+        self.dt = dt
+        self.cell_capacity = cell_capacity
+        self.soc_bin_width = soc_bin_width
+        self.current_threshold = current_threshold
+        self.overpotential_threshold = overpotential_threshold
+
+        # regressor: number_of_rc_pairs past overpotentials and number_of_rc_pairs + 1 currents
+        n = 2 * number_of_rc_pairs + 1
+        self.theta = np.zeros((self.n_cells, n))
+        self.theta[:, 0] = 0.9  # a slowly decaying overpotential is a better start than no memory at all
+        self.covariance = np.tile(np.eye(n) * initial_covariance, (self.n_cells, 1, 1))
+        self.past_overpotential = np.zeros((self.n_cells, number_of_rc_pairs))
+        self.past_current = np.zeros((self.n_cells, number_of_rc_pairs))
+
+        self.samples = 0
+        self.updates = np.zeros(self.n_cells, dtype=int)
+        self.soc_bin = self.bin_of(self.soc)
+        self.snapshots = {}
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_battery_label(cls, battery_label, initial_soc, **kwargs):
+        """
+        Identifier using the SoC-OCV table from the capacity test of a battery label.
+        """
+        soc_ocv_data = load_soc_ocv_data(battery_label)
+        n_cells = np.size(initial_soc)
+        kwargs.setdefault("battery_labels", [battery_label] if n_cells == 1 else [f"{battery_label}/{i}" for i in range(n_cells)])
+        return cls(soc_ocv_data["SOC"].to_numpy(), soc_ocv_data["OCV"].to_numpy(), initial_soc, **kwargs)
+
+    def bin_of(self, soc):
+        return np.floor(np.clip(soc, 0, 1 - 1e-9) / self.soc_bin_width).astype(int)
+
+    def update(self, current, voltage):
+        """
+        Process one sample of every cell.
+
+        :param current: (cells,) current in A, discharge positive
+        :param voltage: (cells,) terminal voltage in V
+        :return: List of snapshots emitted because a cell moved to another SoC bin
+        """
+        current = np.broadcast_to(np.asarray(current, dtype=float), (self.n_cells,))
+        voltage = np.broadcast_to(np.asarray(voltage, dtype=float), (self.n_cells,))
+
+        overpotential = np.interp(self.soc, self.soc_values, self.ocv_values) - voltage
+        phi = np.concatenate([self.past_overpotential, current[:, None], self.past_current], axis=1)
+
+        # cells without a valid sample or at rest and relaxed keep their estimate
+        active = (np.abs(phi[:, self.number_of_rc_pairs:]).max(axis=1) > self.current_threshold) | \
+                 (np.abs(self.past_overpotential[:, 0]) > self.overpotential_threshold)
+        active &= ~(np.isnan(current) | np.isnan(voltage))
+
+        if self.samples >= self.number_of_rc_pairs and active.any():
+            P, x, th = self.covariance[active], phi[active], self.theta[active]
+            Px = np.einsum("cij,cj->ci", P, x)
+            gain = Px / (self.forgetting_factor + np.einsum("ci,ci->c", x, Px))[:, None]
+            error = overpotential[active] - np.einsum("ci,ci->c", x, th)
+            self.theta[active] = th + gain * error[:, None]
+            self.covariance[active] = (P - gain[:, :, None] * Px[:, None, :]) / self.forgetting_factor
+            self.updates[active] += 1
+
+        valid = ~(np.isnan(current) | np.isnan(voltage))
+        self.past_overpotential[valid] = np.roll(self.past_overpotential[valid], 1, axis=1)
+        self.past_overpotential[valid, 0] = overpotential[valid]
+        self.past_current[valid] = np.roll(self.past_current[valid], 1, axis=1)
+        self.past_current[valid, 0] = current[valid]
+        self.soc[valid] -= current[valid] * self.dt / (3600 * self.cell_capacity)
+        self.samples += 1
+
+        new_bin = self.bin_of(self.soc)
+        moved = np.flatnonzero(new_bin != self.soc_bin)
+        emitted = []
+        if len(moved):
+            # one conversion of every cell, not one per moved cell
+            parameters = self.parameters()
+            emitted = [self.snapshot(cell, parameters) for cell in moved]
+        self.soc_bin[moved] = new_bin[moved]
+        return emitted
+
+    def process(self, current, voltage):
+        """
+        Process a chunk of samples.
+
+        :param current: (cells, samples) current, or (samples,) for a single cell
+        :param voltage: (cells, samples) voltage, or (samples,) for a single cell
+        :return: List of snapshots emitted during the chunk
+        """
+        current = np.asarray(current, dtype=float).reshape(self.n_cells, -1)
+        voltage = np.asarray(voltage, dtype=float).reshape(self.n_cells, -1)
+
+        emitted = []
+        for k in range(current.shape[1]):
+            emitted.extend(self.update(current[:, k], voltage[:, k]))
+        return emitted
+
+    def stream(self, chunks):
+        """
+        Consume an iterable of (current, voltage) chunks, e.g. a generator reading a live cycler feed.
+
+        :return: Generator of snapshots as they are emitted
+        """
+        for current, voltage in chunks:
+            yield from self.process(current, voltage)
+
+    def parameters(self):
+        """
+        Convert the ARX coefficients of every cell to circuit parameters.
+
+        :return: Dictionary with r0, r1, c1 (r2, c2) arrays of one value per cell. Cells whose coefficients do not
+                 correspond to a physical circuit yet (e.g. complex or unstable poles) get NaN
+        """
+        th = self.theta
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if self.number_of_rc_pairs == 1:
+                a1, b0, b1 = th[:, 0], th[:, 1], th[:, 2]
+                r1 = (b1 + a1 * b0) / (1 - a1)
+                values = {"r0": b0, "r1": r1, "c1": -self.dt / np.log(a1) / r1}
+                poles = a1[:, None]
+            else:
+                a1, a2, b0, b1, b2 = th.T
+                root = np.sqrt(a1 ** 2 + 4 * a2)
+                p1, p2 = (a1 - root) / 2, (a1 + root) / 2  # fast pole first
+                # b1 + R0 a1 = g1 + g2 and b2 - R0 p1 p2 = -(g1 p2 + g2 p1) with g = R (1 - p)
+                s1, s2 = b1 + b0 * a1, b2 + b0 * a2
+                g1 = -(s2 + p1 * s1) / (p2 - p1)
+                g2 = s1 - g1
+                r1, r2 = g1 / (1 - p1), g2 / (1 - p2)
+                values = {
+                    "r0": b0,
+                    "r1": r1,
+                    "c1": -self.dt / np.log(p1) / r1,
+                    "r2": r2,
+                    "c2": -self.dt / np.log(p2) / r2,
+                }
+                poles = np.column_stack([p1, p2])
+
+        physical = np.all((poles > 0) & (poles < 1), axis=1) & np.all(np.column_stack(list(values.values())) > 0, axis=1)
+        return {name: np.where(physical, value, np.nan) for name, value in values.items()}
+
+    def snapshot(self, cell, parameters=None):
+        """
+        Record the current estimate of a cell under its current SoC bin.
+
+        :param cell: Index of the cell
+        :param parameters: Output of parameters() for the current step, computed when not given
+        :return: The snapshot dictionary
+        """
+        if parameters is None:
+            parameters = self.parameters()
+        soc_bin = int(self.soc_bin[cell])
+        entry = {
+            "cell": int(cell),
+            "battery_label": self.battery_labels[cell],
+            "soc_bin": soc_bin,
+            "SoC": (soc_bin + 0.5) * self.soc_bin_width,
+            "sample": self.samples,
+            "updates": int(self.updates[cell]),
+            **{name: float(value[cell]) for name, value in parameters.items()},
+        }
+        self.snapshots[(int(cell), soc_bin)] = entry
+        return entry
+
+    def flush(self):
+        """
+        Snapshot every cell in its current SoC bin, e.g. at the end of a feed.
+        """
+        parameters = self.parameters()
+        return [self.snapshot(cell, parameters) for cell in range(self.n_cells)]
+
+    def snapshot_table(self):
+        """
+        :return: DataFrame of the latest snapshot of every cell and SoC bin, sorted by cell and SoC
+        """
+        table = pd.DataFrame(list(self.snapshots.values()))
+        if table.empty:
+            return table
+        return table.sort_values(by=["cell", "SoC"]).reset_index(drop=True)
@@ -0,0 +1,446 @@
+import os
+import glob
+import json
+import hashlib
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from App.utils.data_loader import data_input_dir, soc_ocv_file, hppc_pulse_file, hppc_pulse_numbers
+from App.utils.metrics import metrics
+from App.utils.results_store import results_path
+from App.utils.solver_calibration import resolve_solver_config
+
+# Same settings Main.py uses for the full 2RC parameterization, with the pulses resampled before fitting. The solver
+# is the calibrated one (CalibrateSolvers.py), CasADi "fast" mode until a calibration exists.
+DEFAULT_ECM_CONFIG = {
+    "pulses": {"resample": True},
+    "solver": {"mode": "auto", "dt_max": 10},
+    "number_of_rc_pairs": 2,
+    "initial_parameters": {
+        "R0_Ohm": 1e-3,
+        "R1_Ohm": 2e-4,
+        "C1_F": 1e4,
+        "R2_Ohm": 2e-4,
+        "C2_F": 2e4,
+    },
+    "problem": {
+        "r_guess": 0.005,
+        "r0_bounds": [0, 0.5],
+        "r1_bounds": [0, 0.5],
+        "c1_bounds": [50, 1000],
+        "r2_bounds": [0, 0.5],
+        "c2_bounds": [100, 10000],
+        "c1_Gaussian": [1000, 100],
+        "c2_Gaussian": [10000, 500],
+    },
+    "optimizer": {"sigma0": [1e-3, 2e-4, 2e-4, 100, 500]},
+}
+
+# Fits all pulses of a cycle at once with SoC-smooth parameters (see ECMJointParameterizer).
+JOINT_ECM_CONFIG = {
+    "method": "joint",
+    "pulses": {"resample": True},
+    "number_of_rc_pairs": 2,
+    "degree": 2,
+    "max_nfev": 200,
+}
+
+
+class Stage:
+    def __init__(self, name, func, inputs=None, outputs=None, depends_on=None, params=None):
+        """
+        A single step of the pipeline.
+
+        :param name: Unique name of the stage
+        :param func: Module-level callable run as func(**params) (must be picklable for the process executor)
+        :param inputs: Files or directories the stage reads
+        :param outputs: Files or directories the stage writes, or glob patterns of which at least one file must exist
+        :param depends_on: Names of the stages that must run first
+        :param params: Keyword arguments for func, these are part of the stage fingerprint
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs or [])
+        self.outputs = list(outputs or [])
+        self.depends_on = list(depends_on or [])
+        self.params = dict(params or {})
+
+
+class Pipeline:
+    def __init__(self, manifest_path, trace_dir=None):
+        """
+        Initialize the Pipeline class.
+
+        Stages are fingerprinted from the contents of their inputs and their parameters. A stage is only
+        re-executed when its fingerprint differs from the one recorded in the manifest on its last
+        successful run, or when one of its outputs is missing.
+
+        :param manifest_path: JSON file used to remember fingerprints between runs
+        :param trace_dir: Optional directory for the metrics traces of each run
+        """
+        self.manifest_path = manifest_path
+        self.trace_dir = trace_dir
+        self.stages = {}
+        self.manifest = self.load_manifest()
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+        self.logger = logging.getLogger(__name__)
+
+    def add_stage(self, stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Stage '{stage.name}' is already defined.")
+        self.stages[stage.name] = stage
+        return stage
+
+    def load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        return {"stages": {}, "files": {}}
+
+    def save_manifest(self):
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # write to a temporary file first so an interrupted run never leaves a half written manifest
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def file_digest(self, path):
+        """
+        Hash the contents of a file. Digests are cached in the manifest against the file size and
+        modification time so large unchanged inputs (e.g. the .mat files) are not re-read every run.
+        """
+        stat = os.stat(path)
+        cached = self.manifest["files"].get(path)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+
+        self.manifest["files"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        return digest
+
+    def path_digest(self, path):
+        """
+        Hash a file, or every file below a directory. Missing paths hash to a fixed marker.
+        """
+        if os.path.isfile(path):
+            return self.file_digest(path)
+        if not os.path.isdir(path):
+            return "missing"
+
+        sha = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                sha.update(os.path.relpath(file_path, path).encode())
+                sha.update(self.file_digest(file_path).encode())
+        return sha.hexdigest()
+
+    def fingerprint(self, stage):
+        payload = {
+            "func": f"{stage.func.__module__}.{stage.func.__qualname__}",
+            "params": stage.params,
+            "inputs": {path: self.path_digest(path) for path in stage.inputs},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_up_to_date(self, stage, fingerprint):
+        if self.manifest["stages"].get(stage.name) != fingerprint:
+            return False
+        # glob returns a plain path only if it exists, and a pattern only if it matches something
+        return all(glob.glob(path) for path in stage.outputs)
+
+    def validate(self):
+        """
+        Check every dependency exists and the stages form a DAG.
+        """
+        for stage in self.stages.values():
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'.")
+
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle detected at stage '{name}'.")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.remove(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def run(self, max_workers=None, executor="process", force=()):
+        """
+        Run the pipeline, executing independent stages in parallel.
+
+        :param max_workers: Maximum number of stages running at once
+        :param executor: 'process' for CPU bound stages (default) or 'thread'
+        :param force: Names of stages to re-run even if they are up to date
+        :return: Dictionary of stage name -> 'ran', 'cached', 'failed' or 'blocked'
+        """
+        self.validate()
+
+        if executor == "process":
+            pool = ProcessPoolExecutor(max_workers=max_workers)
+        elif executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=max_workers)
+        else:
+            raise ValueError(f"Unknown executor '{executor}'. Must be 'process' or 'thread'.")
+
+        status = {}
+        pending = list(self.stages)
+        running = {}
+
+        # Stages in worker processes record their metrics there, each one writes its own trace into the run directory
+        run_trace_dir = None
+        if self.trace_dir is not None:
+            run_trace_dir = os.path.join(self.trace_dir, time.strftime("%Y%m%d-%H%M%S"))
+
+        with pool:
+            while pending or running:
+                # Fingerprints are computed only once every upstream stage has finished so they see the new outputs
+                for name in [n for n in pending if all(d in status for d in self.stages[n].depends_on)]:
+                    pending.remove(name)
+                    stage = self.stages[name]
+
+                    if any(status[d] in ("failed", "blocked") for d in stage.depends_on):
+                        status[name] = "blocked"
+                        self.logger.warning(f"Stage '{name}' blocked by a failed upstream stage.")
+                        continue
+
+                    fingerprint = self.fingerprint(stage)
+                    if name not in force and self.is_up_to_date(stage, fingerprint):
+                        status[name] = "cached"
+                        self.logger.info(f"Stage '{name}' is up to date, skipping.")
+                        continue
+
+                    self.logger.info(f"Running stage '{name}'...")
+                    trace_file = None
+                    if run_trace_dir is not None and executor == "process":
+                        trace_file = os.path.join(run_trace_dir, f"{name.replace('/', '_')}.json")
+                    future = pool.submit(run_stage, stage.func, stage.params, trace_file)
+                    running[future] = (name, fingerprint, time.perf_counter(), time.time())
+
+                if not running:
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, fingerprint, started, wall_started = running.pop(future)
+                    metrics.record("pipeline_stage", time.perf_counter() - started, wall_started, {"pipeline_stage": name})
+                    try:
+                        future.result()
+                    except Exception as e:
+                        status[name] = "failed"
+                        self.manifest["stages"].pop(name, None)
+                        self.logger.error(f"Stage '{name}' failed: {e}")
+                    else:
+                        status[name] = "ran"
+                        self.manifest["stages"][name] = fingerprint
+                        self.logger.info(f"Stage '{name}' completed.")
+                    self.save_manifest()
+
+        self.save_manifest()
+        if run_trace_dir is not None:
+            metrics.export_trace(os.path.join(run_trace_dir, "pipeline.json"))
+        return status
+
+
+def run_stage(func, params, trace_file=None):
+    """
+    Run one stage, writing the metrics recorded by this process to trace_file when given.
+    """
+    if trace_file is not None:
+        metrics.reset()
+    try:
+        return func(**params)
+    finally:
+        if trace_file is not None:
+            metrics.export_trace(trace_file)
+
+
+def run_capacity_stage(battery_label, degree):
+    from App.Service.CapacityTest import CapacityTest
+
+    capacity_test = CapacityTest(battery_label=battery_label)
+    capacity_test.fit_soc_ocv_polynomial(degree=degree)
+    return capacity_test.save_to_csv()
+
+
+def run_hppc_stage(battery_label, cycles, window_size):
+    from App.Service.HPPCBatchExtractor import HPPCBatchExtractor
+
+    extractor = HPPCBatchExtractor(battery_label=battery_label, cycles=cycles)
+
+    # remove pulse files from a previous run so a change in the detected pulse count does not leave stale pulses behind
+    for cycle_number in cycles:
+        for stale in glob.glob(hppc_pulse_file(battery_label, cycle_number, "*")):
+            os.remove(stale)
+
+    extractor.extract(window_size=window_size)
+    extractor.save_to_csv()
+
+
+def run_ecm_stage(battery_label, cycle_number, config):
+    if config.get("method") == "joint":
+        return run_joint_ecm_stage(battery_label, cycle_number, config)
+
+    from App.Service.ECMTheveninParameterizer import ECMTheveninParameterizer
+
+    pulses = hppc_pulse_numbers(battery_label, cycle_number)
+    if not pulses:
+        raise ValueError(f"No pulse data found for {battery_label} cycle {cycle_number}.")
+
+    ecm_parameterizer = ECMTheveninParameterizer(battery_label=battery_label, cycle_number=cycle_number)
+    for pulse_number in pulses:
+        ecm_parameterizer.load_pulses(pulse_number, **config.get("pulses", {}))
+        fit_loaded_pulse(ecm_parameterizer, config)
+        ecm_parameterizer.export_results()
+    ecm_parameterizer.save_cycle_results()
+
+
+def fit_loaded_pulse(ecm_parameterizer, config):
+    ecm_parameterizer.setup_solver(**config["solver"])
+    ecm_parameterizer.setup_thevenin_model(number_of_rc_pairs=config["number_of_rc_pairs"])
+    ecm_parameterizer.update_parameters(**config["initial_parameters"])
+    ecm_parameterizer.setup_problem(**config["problem"])
+    ecm_parameterizer.optimize(**config["optimizer"])
+    if config.get("bootstrap"):
+        ecm_parameterizer.bootstrap(**config["bootstrap"])
+
+
+def fit_streamed_pulses(battery_label, cycle_number, chunks, config=None, window_size=1000, save_to_mongo=True):
+    """
+    Detect pulses in a chunked feed and fit each one as soon as its window closes.
+
+    :param battery_label: The battery label (e.g., 'G1')
+    :param cycle_number: Cycle the feed belongs to, used to name the results
+    :param chunks: Iterable of (current, voltage) chunks in the cycler's sign convention
+    :param config: ECM configuration, defaults to DEFAULT_ECM_CONFIG
+    :param window_size: Window size for each pulse
+    :param save_to_mongo: Also upsert the growing LUT into MongoDB after every pulse
+    :return: Generator of (pulse window, fit result) pairs
+    """
+    from App.Service.HPPCStreamDetector import HPPCStreamDetector
+    from App.Service.ECMTheveninParameterizer import ECMTheveninParameterizer
+
+    if config is None:
+        config = DEFAULT_ECM_CONFIG
+
+    detector = HPPCStreamDetector.from_battery_label(battery_label, window_size=window_size)
+    ecm_parameterizer = ECMTheveninParameterizer(battery_label=battery_label, cycle_number=cycle_number)
+    for pulse in detector.stream(chunks):
+        ecm_parameterizer.load_pulse_arrays(pulse["time"], pulse["current"], pulse["voltage"], pulse["soc"],
+                                            pulse_number=pulse["pulse_number"], **config.get("pulses", {}))
+        fit_loaded_pulse(ecm_parameterizer, config)
+        ecm_parameterizer.export_results(save_to_mongo=save_to_mongo)
+        yield pulse, ecm_parameterizer.results
+
+    if ecm_parameterizer.fit_records:
+        ecm_parameterizer.save_cycle_results()
+
+
+def run_joint_ecm_stage(battery_label, cycle_number, config):
+    from App.Service.ECMJointParameterizer import ECMJointParameterizer
+
+    joint_parameterizer = ECMJointParameterizer(battery_label=battery_label, cycle_number=cycle_number,
+                                                number_of_rc_pairs=config["number_of_rc_pairs"], degree=config["degree"])
+    joint_parameterizer.load_pulses(**config.get("pulses", {}))
+    joint_parameterizer.fit(max_nfev=config["max_nfev"])
+    joint_parameterizer.export_results()
+
+
+def hppc_output_dir(battery_label, cycle_number):
+    return os.path.dirname(hppc_pulse_file(battery_label, cycle_number, "*"))
+
+
+def ecm_lut_path(battery_label, cycle_number, method="pso"):
+    prefix = "joint_" if method == "joint" else ""
+    return os.path.join(
+        "Data", "Output", "LGM50", "Optimization_Results", battery_label, str(cycle_number),
+        f"{battery_label}_{cycle_number}_{prefix}ecm_lut_table.csv"
+    )
+
+
+def ecm_output_paths(battery_label, cycle_number, method="pso"):
+    if method == "joint":
+        return [ecm_lut_path(battery_label, cycle_number, method)]
+    return [ecm_lut_path(battery_label, cycle_number), results_path(battery_label, cycle_number)]
+
+
+def build_lgm50_pipeline(battery_label, cycles, degree=13, window_size=1000, ecm_config=None, manifest_path=None):
+    """
+    Build the capacity -> HPPC -> ECM pipeline for one battery label.
+
+    The pulses of all cycles are extracted by one HPPC stage, then every cycle gets its own ECM stage so the
+    fits are independent branches that can run in parallel.
+    The ECM stage depends on the SoC-OCV table, the pulse CSVs and the ECM configuration, so changing e.g. the
+    ECM bounds only refits the ECM stages.
+
+    :param battery_label: The battery label (e.g., 'G1')
+    :param cycles: Iterable of HPPC cycle numbers to process
+    :param degree: Degree of the SoC-OCV polynomial fit
+    :param window_size: Pulse window size for the HPPC extraction, or "auto" to size each window from the data
+    :param ecm_config: ECM configuration, defaults to DEFAULT_ECM_CONFIG (per-pulse PSO); pass JOINT_ECM_CONFIG
+        for the joint whole-cycle fit
+    :param manifest_path: Where to store the fingerprints, defaults to Data/Output/LGM50/Pipeline/{label}_manifest.json
+    :return: Pipeline ready to run, writing metrics traces to Data/Output/LGM50/Pipeline/Traces
+    """
+    if ecm_config is None:
+        ecm_config = DEFAULT_ECM_CONFIG
+    if manifest_path is None:
+        manifest_path = os.path.join("Data", "Output", "LGM50", "Pipeline", f"{battery_label}_manifest.json")
+
+    pipeline = Pipeline(manifest_path, trace_dir=os.path.join("Data", "Output", "LGM50", "Pipeline", "Traces"))
+
+    capacity_stage = pipeline.add_stage(Stage(
+        name=f"{battery_label}/capacity",
+        func=run_capacity_stage,
+        inputs=[os.path.join(data_input_dir, "capacity_test.mat")],
+        outputs=[soc_ocv_file(battery_label)],
+        params={"battery_label": battery_label, "degree": degree},
+    ))
+
+    # one stage extracts the pulses of every cycle from a single load of the HPPC data
+    cycles = list(cycles)
+    hppc_stage = pipeline.add_stage(Stage(
+        name=f"{battery_label}/hppc",
+        func=run_hppc_stage,
+        inputs=[os.path.join(data_input_dir, "HPPC_test.mat"), soc_ocv_file(battery_label)],
+        # at least one pulse per cycle, an empty cycle directory left by a failed run is not an output
+        outputs=[hppc_pulse_file(battery_label, cycle_number, "*") for cycle_number in cycles],
+        depends_on=[capacity_stage.name],
+        params={"battery_label": battery_label, "cycles": cycles, "window_size": window_size},
+    ))
+
+    # a mode="auto" solver is resolved now, so the fingerprint holds the solver the stages run with and only a
+    # calibration that changes this configuration's choice refits its cycles
+    ecm_config = resolve_solver_config(ecm_config)
+
+    for cycle_number in cycles:
+        pipeline.add_stage(Stage(
+            name=f"{battery_label}/ecm/{cycle_number}",
+            func=run_ecm_stage,
+            inputs=[soc_ocv_file(battery_label), hppc_output_dir(battery_label, cycle_number)],
+            outputs=ecm_output_paths(battery_label, cycle_number, ecm_config.get("method", "pso")),
+            depends_on=[hppc_stage.name],
+            params={"battery_label": battery_label, "cycle_number": cycle_number, "config": ecm_config},
+        ))
+
+    return pipeline
@@ -0,0 +1,138 @@
+"""
+bootstrap.py
+residual-bootstrap confidence intervals for fitted Thevenin parameters.
+
+The residuals of the point estimate are resampled in blocks (they are correlated in time), added back onto
+the fitted voltage and the parameters are refitted to every resampled curve. The refits use the batched
+NumPy forward model in App.utils.thevenin instead of pybamm and start from the point estimate, so each one
+converges in a few Gauss-Newton steps. They are spread over worker processes.
+"""
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from App.utils.thevenin import simulate_thevenin
+
+
+def split_parameters(x, number_of_rc_pairs):
+    """
+    Split (batch, parameters) vectors in the order of ECMTheveninParameterizer.setup_problem(),
+    [R0, R1, C1] or [R0, R1, R2, C1, C2], into the arguments of simulate_thevenin().
+    """
+    x = np.atleast_2d(x)
+    n = number_of_rc_pairs
+    return x[:, 0], [x[:, 1 + i] for i in range(n)], [x[:, 1 + n + i] for i in range(n)]
+
+
+class ForwardModel:
+    def __init__(self, time, current, soc0, number_of_rc_pairs, soc_values, ocv_values, capacity, offset=0.0):
+        """
+        Thevenin voltage for one pulse as a function of the parameter vector.
+
+        :param offset: Added to the simulated voltage. The OCV part of the voltage does not depend on the fitted
+                       parameters, so an offset computed once at the point estimate makes this model reproduce a
+                       reference model that uses a different OCV curve
+        """
+        self.time = np.asarray(time, dtype=float)
+        self.current = np.asarray(current, dtype=float)
+        self.soc0 = soc0
+        self.number_of_rc_pairs = number_of_rc_pairs
+        self.soc_values = soc_values
+        self.ocv_values = ocv_values
+        self.capacity = capacity
+        self.offset = offset
+
+    def __call__(self, x):
+        """
+        :param x: (batch, parameters) or (parameters,)
+        :return: (batch, samples) voltage
+        """
+        r0, resistances, capacitances = split_parameters(x, self.number_of_rc_pairs)
+        batch = len(r0)
+        return simulate_thevenin(self.time, np.broadcast_to(self.current, (batch, len(self.current))), np.full(batch, self.soc0),
+                                 r0, resistances, capacitances, self.soc_values, self.ocv_values, self.capacity) + self.offset
+
+
+def refit(model, target, x0, lower, upper, sqrt_weights, max_nfev=50):
+    """
+    Least-squares fit of the model to a target curve, with the forward difference Jacobian simulated as one batch.
+    """
+    from scipy.optimize import least_squares
+
+    def residuals(x):
+        return sqrt_weights * (model(x)[0] - target)
+
+    def jacobian(x):
+        step = 1e-6 * np.maximum(np.abs(x), 1e-6)
+        voltages = model(np.vstack([x, x + np.diag(step)]))
+        return (sqrt_weights * (voltages[1:] - voltages[0])).T / step
+
+    return least_squares(residuals, x0, jac=jacobian, bounds=(lower, upper), x_scale=np.abs(x0), max_nfev=max_nfev).x
+
+
+def block_resample(residuals, block_length, rng):
+    """
+    Moving block bootstrap of a residual series.
+    """
+    n = len(residuals)
+    block_length = min(block_length, n)
+    starts = rng.integers(0, n - block_length + 1, size=int(np.ceil(n / block_length)))
+    return np.concatenate([residuals[start:start + block_length] for start in starts])[:n]
+
+
+def refit_resamples(model, fitted, residuals, x_hat, lower, upper, sqrt_weights, block_length, seeds):
+    """
+    Refit a list of bootstrap resamples, one per seed. Runs inside the worker processes.
+
+    The raw residuals are resampled, they are measurement noise in V wherever they land. The weights only enter
+    the refit's cost, as they did in the original fit.
+
+    :return: (resamples, parameters) array
+    """
+    samples = []
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        target = fitted + block_resample(residuals, block_length, rng)
+        samples.append(refit(model, target, x_hat, lower, upper, sqrt_weights))
+    return np.array(samples)
+
+
+def bootstrap_intervals(model, measured, fitted, x_hat, bounds, weights=None, n_resamples=100, block_length=20,
+                        percentiles=(2.5, 97.5), workers=None, seed=None):
+    """
+    Residual-bootstrap percentile intervals of fitted parameters.
+
+    :param model: ForwardModel of the pulse
+    :param measured: Measured voltage
+    :param fitted: Voltage of the point estimate
+    :param x_hat: Point estimate
+    :param bounds: Dictionary with 'lower' and 'upper' bound lists
+    :param weights: Optional sample weights of the cost (e.g. from App.utils.resampling)
+    :param n_resamples: Number of bootstrap refits
+    :param block_length: Length of the resampled residual blocks, in samples of the (possibly resampled) pulse
+    :param percentiles: Percentiles to report
+    :param workers: Number of worker processes, defaults to one per CPU core. 1 runs in this process
+    :param seed: Seed of the resampling
+    :return: Tuple of the (len(percentiles), parameters) intervals and the (resamples, parameters) refits
+    """
+    lower = np.asarray(bounds["lower"], dtype=float)
+    upper = np.asarray(bounds["upper"], dtype=float)
+    # least_squares needs a start strictly inside the bounds
+    margin = 1e-9 * (upper - lower)
+    x_hat = np.clip(np.asarray(x_hat, dtype=float), lower + margin, upper - margin)
+
+    residuals = np.asarray(measured, dtype=float) - np.asarray(fitted, dtype=float)
+    sqrt_weights = np.ones_like(residuals) if weights is None else np.sqrt(np.asarray(weights, dtype=float))
+
+    seeds = np.random.SeedSequence(seed).spawn(n_resamples)
+    workers = min(workers or os.cpu_count() or 1, n_resamples)
+    chunks = [seeds[i::workers] for i in range(workers)]
+    args = (model, fitted, residuals, x_hat, lower, upper, sqrt_weights, block_length)
+
+    if workers == 1:
+        samples = refit_resamples(*args, seeds)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(refit_resamples, *args, chunk) for chunk in chunks]
+            samples = np.concatenate([future.result() for future in futures])
+
+    return np.percentile(samples, percentiles, axis=0), samples
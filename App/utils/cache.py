@@ -0,0 +1,59 @@
+"""
+cache.py
+small thread-safe LRU cache for serialised API payloads.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_entries=256):
+        """
+        :param max_entries: Entries kept before the least recently used one is evicted
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        """
+        Drop one entry.
+
+        :return: The dropped value, or None if the key was not cached
+        """
+        with self.lock:
+            return self.entries.pop(key, None)
+
+    def invalidate(self, predicate):
+        """
+        Drop every entry whose key matches the predicate.
+
+        :return: Number of dropped entries
+        """
+        with self.lock:
+            stale = [key for key in self.entries if predicate(key)]
+            for key in stale:
+                del self.entries[key]
+            return len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
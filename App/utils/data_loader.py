@@ -3,9 +3,10 @@ data_loader.py
 loads in battery data from ..//Data//Input//
 """
 import os
-import scipy.io as sio
+import glob
 import numpy as np
 import pandas as pd
+from App.utils.metrics import metrics
 
 # Path setup (hardcoded to LGM50 cuz its the only thing im using)
 battery_data = "LGM50"
@@ -24,11 +25,15 @@ def load_LGM50_data(test_data, battery_label):
     capacity_test_data = os.path.join(data_input_dir, "capacity_test.mat")
     hppc_test_data = os.path.join(data_input_dir, "HPPC_test.mat")
     
+    # scipy.io is only needed here, keep it off the import path of the package
+    import scipy.io as sio
+
     # load the hppc or capacity test matlab data
-    if test_data == "capacity_test":
-        mat = sio.loadmat(capacity_test_data)
-    elif test_data == "HPPC_test":
-        mat = sio.loadmat(hppc_test_data)
+    with metrics.timer("load_LGM50_data", test_data=test_data, battery_label=battery_label):
+        if test_data == "capacity_test":
+            mat = sio.loadmat(capacity_test_data)
+        elif test_data == "HPPC_test":
+            mat = sio.loadmat(hppc_test_data)
 
     # both tests share the same headers and we need to index into the battery labels.
     try:
@@ -44,11 +49,36 @@ def load_LGM50_data(test_data, battery_label):
 
     return vcell, current, cap
 
+def soc_ocv_file(battery_label):
+    return f"Data/Output/{battery_data}/Capacity_Test/{battery_label}/{battery_label}_soc_ocv.csv"
+
+def hppc_pulse_file(battery_label, cycle_number, pulse_number):
+    file_name = f"{battery_label}_cycle_{cycle_number}_pulse_{pulse_number}_hppc.csv"
+    return os.path.join("Data", "Output", battery_data, "HPPC_Test", battery_label, f"Cycle_{cycle_number}", file_name)
+
+def hppc_pulse_numbers(battery_label, cycle_number):
+    """
+    Pulses of a cycle with a pulse CSV written by HPPCTest/HPPCBatchExtractor.save_to_csv().
+    """
+    pattern = hppc_pulse_file(battery_label, cycle_number, "*")
+    return sorted(int(path.rsplit("_pulse_", 1)[1].split("_")[0]) for path in glob.glob(pattern))
+
 def load_soc_ocv_data(battery_label):
         """
         Load the SOC-OCV lookup table from CSV file generated from running the capacity test..
         """
-        file_path = f"Data/Output/{battery_data}/Capacity_Test/{battery_label}/{battery_label}_soc_ocv.csv"
+        file_path = soc_ocv_file(battery_label)
         soc_ocv_data = pd.read_csv(file_path)
         print(f"Loaded SOC-OCV data from {file_path}")
-        return soc_ocv_data
\ No newline at end of file
+        return soc_ocv_data
+
+def load_hppc_pulse_data(battery_label, cycle_number, pulse_number):
+    """
+    Load one pulse CSV written by HPPCTest.save_to_csv(), dropping duplicated time stamps.
+
+    :return: DataFrame with Time, Voltage, Current and SoC columns
+    """
+    file_path = hppc_pulse_file(battery_label, cycle_number, pulse_number)
+
+    df = pd.read_csv(file_path, index_col=None, na_values=["NA"])
+    return df.drop_duplicates(subset=["Time"], keep="first")
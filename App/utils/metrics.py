@@ -0,0 +1,167 @@
+"""
+metrics.py
+timers and counters for the pipeline stages.
+
+Every timed call is kept as an event for the per-run trace (Chrome trace event format, open it in
+chrome://tracing or Perfetto) and aggregated into count/sum/max per name and labels, which the API
+exposes in Prometheus text format. Recording is a perf_counter() call and a dict update under a lock,
+so it is left on by default. Set ECM_METRICS=0 to disable it.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+class Metrics:
+    def __init__(self, enabled=True, max_events=100000):
+        """
+        Initialize the Metrics class.
+
+        :param enabled: Record anything at all
+        :param max_events: Number of trace events kept, the oldest are dropped first in long running processes
+        """
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.events = deque(maxlen=max_events)
+        self.timers = {}
+        self.counters = {}
+        self.run_started = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Time a block of code. The yielded dictionary can be filled with extra values (e.g. iteration counts)
+        which are stored in the trace event.
+
+        :param name: Name of the timed stage
+        :param labels: Labels such as battery_label or cycle_number
+        """
+        extra = {}
+        if not self.enabled:
+            yield extra
+            return
+
+        wall_start = time.time()
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.record(name, time.perf_counter() - start, wall_start, labels, extra)
+
+    def record(self, name, duration, wall_start, labels, extra=None):
+        key = self._key(name, labels)
+        with self._lock:
+            count, total, longest = self.timers.get(key, (0, 0.0, 0.0))
+            self.timers[key] = (count + 1, total + duration, max(longest, duration))
+            self.events.append({
+                "name": name,
+                "ph": "X",
+                "ts": wall_start * 1e6,
+                "dur": duration * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {**labels, **(extra or {})},
+            })
+
+    def increment(self, name, value=1, **labels):
+        """
+        Add value to a counter.
+        """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.timers.clear()
+            self.counters.clear()
+            self.run_started = time.time()
+
+    def summary(self):
+        with self._lock:
+            timers = dict(self.timers)
+            counters = dict(self.counters)
+
+        return {
+            "timers": [
+                {"name": name, "labels": dict(labels), "count": count, "total_s": total, "max_s": longest}
+                for (name, labels), (count, total, longest) in timers.items()
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in counters.items()
+            ],
+        }
+
+    def export_trace(self, output_file):
+        """
+        Write the events and the aggregated summary of this run to a JSON file.
+
+        :param output_file: Path of the JSON trace
+        :return: Path of the written trace
+        """
+        with self._lock:
+            events = list(self.events)
+
+        directory = os.path.dirname(output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(output_file, "w") as f:
+            json.dump({
+                "run_started": self.run_started,
+                "traceEvents": events,
+                "displayTimeUnit": "ms",
+                **self.summary(),
+            }, f, indent=2, default=str)
+
+        print(f"Metrics trace saved to: {output_file}")
+        return output_file
+
+    def prometheus_text(self, prefix="ecm"):
+        """
+        Render the timers and counters in the Prometheus text exposition format.
+        """
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_stage_duration_seconds Time spent in each instrumented stage.",
+            f"# TYPE {prefix}_stage_duration_seconds summary",
+        ]
+        for timer in summary["timers"]:
+            # the series name must not be overridden by a user label of the same name
+            labels = _format_labels({**timer["labels"], "stage": timer["name"]})
+            lines.append(f"{prefix}_stage_duration_seconds_count{labels} {timer['count']}")
+            lines.append(f"{prefix}_stage_duration_seconds_sum{labels} {timer['total_s']}")
+
+        counters = {}
+        for counter in summary["counters"]:
+            counters.setdefault(f"{prefix}_{counter['name']}_total", []).append(counter)
+        for name, series in counters.items():
+            lines.append(f"# TYPE {name} counter")
+            for counter in series:
+                lines.append(f"{name}{_format_labels(counter['labels'])} {counter['value']}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+metrics = Metrics(enabled=os.environ.get("ECM_METRICS", "1") != "0")
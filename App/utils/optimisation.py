@@ -0,0 +1,193 @@
+"""
+optimisation.py
+ask/tell particle swarm runs with an explicit termination controller.
+
+pybop's PSO only stops on an iteration count or a run of unchanged iterations. Driving the underlying
+pints optimiser directly lets us stop on relative cost improvement, swarm spread, an evaluation budget
+or a wall-clock budget, and report which rule ended the run.
+"""
+import time
+import numpy as np
+
+
+class FitResult:
+    def __init__(self, x, final_cost, n_iterations, n_evaluations, stop_reason, time):
+        """
+        Outcome of a controlled optimisation run. Uses the same attribute names as pybop's result object
+        so callers can treat both alike.
+        """
+        self.x = np.asarray(x)
+        self.final_cost = final_cost
+        self.n_iterations = n_iterations
+        self.n_evaluations = n_evaluations
+        self.stop_reason = stop_reason
+        self.time = time
+
+    def __repr__(self):
+        return (f"FitResult(final_cost={self.final_cost:.6g}, n_iterations={self.n_iterations}, "
+                f"n_evaluations={self.n_evaluations}, stop_reason='{self.stop_reason}', time={self.time:.2f}s)")
+
+
+class TerminationController:
+    def __init__(self, max_iterations=100, max_evaluations=None, max_unchanged_iterations=30,
+                 relative_tolerance=1e-4, spread_tolerance=1e-3, time_budget=None, min_iterations=5):
+        """
+        Decide when a swarm run should stop.
+
+        :param max_iterations: Hard limit on iterations
+        :param max_evaluations: Hard limit on cost evaluations (None for no limit)
+        :param max_unchanged_iterations: Window over which the relative improvement is measured
+        :param relative_tolerance: Stop when the best cost improved by less than this fraction over the window
+        :param spread_tolerance: Stop when the swarm has collapsed to less than this fraction of the search range
+        :param time_budget: Wall-clock budget in seconds (None for no limit)
+        :param min_iterations: Iterations always run before the improvement and spread rules apply
+        """
+        self.max_iterations = max_iterations
+        self.max_evaluations = max_evaluations
+        self.max_unchanged_iterations = max_unchanged_iterations
+        self.relative_tolerance = relative_tolerance
+        self.spread_tolerance = spread_tolerance
+        self.time_budget = time_budget
+        self.min_iterations = min_iterations
+
+        self.deadline = None
+        self.scale = None
+        self.history = []
+
+    def copy(self, **overrides):
+        settings = {
+            "max_iterations": self.max_iterations,
+            "max_evaluations": self.max_evaluations,
+            "max_unchanged_iterations": self.max_unchanged_iterations,
+            "relative_tolerance": self.relative_tolerance,
+            "spread_tolerance": self.spread_tolerance,
+            "time_budget": self.remaining_time(),
+            "min_iterations": self.min_iterations,
+        }
+        settings.update(overrides)
+        return TerminationController(**settings)
+
+    def start(self, scale):
+        """
+        :param scale: Width of the search range of each parameter, used to normalise the swarm spread
+        """
+        self.scale = np.asarray(scale, dtype=float)
+        self.history = []
+        self.deadline = None if self.time_budget is None else time.monotonic() + self.time_budget
+
+    def remaining_time(self):
+        if self.deadline is None:
+            return self.time_budget
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def check(self, iteration, evaluations, best_cost, particles):
+        """
+        :return: The reason to stop, or None to continue
+        """
+        self.history.append(best_cost)
+
+        if iteration >= self.max_iterations:
+            return "max_iterations"
+        if self.max_evaluations is not None and evaluations >= self.max_evaluations:
+            return "max_evaluations"
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "time_budget"
+        if iteration < self.min_iterations:
+            return None
+
+        if len(self.history) > self.max_unchanged_iterations:
+            previous = self.history[-1 - self.max_unchanged_iterations]
+            improvement = (previous - best_cost) / max(abs(previous), np.finfo(float).tiny)
+            if improvement < self.relative_tolerance:
+                return "relative_improvement"
+
+        # a parameter with zero-width bounds cannot spread, leave its spread unscaled
+        scale = np.where(self.scale > 0, self.scale, 1.0)
+        spread = np.max(np.ptp(np.asarray(particles), axis=0) / scale)
+        if spread < self.spread_tolerance:
+            return "parameter_spread"
+
+        return None
+
+
+def local_bounds(x, sigma0, bounds, width=3.0):
+    """
+    Search box of width * sigma0 on either side of x, intersected with bounds. pints PSO draws its initial
+    particles uniformly over the boundaries, so this is what confines a refinement run to the region around x.
+
+    :return: Dictionary with 'lower' and 'upper' bound lists
+    """
+    lower = np.asarray(bounds["lower"], dtype=float)
+    upper = np.asarray(bounds["upper"], dtype=float)
+    x = np.asarray(x, dtype=float)
+    step = width * np.abs(np.asarray(sigma0, dtype=float))
+    local_lower = np.maximum(x - step, lower)
+    local_upper = np.minimum(x + step, upper)
+
+    # keep the full range where the box would collapse (zero step)
+    collapsed = local_upper <= local_lower
+    local_lower = np.where(collapsed, lower, local_lower)
+    local_upper = np.where(collapsed, upper, local_upper)
+    return {"lower": list(local_lower), "upper": list(local_upper)}
+
+
+def population_size(x0, sigma0, bounds):
+    """
+    Number of particles pints PSO uses for this problem, i.e. the cost evaluations of one iteration.
+    """
+    import pints
+
+    lower = np.asarray(bounds["lower"], dtype=float)
+    upper = np.asarray(bounds["upper"], dtype=float)
+    x0 = np.clip(np.asarray(x0, dtype=float), lower, upper)
+    return pints.PSO(x0, sigma0=sigma0, boundaries=pints.RectangularBoundaries(lower, upper)).population_size()
+
+
+def run_swarm(cost, x0, sigma0, bounds, controller, parallel=False):
+    """
+    Run a pints PSO with an ask/tell loop until the controller stops it.
+
+    The initial particles are drawn uniformly over bounds, x0 is one of them. An iteration that would take the
+    evaluations over the controller's max_evaluations is not started, except the first one.
+
+    :param cost: Callable returning the cost to minimise for a parameter vector
+    :param x0: Initial parameter vector
+    :param sigma0: Initial step size of each parameter
+    :param bounds: Dictionary with 'lower' and 'upper' bound lists
+    :param controller: TerminationController
+    :param parallel: False, True (one worker per core) or the number of worker processes
+    :return: FitResult
+    """
+    import pints
+
+    lower = np.asarray(bounds["lower"], dtype=float)
+    upper = np.asarray(bounds["upper"], dtype=float)
+    x0 = np.clip(np.asarray(x0, dtype=float), lower, upper)
+
+    optimiser = pints.PSO(x0, sigma0=sigma0, boundaries=pints.RectangularBoundaries(lower, upper))
+
+    if parallel:
+        n_workers = pints.ParallelEvaluator.cpu_count() if parallel is True else int(parallel)
+        evaluator = pints.ParallelEvaluator(cost, n_workers=min(n_workers, optimiser.population_size()))
+    else:
+        evaluator = pints.SequentialEvaluator(cost)
+
+    population = optimiser.population_size()
+    controller.start(upper - lower)
+    start = time.perf_counter()
+    iteration = evaluations = 0
+    while True:
+        if iteration > 0 and controller.max_evaluations is not None and evaluations + population > controller.max_evaluations:
+            stop_reason = "max_evaluations"
+            break
+
+        particles = optimiser.ask()
+        optimiser.tell(evaluator.evaluate(particles))
+        iteration += 1
+        evaluations += len(particles)
+
+        stop_reason = controller.check(iteration, evaluations, optimiser.f_best(), particles)
+        if stop_reason is not None:
+            break
+
+    return FitResult(optimiser.x_best(), optimiser.f_best(), iteration, evaluations, stop_reason, time.perf_counter() - start)
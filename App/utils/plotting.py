@@ -0,0 +1,150 @@
+"""
+plotting.py
+renders figures interactively, to files from a background process pool, or not at all.
+
+The mode is read from the PLOT_MODE environment variable ('interactive', 'file' or 'off') and can be
+changed with configure_plotting(). File mode writes to PLOT_DIR (default Data/Output/LGM50/Plots)
+in PLOT_FORMAT (default png) so batch runs never block on a window.
+matplotlib is only imported once something is actually drawn.
+"""
+import os
+import atexit
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+PLOT_MODES = ("interactive", "file", "off")
+
+
+def _check_mode(mode):
+    if mode not in PLOT_MODES:
+        raise ValueError(f"Unknown plot mode '{mode}'. Must be one of {PLOT_MODES}")
+    return mode
+
+
+_settings = {
+    "mode": _check_mode(os.environ.get("PLOT_MODE", "interactive")),
+    "output_dir": os.environ.get("PLOT_DIR", os.path.join("Data", "Output", "LGM50", "Plots")),
+    "file_format": os.environ.get("PLOT_FORMAT", "png"),
+    "max_workers": None,
+}
+_executor = None
+_pending = []
+
+
+def configure_plotting(mode="interactive", output_dir=None, file_format="png", max_workers=None):
+    """
+    Set how figures are rendered.
+
+    :param mode: 'interactive' shows figures with plt.show(), 'file' saves them in a background process pool, 'off' skips plotting
+    :param output_dir: Directory figures are written to in file mode
+    :param file_format: Image format for file mode (e.g. 'png', 'svg')
+    :param max_workers: Number of rendering processes for file mode
+    """
+    _settings["mode"] = _check_mode(mode)
+    _settings["file_format"] = file_format
+    _settings["max_workers"] = max_workers
+    if output_dir is not None:
+        _settings["output_dir"] = output_dir
+
+
+def get_plot_mode():
+    return _settings["mode"]
+
+
+def _init_worker():
+    # worker processes never have a display
+    import matplotlib
+
+    matplotlib.use("Agg", force=True)
+
+
+def _render_to_file(draw_func, full_path, data):
+    import matplotlib.pyplot as plt
+
+    fig = draw_func(**data)
+    fig.savefig(full_path, bbox_inches="tight")
+    plt.close(fig)
+    return full_path
+
+
+def render(draw_func, file_name, **data):
+    """
+    Render a figure according to the current plot mode.
+
+    :param draw_func: Module-level function building and returning a matplotlib figure from **data
+    :param file_name: Name of the figure file relative to the output directory, without extension
+    :param data: Arrays and labels passed to draw_func (pickled to the worker in file mode, so decimate first)
+    :return: The figure in interactive mode, the future of the saved path in file mode, None when off
+    """
+    global _executor
+    mode = _settings["mode"]
+
+    if mode == "off":
+        return None
+
+    if mode == "interactive":
+        import matplotlib.pyplot as plt
+
+        fig = draw_func(**data)
+        plt.show()
+        return fig
+
+    full_path = os.path.join(_settings["output_dir"], f"{file_name}.{_settings['file_format']}")
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=_settings["max_workers"], initializer=_init_worker)
+
+    future = _executor.submit(_render_to_file, draw_func, full_path, data)
+    _pending.append(future)
+    return future
+
+
+def wait_for_plots():
+    """
+    Block until every queued figure has been written, raising the first rendering error.
+
+    :return: List of written file paths
+    """
+    paths = [future.result() for future in _pending]
+    _pending.clear()
+    return paths
+
+
+def _shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+
+
+atexit.register(_shutdown)
+
+
+def decimate(x, y, max_points=2000):
+    """
+    Reduce a trace to about max_points samples for plotting, keeping the min and max of every bucket
+    so pulses and voltage drops stay visible.
+
+    :param x: x values of the trace
+    :param y: y values of the trace
+    :param max_points: Maximum number of points to keep, at least 2 (None keeps everything)
+    :return: Tuple of decimated (x, y)
+    """
+    if max_points is not None and max_points < 2:
+        raise ValueError(f"max_points must be at least 2, got {max_points}")
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(y)
+    if max_points is None or n <= max_points:
+        return x, y
+
+    bucket = int(np.ceil(n / (max_points // 2)))
+    n_buckets = n // bucket
+    body = y[:n_buckets * bucket].reshape(n_buckets, bucket)
+    offsets = np.arange(n_buckets) * bucket
+
+    keep = np.unique(np.concatenate([
+        offsets + body.argmin(axis=1),
+        offsets + body.argmax(axis=1),
+        np.arange(n_buckets * bucket, n),  # leftover samples of the last partial bucket
+    ]))
+    return x[keep], y[keep]
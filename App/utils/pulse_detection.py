@@ -0,0 +1,68 @@
+"""
+pulse_detection.py
+locates HPPC pulses and their rest segments in a current trace (discharge positive, 1 sample per second).
+"""
+import numpy as np
+
+
+def find_main_pulses(current, min_distance=1000, current_threshold=0.1):
+    """
+    Find the main pulse starts in the current data.
+
+    :param current: Current data array
+    :param min_distance: Minimum distance between pulses
+    :param current_threshold: Current change treated as a step
+    :return: Array of pulse start indices
+    """
+    all_changes = np.where(np.abs(np.diff(current)) > current_threshold)[0]
+
+    main_pulses = []
+    last_pulse = -min_distance  # Initialize with negative distance
+
+    for idx in all_changes:
+        if idx - last_pulse >= min_distance:
+            main_pulses.append(idx)
+            last_pulse = idx
+    return np.array(main_pulses)
+
+
+def find_rest_segments(current, rest_threshold=0.1, min_length=1):
+    """
+    Find the segments where the cell is at rest.
+
+    :param current: Current data array
+    :param rest_threshold: Largest absolute current still counted as rest
+    :param min_length: Shortest segment to return, in samples
+    :return: (segments, 2) array of [start, end) indices
+    """
+    rest = np.concatenate([[False], np.abs(current) <= rest_threshold, [False]])
+    edges = np.flatnonzero(np.diff(rest.astype(np.int8)))
+    segments = edges.reshape(-1, 2)
+    return segments[segments[:, 1] - segments[:, 0] >= min_length]
+
+
+def pulse_window_size(current, start_idx, end_limit=None, rest_threshold=0.1, min_rest=300, max_window=None):
+    """
+    Size a pulse window from the data instead of using a fixed length.
+
+    The window covers the pulse sequence starting at start_idx up to the first rest segment of at least
+    min_rest samples, and then that whole rest segment, so it ends just before the current is applied again.
+
+    :param current: Current data array
+    :param start_idx: Start index of the pulse
+    :param end_limit: Index the window may not pass, e.g. the start of the next pulse
+    :param rest_threshold: Largest absolute current still counted as rest
+    :param min_rest: Shortest rest segment, in samples, that ends the pulse sequence
+    :param max_window: Optional upper limit on the window size
+    :return: Window size in samples
+    """
+    end_limit = len(current) if end_limit is None else min(end_limit, len(current))
+    segments = find_rest_segments(current[start_idx:end_limit], rest_threshold, min_rest)
+
+    # skip a rest the window starts in, the pulse has to come first
+    segments = segments[segments[:, 0] > 0]
+    window_size = segments[0, 1] if len(segments) else end_limit - start_idx
+
+    if max_window is not None:
+        window_size = min(window_size, max_window)
+    return int(window_size)
@@ -0,0 +1,62 @@
+"""
+resampling.py
+adaptive non-uniform resampling of pulse data before fitting.
+
+The voltage changes fastest right after a current step and relaxes slowly afterwards, so a uniform 1 Hz
+window spends most of its samples on a flat tail. The samples right after every step are kept and the rest
+of each constant-current segment is thinned logarithmically. Each kept sample carries a weight equal to the
+number of original samples it stands for, so a weighted sum of squared errors over the resampled data
+approximates the unweighted sum over the full window.
+"""
+import numpy as np
+
+
+def adaptive_sample_indices(current, step_threshold=0.1, dense_samples=10, points_per_decade=10):
+    """
+    Indices of the samples to keep.
+
+    :param current: Current data array
+    :param step_threshold: Current change treated as a step
+    :param dense_samples: Samples kept unthinned after every step
+    :param points_per_decade: Samples kept per decade of time since the step after the dense part
+    :return: Sorted array of indices, always including both samples around each step and the last sample
+    """
+    n = len(current)
+    steps = np.flatnonzero(np.abs(np.diff(current)) > step_threshold) + 1
+    boundaries = np.unique(np.concatenate([[0], steps, [n]]))
+
+    keep = []
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        length = end - start
+        offsets = np.arange(min(dense_samples, length))
+        if length > dense_samples:
+            count = int(np.ceil(np.log10(length / dense_samples) * points_per_decade)) + 1
+            offsets = np.concatenate([offsets, np.geomspace(dense_samples, length - 1, count).round().astype(int)])
+        keep.append(start + offsets)
+        keep.append([end - 1])  # last sample before the next step
+    return np.unique(np.concatenate(keep))
+
+
+def sample_weights(indices, n):
+    """
+    Number of original samples each kept sample stands for, split at the midpoints between kept samples.
+
+    :param indices: Sorted indices of the kept samples
+    :param n: Number of original samples
+    :return: Weights summing to n
+    """
+    indices = np.asarray(indices, dtype=float)
+    edges = np.concatenate([[0], (indices[1:] + indices[:-1]) / 2 + 0.5, [n]])
+    return np.diff(edges)
+
+
+def resample_pulse(df, step_threshold=0.1, dense_samples=10, points_per_decade=10):
+    """
+    Resample an HPPC pulse DataFrame (Time, Voltage, Current, SoC).
+
+    :return: The kept rows with a Weight column added
+    """
+    indices = adaptive_sample_indices(df["Current"].to_numpy(), step_threshold, dense_samples, points_per_decade)
+    resampled = df.iloc[indices].reset_index(drop=True)
+    resampled["Weight"] = sample_weights(indices, len(df))
+    return resampled
@@ -0,0 +1,80 @@
+"""
+results_store.py
+one compressed NPZ file with every fit of a cycle.
+
+Replaces the per-pulse parameter JSON files: the fitted vectors, fit statistics, bootstrap intervals and the
+configuration the fits ran with are stored column by column, so scanning many cycles only reads a few small
+arrays per file. ECMTheveninParameterizer.load_parameter_set() rebuilds a pybop parameter set from it.
+"""
+import os
+import json
+import uuid
+import numpy as np
+import pandas as pd
+
+STATISTICS = ["final_cost", "n_iterations", "n_evaluations", "time"]
+
+
+def results_path(battery_label, cycle_number):
+    return os.path.join("Data", "Output", "LGM50", "Optimization_Results", battery_label, str(cycle_number),
+                        f"{battery_label}_{cycle_number}_ecm_results.npz")
+
+
+def save_cycle_results(path, battery_label, cycle_number, parameter_names, records, config):
+    """
+    Write the fits of a cycle.
+
+    :param path: Output .npz path
+    :param parameter_names: Names of the fitted parameters, in the order of each record's x
+    :param records: One dictionary per pulse with pulse_number, initial_soc, x, stop_reason, the STATISTICS
+                    and optionally intervals (column name -> value)
+    :param config: JSON-serialisable configuration of the fits
+    :return: path
+    """
+    interval_names = sorted({name for record in records for name in record.get("intervals", {})})
+
+    arrays = {
+        "battery_label": np.array(battery_label),
+        "cycle": np.array(cycle_number),
+        "parameter_names": np.array(parameter_names),
+        "pulse_number": np.array([record["pulse_number"] for record in records]),
+        "initial_soc": np.array([record["initial_soc"] for record in records], dtype=float),
+        "x": np.array([record["x"] for record in records], dtype=float).reshape(len(records), len(parameter_names)),
+        "stop_reason": np.array([str(record.get("stop_reason")) for record in records]),
+        "interval_names": np.array(interval_names, dtype=str),
+        "intervals": np.array([[record.get("intervals", {}).get(name, np.nan) for name in interval_names]
+                               for record in records], dtype=float).reshape(len(records), len(interval_names)),
+        "config": np.array(json.dumps(config, default=float)),
+    }
+    for name in STATISTICS:
+        arrays[name] = np.array([np.nan if record.get(name) is None else record[name] for record in records], dtype=float)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # write next to the target and rename so readers never see a half written file, the temporary name is unique so
+    # two workers writing the same results do not clobber each other's partial file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_cycle_results(path):
+    """
+    Read a cycle results file.
+
+    :return: Tuple of a DataFrame with one row per pulse (pulse_number, initial_soc, one column per parameter,
+             the fit statistics, stop_reason and interval columns) and the configuration dictionary
+    """
+    with np.load(path, allow_pickle=False) as data:
+        results = pd.DataFrame(data["x"], columns=list(data["parameter_names"]))
+        results.insert(0, "initial_soc", data["initial_soc"])
+        results.insert(0, "pulse_number", data["pulse_number"])
+        results.insert(0, "cycle", int(data["cycle"]))
+        results.insert(0, "battery_label", str(data["battery_label"]))
+        for name in STATISTICS:
+            results[name] = data[name]
+        results["stop_reason"] = data["stop_reason"]
+        for i, name in enumerate(data["interval_names"]):
+            results[name] = data["intervals"][:, i]
+        config = json.loads(str(data["config"]))
+    return results, config
@@ -0,0 +1,242 @@
+"""
+solver_calibration.py
+benchmarks pybamm solvers and tolerances on the Thevenin model and picks the fastest accurate one.
+
+Every candidate solves a few representative pulses at the initial guess and at random points inside the
+parameter bounds (the region the optimiser explores). Its voltages are compared with a tight-tolerance
+reference solve of the same points and its time per forward solve is recorded. The summary of all candidates
+is cached per model configuration and pybamm version, so setup_solver(mode="auto") can choose the fastest
+candidate within any accuracy budget without re-running the calibration.
+"""
+import os
+import json
+import time
+import uuid
+import statistics
+import numpy as np
+
+CALIBRATION_FILE = os.path.join("Data", "Output", "LGM50", "Solver_Calibration", "solver_choices.json")
+
+# voltage RMSE budget in V, well below the measurement noise of the cycler
+DEFAULT_MAX_RMSE = 1e-4
+
+# hand-picked settings used before the calibration existed, and whenever no calibration is cached
+FALLBACK_SOLVER = {"solver": "casadi", "mode": "fast", "dt_max": 10}
+
+REFERENCE_SOLVER = {"solver": "casadi", "mode": "safe", "dt_max": 1, "rtol": 1e-10, "atol": 1e-10}
+
+SOLVER_CANDIDATES = (
+    [{"solver": "casadi", "mode": mode, "dt_max": 10, "rtol": tol, "atol": tol}
+     for mode in ["fast", "safe"] for tol in [1e-3, 1e-4, 1e-6]]
+    + [{"solver": "idaklu", "rtol": tol, "atol": tol} for tol in [1e-3, 1e-4, 1e-6]]
+    + [{"solver": "scipy", "method": method, "rtol": tol, "atol": tol} for method in ["LSODA", "BDF"] for tol in [1e-4, 1e-6]]
+)
+
+
+def build_solver(solver="casadi", mode="safe", dt_max=None, **options):
+    """
+    Create a pybamm solver. mode and dt_max only apply to the CasADi solver.
+
+    :param solver: casadi, idaklu or scipy
+    :param options: Further solver arguments, e.g. rtol, atol or the scipy method
+    """
+    import pybamm
+
+    if solver == "casadi":
+        return pybamm.CasadiSolver(mode=mode, dt_max=dt_max, **options)
+    if solver == "idaklu":
+        return pybamm.IDAKLUSolver(**options)
+    if solver == "scipy":
+        return pybamm.ScipySolver(**options)
+    raise ValueError(f"Unknown solver '{solver}'. Must be 'casadi', 'idaklu' or 'scipy'.")
+
+
+def calibration_key(parameter_set_name, number_of_rc_pairs):
+    import pybamm
+
+    return f"{parameter_set_name}/{number_of_rc_pairs}rc/pybamm-{pybamm.__version__}"
+
+
+def candidate_name(options):
+    return json.dumps(options, sort_keys=True)
+
+
+# path -> (size, mtime_ns, parsed calibrations), setup_thevenin_model() looks the solver up for every pulse
+_loaded = {}
+
+
+def read_calibrations(path=CALIBRATION_FILE):
+    """
+    :return: Dictionary of every cached calibration in the file, empty when it does not exist. The parsed file
+             is kept until its size or modification time changes
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return {}
+    cached = _loaded.get(path)
+    if cached is None or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+        with open(path) as f:
+            cached = (stat.st_size, stat.st_mtime_ns, json.load(f))
+        _loaded[path] = cached
+    return cached[2]
+
+
+def load_calibration(key, path=CALIBRATION_FILE):
+    """
+    :return: Cached calibration entry of a model configuration, or None
+    """
+    return read_calibrations(path).get(key)
+
+
+def save_calibration(key, entry, path=CALIBRATION_FILE):
+    calibrations = {**read_calibrations(path), key: entry}
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # unique temporary name so two calibrations finishing together do not write into the same file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(calibrations, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def calibrated_solver(parameter_set_name, number_of_rc_pairs, max_rmse=DEFAULT_MAX_RMSE, dt_max=5, path=CALIBRATION_FILE):
+    """
+    Solver options mode="auto" resolves to on this machine.
+
+    :param dt_max: dt_max of the fallback when no cached candidate is within max_rmse
+    :return: Tuple of the options for build_solver() and whether they come from a calibration
+    """
+    calibration = None
+    # without a calibration file there is nothing to look up, and no need to import pybamm for the key
+    if os.path.exists(path):
+        calibration = load_calibration(calibration_key(parameter_set_name, number_of_rc_pairs), path)
+    options = None if calibration is None else select_solver(calibration["candidates"], max_rmse)
+    if options is None:
+        return {**FALLBACK_SOLVER, "dt_max": dt_max}, False
+    return options, True
+
+
+def resolve_solver_config(config, parameter_set_name="ECM_Example"):
+    """
+    ECM configuration with a mode="auto" solver replaced by the options it resolves to, e.g. to fix the solver
+    before the configuration is handed to other machines with their own calibration files.
+    """
+    solver = config.get("solver", {})
+    if solver.get("mode") != "auto":
+        return config
+    options, _ = calibrated_solver(parameter_set_name, config["number_of_rc_pairs"],
+                                   solver.get("max_rmse", DEFAULT_MAX_RMSE), solver.get("dt_max", 5))
+    return {**config, "solver": options}
+
+
+def select_solver(candidates, max_rmse=DEFAULT_MAX_RMSE):
+    """
+    Fastest candidate whose worst voltage RMSE is within the budget.
+
+    :param candidates: Summaries as returned by summarise_calibration()
+    :return: Solver options for build_solver(), or None if no candidate is accurate enough
+    """
+    accurate = [candidate for candidate in candidates
+                if candidate["error"] is None and candidate["rmse"] <= max_rmse]
+    if not accurate:
+        return None
+    return min(accurate, key=lambda candidate: candidate["median_s"])["options"]
+
+
+def evaluate_voltages(problem, points, repeat):
+    """
+    Solve the problem at every point.
+
+    :return: Tuple of (voltages per point, seconds of the first solve, seconds of every later solve)
+    """
+    voltages, timings, first_s = [], [], None
+    for point in points:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            voltage = np.asarray(problem.evaluate(point)["Voltage [V]"], dtype=float)
+            elapsed = time.perf_counter() - start
+            if first_s is None:
+                first_s = elapsed
+            else:
+                timings.append(elapsed)
+        voltages.append(voltage)
+    return voltages, first_s, timings
+
+
+def calibrate_solvers(ecm_parameterizer, pulse_numbers, config, candidates=None, reference=None, samples=3, repeat=3, seed=0):
+    """
+    Benchmark solver candidates on pulses of an ECMTheveninParameterizer.
+
+    :param ecm_parameterizer: ECMTheveninParameterizer of the battery label and cycle to calibrate on
+    :param pulse_numbers: Representative pulses, e.g. spread over the SoC range
+    :param config: ECM configuration (see Pipeline.DEFAULT_ECM_CONFIG), its solver settings are ignored
+    :param candidates: Solver options to benchmark, defaults to SOLVER_CANDIDATES
+    :param reference: Solver options of the reference solution, defaults to REFERENCE_SOLVER
+    :param samples: Random parameter points per pulse in addition to the initial guess
+    :param repeat: Solves per point
+    :param seed: Seed of the parameter points
+    :return: One row per pulse and candidate with rmse and max_error in V, first_s, median_s and error
+    """
+    candidates = SOLVER_CANDIDATES if candidates is None else candidates
+    reference = REFERENCE_SOLVER if reference is None else reference
+    rng = np.random.default_rng(seed)
+
+    def setup(options):
+        ecm_parameterizer.setup_solver(**options)
+        ecm_parameterizer.setup_thevenin_model(number_of_rc_pairs=config["number_of_rc_pairs"])
+        ecm_parameterizer.update_parameters(**config["initial_parameters"])
+        ecm_parameterizer.setup_problem(**config["problem"])
+        return ecm_parameterizer.problem
+
+    rows = []
+    for pulse_number in pulse_numbers:
+        ecm_parameterizer.load_pulses(pulse_number, **config.get("pulses", {}))
+
+        problem = setup(reference)
+        bounds = ecm_parameterizer.parameters.get_bounds()
+        points = [np.asarray(ecm_parameterizer.parameters.initial_value(), dtype=float)]
+        points += list(rng.uniform(bounds["lower"], bounds["upper"], size=(samples, len(bounds["lower"]))))
+        reference_voltages, _, _ = evaluate_voltages(problem, points, repeat=1)
+
+        for options in candidates:
+            row = {"pulse_number": pulse_number, "candidate": candidate_name(options), "rmse": np.nan,
+                   "max_error": np.nan, "first_s": np.nan, "median_s": np.nan, "error": None}
+            try:
+                voltages, row["first_s"], timings = evaluate_voltages(setup(options), points, repeat)
+                errors = []
+                for voltage, expected in zip(voltages, reference_voltages):
+                    if voltage.shape != expected.shape or not np.all(np.isfinite(voltage)):
+                        raise ValueError("incomplete or non-finite solution")
+                    errors.append(voltage - expected)
+                row["rmse"] = max(float(np.sqrt(np.mean(error ** 2))) for error in errors)
+                row["max_error"] = max(float(np.max(np.abs(error))) for error in errors)
+                row["median_s"] = statistics.median(timings) if timings else row["first_s"]
+            except Exception as e:
+                row["error"] = f"{type(e).__name__}: {e}"
+            rows.append(row)
+    return rows
+
+
+def summarise_calibration(rows, candidates=None):
+    """
+    Worst case over the pulses of every candidate: highest RMSE and error, median solve time over the pulses.
+
+    :return: List of dictionaries with options, rmse, max_error, first_s, median_s and error
+    """
+    candidates = SOLVER_CANDIDATES if candidates is None else candidates
+    summaries = []
+    for options in candidates:
+        name = candidate_name(options)
+        candidate_rows = [row for row in rows if row["candidate"] == name]
+        errors = [row["error"] for row in candidate_rows if row["error"] is not None]
+        summaries.append({
+            "options": options,
+            "rmse": None if errors else max(row["rmse"] for row in candidate_rows),
+            "max_error": None if errors else max(row["max_error"] for row in candidate_rows),
+            "first_s": None if errors else statistics.median(row["first_s"] for row in candidate_rows),
+            "median_s": None if errors else statistics.median(row["median_s"] for row in candidate_rows),
+            "error": errors[0] if errors else None,
+        })
+    return summaries
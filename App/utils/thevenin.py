@@ -0,0 +1,67 @@
+"""
+thevenin.py
+batched NumPy forward model of the Thevenin equivalent circuit.
+
+Simulates many pulses at once, which is far cheaper than a pybamm solve when the same circuit has to be
+evaluated thousands of times (joint fits, bootstrap refits). The RC branches are discretised exactly for a
+current held constant over each sample interval:
+
+    V_i[k] = a_i[k] * V_i[k-1] + R_i * (1 - a_i[k]) * I[k-1],   a_i[k] = exp(-dt[k] / (R_i * C_i))
+    V[k]   = OCV(SoC[k]) - R0 * I[k] - sum_i V_i[k]
+
+with the current discharge-positive and the SoC coulomb counted from the initial SoC.
+"""
+import numpy as np
+
+
+def coulomb_count(time, current, soc0, capacity):
+    """
+    SoC trajectory of each pulse.
+
+    :param time: (batch, samples) time in seconds
+    :param current: (batch, samples) current in A, discharge positive
+    :param soc0: (batch,) initial SoC (0-1)
+    :param capacity: Cell capacity in A.h
+    :return: (batch, samples) SoC
+    """
+    dt = np.diff(time, axis=-1)
+    charge = np.cumsum(current[..., :-1] * dt, axis=-1) / (3600 * capacity)
+    return np.asarray(soc0, dtype=float)[..., None] - np.concatenate([np.zeros_like(charge[..., :1]), charge], axis=-1)
+
+
+def simulate_thevenin(time, current, soc0, r0, resistances, capacitances, soc_values, ocv_values, capacity=4.85):
+    """
+    Terminal voltage of a batch of pulses.
+
+    :param time: (batch, samples) or (samples,) time in seconds, may be non-uniform
+    :param current: (batch, samples) current in A, discharge positive
+    :param soc0: (batch,) initial SoC (0-1)
+    :param r0: (batch,) series resistance in Ohm
+    :param resistances: List with one (batch,) array of resistances per RC pair
+    :param capacitances: List with one (batch,) array of capacitances per RC pair
+    :param soc_values: SoC points of the OCV table, increasing
+    :param ocv_values: OCV at soc_values
+    :param capacity: Cell capacity in A.h
+    :return: (batch, samples) voltage
+    """
+    current = np.atleast_2d(np.asarray(current, dtype=float))
+    time = np.broadcast_to(np.asarray(time, dtype=float), current.shape)
+
+    soc = coulomb_count(time, current, soc0, capacity)
+    voltage = np.interp(soc, soc_values, ocv_values) - np.asarray(r0, dtype=float)[..., None] * current
+
+    if resistances:
+        dt = np.diff(time, axis=-1)
+        r = np.stack([np.asarray(res, dtype=float) for res in resistances], axis=-1)  # (batch, pairs)
+        tau = r * np.stack([np.asarray(cap, dtype=float) for cap in capacitances], axis=-1)
+        decay = np.exp(-dt[..., None] / tau[..., None, :])  # (batch, samples - 1, pairs)
+        gain = r[..., None, :] * (1 - decay) * current[..., :-1, None]
+
+        state = np.zeros_like(r)
+        overpotential = np.zeros_like(current)
+        for k in range(1, current.shape[-1]):
+            state = decay[..., k - 1, :] * state + gain[..., k - 1, :]
+            overpotential[..., k] = state.sum(axis=-1)
+        voltage = voltage - overpotential
+
+    return voltage
@@ -0,0 +1,184 @@
+"""
+run_benchmarks.py
+times every pipeline stage on synthetic LGM50-shaped data and writes the results as JSON.
+
+The synthetic .mat files are generated in a temporary working directory (all paths in the package are
+relative to the working directory), so the benchmark never touches Data/ in the repository.
+Stages that need pybop are reported as skipped when it is not installed.
+
+usage: python Benchmarks/run_benchmarks.py [--cells 1] [--cycles 3] [--samples 15000] [--repeat 5] [--output bench.json]
+"""
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import contextlib
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from synthetic_data import generate_lgm50_data  # noqa: E402
+from App.utils.data_loader import load_LGM50_data, data_input_dir  # noqa: E402
+
+
+def time_call(func, repeat):
+    """
+    Run func repeat times with stdout silenced.
+
+    :return: Tuple of (timings in seconds, return value of the last call)
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def summarise(timings):
+    return {
+        "repeat": len(timings),
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.fmean(timings),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(battery_label, repeat, fit_iterations):
+    from App.Service.CapacityTest import CapacityTest
+    from App.Service.HPPCTest import HPPCTest
+    from App.Service.HPPCBatchExtractor import HPPCBatchExtractor
+    from App.Service.Pipeline import DEFAULT_ECM_CONFIG
+
+    results = {}
+
+    timings, _ = time_call(lambda: load_LGM50_data("capacity_test", battery_label), repeat)
+    results["load_capacity_data"] = summarise(timings)
+
+    timings, _ = time_call(lambda: load_LGM50_data("HPPC_test", battery_label), repeat)
+    results["load_hppc_data"] = summarise(timings)
+
+    def fit_soc_ocv():
+        capacity_test = CapacityTest(battery_label=battery_label)
+        capacity_test.fit_soc_ocv_polynomial(degree=13)
+        return capacity_test.save_to_csv()
+
+    timings, _ = time_call(fit_soc_ocv, repeat)
+    results["soc_ocv_fit"] = summarise(timings)
+
+    timings, hppc_test = time_call(lambda: HPPCTest(battery_label=battery_label, cycle_number=0), repeat)
+    results["hppc_init"] = summarise(timings)
+
+    timings, _ = time_call(lambda: hppc_test.find_main_pulses(hppc_test.current_cycle), repeat)
+    results["find_main_pulses"] = summarise(timings)
+
+    def extract_pulses():
+        for pulse in range(hppc_test.get_pulse_count()):
+            hppc_test.run_analysis(pulse_number=pulse)
+            hppc_test.save_to_csv()
+        return hppc_test.get_pulse_count()
+
+    timings, pulse_count = time_call(extract_pulses, repeat)
+    results["pulse_extraction"] = {**summarise(timings), "pulses": pulse_count}
+
+    def extract_all_pulses():
+        _, metadata = HPPCBatchExtractor(battery_label=battery_label).extract()
+        return len(metadata)
+
+    timings, pulse_count = time_call(extract_all_pulses, repeat)
+    results["batch_pulse_extraction"] = {**summarise(timings), "pulses": pulse_count}
+
+    try:
+        import pybop  # noqa: F401
+    except ImportError:
+        results["ecm_single_pulse_fit"] = {"skipped": "pybop is not installed"}
+        results["lut_export"] = {"skipped": "pybop is not installed"}
+        return results
+
+    from App.Service.ECMTheveninParameterizer import ECMTheveninParameterizer
+
+    config = DEFAULT_ECM_CONFIG
+    ecm_parameterizer = ECMTheveninParameterizer(battery_label=battery_label, cycle_number=0)
+
+    def fit_single_pulse():
+        ecm_parameterizer.load_pulses(0)
+        ecm_parameterizer.setup_solver(**config["solver"])
+        ecm_parameterizer.setup_thevenin_model(number_of_rc_pairs=config["number_of_rc_pairs"])
+        ecm_parameterizer.update_parameters(**config["initial_parameters"])
+        ecm_parameterizer.setup_problem(**config["problem"])
+        ecm_parameterizer.optimize(max_iterations=fit_iterations, **config["optimizer"])
+
+    # fits are slow, a single repetition is enough to spot regressions
+    timings, _ = time_call(fit_single_pulse, 1)
+    results["ecm_single_pulse_fit"] = {**summarise(timings), "max_iterations": fit_iterations}
+
+    timings, _ = time_call(lambda: ecm_parameterizer.export_results(save_to_mongo=False), repeat)
+    results["lut_export"] = summarise(timings)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic LGM50 data.")
+    parser.add_argument("--cells", type=int, default=1)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--samples", type=int, default=15000, help="Samples per HPPC cycle")
+    parser.add_argument("--pulses", type=int, default=10, help="Pulses per HPPC cycle")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fit-iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory")
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output)
+    work_dir = tempfile.mkdtemp(prefix="ecm_bench_")
+    cwd = os.getcwd()
+    os.environ["PLOT_MODE"] = "off"
+
+    try:
+        os.chdir(work_dir)
+        start = time.perf_counter()
+        labels = generate_lgm50_data(data_input_dir, cells=args.cells, cycles=args.cycles, samples=args.samples,
+                                     pulses=args.pulses, seed=args.seed)
+        generation_s = time.perf_counter() - start
+
+        results = run_benchmarks(labels[0], args.repeat, args.fit_iterations)
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {**vars(args), "data_generation_s": generation_s},
+        "results": results,
+    }
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for stage, entry in results.items():
+        if "skipped" in entry:
+            print(f"{stage:<24} skipped ({entry['skipped']})")
+        else:
+            print(f"{stage:<24} median {entry['median_s'] * 1000:10.2f} ms  (min {entry['min_s'] * 1000:.2f} ms, n={entry['repeat']})")
+    print(f"Results written to {output_path}")
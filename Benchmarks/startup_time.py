@@ -0,0 +1,88 @@
+"""
+startup_time.py
+measures the import cost of the package with `python -X importtime` and checks it against a budget.
+
+Each module is imported in a fresh interpreter. The script fails (exit code 1) when a module takes longer
+than the budget or pulls in one of the heavy dependencies that must only be imported on demand.
+
+usage: python Benchmarks/startup_time.py [--budget-ms 1500] [--output startup.json]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+MODULES = [
+    "App.utils.data_loader",
+    "App.utils.plotting",
+    "App.Service.Mongo",
+    "App.Service.CapacityTest",
+    "App.Service.HPPCTest",
+    "App.Service.ECMTheveninParameterizer",
+    "App.Service.Pipeline",
+]
+
+# Top level packages that must not be imported just by importing the package
+HEAVY_DEPENDENCIES = {"pybamm", "pybop", "casadi", "matplotlib", "pymongo", "fastapi", "pyarrow"}
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module):
+    """
+    Import a module in a fresh interpreter and parse the -X importtime report.
+
+    :param module: Dotted module name
+    :return: Dictionary with the cumulative import time in ms and the heavy packages that were imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    cumulative_us = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        # import time:   self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        imported.add(name.split(".")[0])
+        if name == module:
+            cumulative_us = int(cumulative)
+
+    return {
+        "module": module,
+        "cumulative_ms": cumulative_us / 1000 if cumulative_us is not None else None,
+        "heavy_imports": sorted(imported & HEAVY_DEPENDENCIES),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of the package modules.")
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Maximum cumulative import time per module")
+    parser.add_argument("--output", default=None, help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    results = [measure_import(module) for module in MODULES]
+
+    failed = False
+    for entry in results:
+        over_budget = entry["cumulative_ms"] is not None and entry["cumulative_ms"] > args.budget_ms
+        failed = failed or over_budget or bool(entry["heavy_imports"])
+        flags = []
+        if over_budget:
+            flags.append("OVER BUDGET")
+        if entry["heavy_imports"]:
+            flags.append(f"heavy imports: {', '.join(entry['heavy_imports'])}")
+        print(f"{entry['module']:<45} {entry['cumulative_ms'] or 0:>9.1f} ms  {' '.join(flags)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"budget_ms": args.budget_ms, "results": results}, f, indent=2)
+
+    sys.exit(1 if failed else 0)
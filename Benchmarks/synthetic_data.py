@@ -0,0 +1,119 @@
+"""
+synthetic_data.py
+generates LGM50-shaped capacity and HPPC test .mat files for benchmarking.
+
+The files use the same layout load_LGM50_data() expects: 'vcell', 'curr' and 'cap' are (cycles x cells)
+cell arrays of column vectors and 'col_cell_label' is a (1 x cells) cell array of labels. Voltages come
+from a 2RC Thevenin model with a smooth OCV curve plus measurement noise.
+"""
+import os
+import numpy as np
+import scipy.io as sio
+from scipy.signal import lfilter
+
+CELL_LABELS = ['G1', 'W3', 'W4', 'W5', 'W7', 'W8', 'W9', 'W10', 'V4', 'V5']
+
+CELL_CAPACITY = 4.85  # [A.h]
+TRUE_PARAMETERS = {"R0": 0.02, "R1": 0.01, "C1": 1000.0, "R2": 0.008, "C2": 25000.0}
+
+
+def synthetic_ocv(soc):
+    """
+    Smooth OCV curve spanning roughly 3.0V (empty) to 4.2V (full).
+    """
+    return 3.3 + 0.85 * soc - 0.25 * np.exp(-20 * soc) + 0.08 * np.exp(-10 * (1 - soc))
+
+
+def simulate_voltage(current, soc0, noise, rng, dt=1.0, parameters=TRUE_PARAMETERS):
+    """
+    Simulate the terminal voltage of a 2RC Thevenin cell for a discharge-positive current profile.
+    """
+    soc = soc0 - np.concatenate([[0.0], np.cumsum(current[:-1])]) * dt / (3600 * CELL_CAPACITY)
+
+    overpotential = current * parameters["R0"]
+    for r, c in ((parameters["R1"], parameters["C1"]), (parameters["R2"], parameters["C2"])):
+        a = np.exp(-dt / (r * c))
+        overpotential += lfilter([0.0, r * (1 - a)], [1.0, -a], current)
+
+    return synthetic_ocv(soc) - overpotential + rng.normal(0, noise, len(current)), soc
+
+
+def hppc_current_profile(samples, pulses, pulse_current=CELL_CAPACITY, rest_before=60, pulse_length=10, rest_after_pulse=40,
+                         depth=0.95):
+    """
+    Build one HPPC cycle: every block is a rest, a short 1C discharge pulse, a rest, a SoC discharge and a long
+    relaxation. Blocks must be longer than the 1000 sample min_distance of find_main_pulses.
+
+    :param depth: Fraction of the capacity the whole cycle discharges, pulses included. Below 1 so every pulse
+                  stays inside the OCV table instead of extrapolating it past 0% SoC
+    """
+    block = samples // pulses
+    # each block removes depth / pulses of the capacity, the pulse's share of it included
+    discharge_length = int(depth / pulses * 3600 * CELL_CAPACITY / pulse_current) - pulse_length
+    if discharge_length <= 0:
+        raise ValueError(f"{pulses} pulses of {pulse_length} s discharge more than {depth:.0%} of the capacity.")
+    if block < rest_before + pulse_length + rest_after_pulse + discharge_length + 1000:
+        raise ValueError(f"{samples} samples is too short for {pulses} pulses, need at least "
+                         f"{pulses * (rest_before + pulse_length + rest_after_pulse + discharge_length + 1000)}.")
+
+    current = np.zeros(samples)
+    for pulse in range(pulses):
+        start = pulse * block + rest_before
+        current[start:start + pulse_length] = pulse_current
+        start += pulse_length + rest_after_pulse
+        current[start:start + discharge_length] = pulse_current
+    return current
+
+
+def generate_lgm50_data(output_dir, cells=1, cycles=3, samples=15000, pulses=10, capacity_samples=5000, noise=1e-3, seed=0):
+    """
+    Write capacity_test.mat and HPPC_test.mat to output_dir.
+
+    :param output_dir: Directory to write the files to (normally Data/Input/LGM50)
+    :param cells: Number of cells, labelled in the order of CELL_LABELS
+    :param cycles: Number of cycles per cell
+    :param samples: Samples per HPPC cycle (1 Hz)
+    :param pulses: Pulses per HPPC cycle
+    :param capacity_samples: Samples per capacity test cycle
+    :param noise: Standard deviation of the voltage noise [V]
+    :param seed: Random seed
+    :return: List of the generated cell labels
+    """
+    if cells > len(CELL_LABELS):
+        raise ValueError(f"At most {len(CELL_LABELS)} cells are supported.")
+
+    rng = np.random.default_rng(seed)
+    labels = CELL_LABELS[:cells]
+    os.makedirs(output_dir, exist_ok=True)
+
+    col_cell_label = np.empty((1, cells), dtype=object)
+    col_cell_label[0, :] = labels
+
+    # Capacity test: slow C/20 discharge from full to empty
+    vcell, curr, cap = (np.empty((cycles, cells), dtype=object) for _ in range(3))
+    capacity_current = np.full(capacity_samples, CELL_CAPACITY / 20)
+    dt = 20 * 3600 / capacity_samples
+    for cycle in range(cycles):
+        for cell in range(cells):
+            voltage, soc = simulate_voltage(capacity_current, 1.0, noise, rng, dt=dt)
+            vcell[cycle, cell] = voltage.reshape(-1, 1)
+            curr[cycle, cell] = -capacity_current.reshape(-1, 1)
+            cap[cycle, cell] = ((1.0 - soc) * CELL_CAPACITY).reshape(-1, 1)
+
+    sio.savemat(os.path.join(output_dir, "capacity_test.mat"),
+                {"vcell": vcell, "curr": curr, "cap": cap, "col_cell_label": col_cell_label})
+
+    # HPPC test: current is stored charge-positive like the cycler data, HPPCTest flips the sign
+    vcell, curr, cap = (np.empty((cycles, cells), dtype=object) for _ in range(3))
+    hppc_current = hppc_current_profile(samples, pulses)
+    for cycle in range(cycles):
+        for cell in range(cells):
+            voltage, soc = simulate_voltage(hppc_current, 1.0, noise, rng)
+            vcell[cycle, cell] = voltage.reshape(-1, 1)
+            curr[cycle, cell] = -hppc_current.reshape(-1, 1)
+            cap[cycle, cell] = ((1.0 - soc) * CELL_CAPACITY).reshape(-1, 1)
+
+    sio.savemat(os.path.join(output_dir, "HPPC_test.mat"),
+                {"vcell": vcell, "curr": curr, "cap": cap, "col_cell_label": col_cell_label})
+
+    return labels
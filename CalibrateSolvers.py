@@ -0,0 +1,60 @@
+import json
+import argparse
+import pandas as pd
+from App.Service.ECMTheveninParameterizer import ECMTheveninParameterizer
+from App.Service.Pipeline import DEFAULT_ECM_CONFIG
+from App.utils.data_loader import hppc_pulse_numbers
+from App.utils.solver_calibration import (calibrate_solvers, summarise_calibration, select_solver, save_calibration,
+                                          calibration_key, candidate_name, CALIBRATION_FILE, DEFAULT_MAX_RMSE)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pybamm solvers and tolerances on representative pulses and cache "
+                                                 "the results for setup_solver(mode='auto').")
+    parser.add_argument("--battery-label", default="G1")
+    parser.add_argument("--cycle", type=int, default=1)
+    parser.add_argument("--pulses", type=int, nargs="*", default=None,
+                        help="Pulses to calibrate on, defaults to the first, middle and last pulse of the cycle")
+    parser.add_argument("--rc-pairs", type=int, choices=[1, 2], default=DEFAULT_ECM_CONFIG["number_of_rc_pairs"])
+    parser.add_argument("--samples", type=int, default=3, help="Random parameter points per pulse besides the initial guess")
+    parser.add_argument("--repeat", type=int, default=3, help="Solves per parameter point")
+    parser.add_argument("--max-rmse", type=float, default=DEFAULT_MAX_RMSE, help="Voltage RMSE budget in V for the reported choice")
+    parser.add_argument("--output", default=CALIBRATION_FILE, help="Calibration cache read by mode='auto'")
+    parser.add_argument("--report", default=None, help="Optional CSV with the measurements of every pulse and candidate")
+    args = parser.parse_args()
+
+    pulses = args.pulses
+    if not pulses:
+        available = hppc_pulse_numbers(args.battery_label, args.cycle)
+        if not available:
+            raise SystemExit(f"No pulse data found for {args.battery_label} cycle {args.cycle}, run the HPPC stage first.")
+        pulses = sorted({available[0], available[len(available) // 2], available[-1]})
+
+    config = {**DEFAULT_ECM_CONFIG, "number_of_rc_pairs": args.rc_pairs}
+
+    ecm_parameterizer = ECMTheveninParameterizer(battery_label=args.battery_label, cycle_number=args.cycle)
+    rows = calibrate_solvers(ecm_parameterizer, pulses, config, samples=args.samples, repeat=args.repeat)
+    candidates = summarise_calibration(rows)
+
+    if args.report:
+        pd.DataFrame(rows).to_csv(args.report, index=False)
+
+    key = calibration_key(ecm_parameterizer.parameter_set_name, args.rc_pairs)
+    save_calibration(key, {
+        "battery_label": args.battery_label,
+        "cycle": args.cycle,
+        "pulses": pulses,
+        "samples": args.samples,
+        "candidates": candidates,
+    }, args.output)
+
+    for candidate in sorted(candidates, key=lambda candidate: (candidate["error"] is not None, candidate["median_s"] or 0)):
+        name = candidate_name(candidate["options"])
+        if candidate["error"] is not None:
+            print(f"{name:<80} failed ({candidate['error']})")
+        else:
+            print(f"{name:<80} median {candidate['median_s'] * 1000:8.2f} ms  rmse {candidate['rmse'] * 1000:.4f} mV  "
+                  f"max {candidate['max_error'] * 1000:.4f} mV")
+
+    choice = select_solver(candidates, args.max_rmse)
+    print(f"Calibration for {key} saved to {args.output}")
+    print(f"Selected within {args.max_rmse} V: {json.dumps(choice) if choice else 'none, mode=auto falls back to CasADi fast mode'}")
@@ -1,12 +1,15 @@
-from fastapi import FastAPI, APIRouter
 from App.Service.CapacityTest import CapacityTest
 from App.Service.HPPCTest import HPPCTest
 from App.Service.ECMTheveninParameterizer import ECMTheveninParameterizer
+from App.utils.plotting import wait_for_plots
+from App.utils.metrics import metrics
 
 if __name__ == "__main__":
     # Choose Battery Label:
     battery_label = "G1"
     cycle_number = 1
+    # Plots are shown interactively by default. Set PLOT_MODE=file to write them to Data/Output/LGM50/Plots
+    # instead (e.g. in the container), or PLOT_MODE=off to skip plotting entirely.
 
     """
     Capacity Test:
@@ -35,7 +38,8 @@ if __name__ == "__main__":
     for pulse_number in range(pulse_count):
             print(f"Processing pulse {pulse_number}")
             ecm_parameterizer.load_pulses(pulse_number)
-            ecm_parameterizer.setup_solver(mode="fast", dt_max=10)
+            # fastest solver within 0.1 mV of a reference solve, see CalibrateSolvers.py (CasADi "fast" until calibrated)
+            ecm_parameterizer.setup_solver(mode="auto", dt_max=10)
             ecm_parameterizer.setup_thevenin_model(number_of_rc_pairs=2)
             ecm_parameterizer.update_parameters(
                 R0_Ohm=1e-3, 
@@ -57,3 +61,11 @@ if __name__ == "__main__":
             ecm_parameterizer.optimize(sigma0=[1e-3, 2e-4, 2e-4, 100, 500]) # R0, R1, R2, C1, C2
             ecm_parameterizer.plot_voltage_model_reference()
             ecm_parameterizer.export_results()
+    # Fitted parameters, fit statistics and configuration of every pulse in one file per cycle
+    ecm_parameterizer.save_cycle_results()
+
+    # Make sure every figure queued in file mode has been written before exiting
+    wait_for_plots()
+
+    # Per-run timings of every stage (open in chrome://tracing or Perfetto)
+    metrics.export_trace(f"Data/Output/LGM50/Traces/{battery_label}_cycle_{cycle_number}_trace.json")
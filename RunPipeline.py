@@ -0,0 +1,29 @@
+import argparse
+from App.Service.Pipeline import build_lgm50_pipeline, DEFAULT_ECM_CONFIG, JOINT_ECM_CONFIG
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the capacity -> HPPC -> ECM pipeline, skipping up to date stages.")
+    parser.add_argument("--battery-label", default="G1")
+    parser.add_argument("--cycles", type=int, nargs="+", default=[1])
+    parser.add_argument("--degree", type=int, default=13)
+    parser.add_argument("--window-size", type=lambda value: value if value == "auto" else int(value), default=1000,
+                        help="Pulse window size in samples, or 'auto' to end each window at the rest after the pulse")
+    parser.add_argument("--ecm-method", choices=["pso", "joint"], default="pso",
+                        help="Fit each pulse with PSO or all pulses of a cycle jointly with SoC-smooth parameters")
+    parser.add_argument("--bootstrap", type=int, default=0,
+                        help="Number of bootstrap refits per pulse for percentile intervals in the LUT (0 disables them)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--force", nargs="*", default=[], help="Stage names to re-run regardless of their fingerprint")
+    args = parser.parse_args()
+
+    ecm_config = JOINT_ECM_CONFIG if args.ecm_method == "joint" else DEFAULT_ECM_CONFIG
+    if args.bootstrap and args.ecm_method == "pso":
+        ecm_config = {**ecm_config, "bootstrap": {"n_resamples": args.bootstrap, "seed": 0}}
+
+    pipeline = build_lgm50_pipeline(battery_label=args.battery_label, cycles=args.cycles, degree=args.degree, window_size=args.window_size,
+                                    ecm_config=ecm_config)
+    status = pipeline.run(max_workers=args.workers, executor=args.executor, force=args.force)
+
+    for name, result in status.items():
+        print(f"{name}: {result}")
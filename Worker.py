@@ -0,0 +1,61 @@
+import os
+import argparse
+from App.Service.JobQueue import SQLiteJobQueue
+from App.Service.Pipeline import DEFAULT_ECM_CONFIG
+
+# Share the queue between machines by pointing ECM_QUEUE_PATH at the same database on a shared filesystem
+# (and passing --no-wal, see SQLiteJobQueue).
+DEFAULT_QUEUE_PATH = os.environ.get("ECM_QUEUE_PATH", os.path.join("Data", "Output", "LGM50", "Queue", "jobs.sqlite3"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distribute per-pulse ECM fits over any number of worker processes.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="Path of the SQLite job database")
+    parser.add_argument("--no-wal", action="store_true", help="Disable write-ahead logging, needed on network filesystems")
+    parser.add_argument("--lease-seconds", type=int, default=300)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Add one fit job per pulse of the given cycles")
+    enqueue.add_argument("--battery-label", default="G1")
+    enqueue.add_argument("--cycles", type=int, nargs="+", default=[1])
+    enqueue.add_argument("--pulses", type=int, nargs="*", default=None, help="Defaults to every extracted pulse")
+
+    work = commands.add_parser("work", help="Lease and run jobs")
+    work.add_argument("--max-jobs", type=int, default=None)
+    work.add_argument("--stop-when-empty", action="store_true")
+    work.add_argument("--heartbeat-interval", type=int, default=60)
+
+    commands.add_parser("status", help="Show the number of jobs per state and the errors of failed jobs")
+    commands.add_parser("retry", help="Queue failed jobs again")
+
+    collect = commands.add_parser("collect", help="Merge finished jobs into the cycle LUT and results files")
+    collect.add_argument("--battery-label", default="G1")
+    collect.add_argument("--cycles", type=int, nargs="+", default=[1])
+    collect.add_argument("--no-mongo", action="store_true")
+    collect.add_argument("--allow-partial", action="store_true", help="Merge the finished jobs even if others are not done")
+    args = parser.parse_args()
+
+    queue = SQLiteJobQueue(args.queue, visibility_timeout=args.lease_seconds, max_attempts=args.max_attempts, wal=not args.no_wal)
+
+    if args.command == "enqueue":
+        from App.Service.FitWorker import enqueue_fit_jobs
+        count = enqueue_fit_jobs(queue, args.battery_label, args.cycles, DEFAULT_ECM_CONFIG, pulses=args.pulses)
+        print(f"{count} jobs enqueued to {args.queue}")
+    elif args.command == "work":
+        from App.Service.FitWorker import FitWorker
+        worker = FitWorker(queue, lease_seconds=args.lease_seconds, heartbeat_interval=args.heartbeat_interval)
+        processed = worker.run(max_jobs=args.max_jobs, stop_when_empty=args.stop_when_empty)
+        print(f"{worker.worker_id} processed {processed} jobs")
+    elif args.command == "status":
+        for status, count in queue.counts().items():
+            print(f"{status}: {count}")
+        for job_key, _, error in queue.results("failed"):
+            print(f"{job_key}: {error}")
+    elif args.command == "retry":
+        print(f"{queue.requeue_failed()} jobs queued again")
+    elif args.command == "collect":
+        from App.Service.FitWorker import collect_fit_results
+        for cycle_number in args.cycles:
+            csv_filename, results_file = collect_fit_results(queue, args.battery_label, cycle_number,
+                                                             save_to_mongo=not args.no_mongo, allow_partial=args.allow_partial)
+            print(f"Cycle {cycle_number}: {csv_filename}, {results_file}")